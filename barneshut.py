@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Barnes-Hut approximation of the pairwise repulsion used for relaxation
+(requires numpy)
+
+Points are sorted along a Z-order (Morton) curve, so every quadtree node is a
+contiguous run of them. A node which is small compared to its distance from a
+point acts on it as a single mass at the node's center of mass; nearer nodes are
+opened up, down to a handful of points whose forces are summed exactly. `theta`
+is the size/distance ratio below which a node is treated as one mass: 0 sums
+every pair exactly, and larger values trade accuracy for speed.
+"""
+
+import numpy
+
+MAX_DEPTH = 16
+LEAF_SIZE = 8
+
+def inverseSquareRepulsion(dx, dy):
+  """Vectorized pipeline.inverseSquareRepulsion, given q - p for every pair"""
+  invDistanceSquared = (dx*dx + dy*dy)**2
+  return -dx * invDistanceSquared, -dy * invDistanceSquared
+
+class QuadTree (object):
+  def __init__(self, points, ((xmin, xmax), (ymin, ymax))=((0,1),(0,1))):
+    coords = numpy.array(points, dtype=float).reshape(-1, 2)
+    n = len(coords)
+    self.depth = depth = max(1, min(MAX_DEPTH, int(numpy.ceil(numpy.log2(max(n, 2)) / 2)) + 1))
+    self.size = max(xmax - xmin, ymax - ymin)
+
+    # Morton code of each point's cell on the finest level
+    scale = (1 << depth) / float(self.size)
+    cells = numpy.floor((coords - [xmin, ymin]) * scale).astype(numpy.int64)
+    cells = numpy.clip(cells, 0, (1 << depth) - 1)
+    codes = numpy.zeros(n, dtype=numpy.int64)
+    for bit in range(depth):
+      codes |= ((cells[:, 0] >> bit) & 1) << (2 * bit)
+      codes |= ((cells[:, 1] >> bit) & 1) << (2 * bit + 1)
+
+    self.order = numpy.argsort(codes, kind='mergesort')
+    self.codes = codes[self.order]
+    self.x = coords[self.order, 0]
+    self.y = coords[self.order, 1]
+    sumX = numpy.concatenate(([0.0], numpy.cumsum(self.x)))
+    sumY = numpy.concatenate(([0.0], numpy.cumsum(self.y)))
+
+    # For every level: each node's key, its run of points, and center of mass
+    self.levels = []
+    for level in range(depth + 1):
+      keys = self.codes >> (2 * (depth - level))
+      start = numpy.flatnonzero(numpy.concatenate(([True], keys[1:] != keys[:-1]))) if n else \
+        numpy.zeros(0, dtype=numpy.intp)
+      end = numpy.concatenate((start[1:], [n])).astype(numpy.intp)
+      mass = end - start
+      self.levels.append({
+        'key': keys[start],
+        'start': start,
+        'end': end,
+        'mass': mass.astype(float),
+        'x': (sumX[end] - sumX[start]) / numpy.maximum(mass, 1),
+        'y': (sumY[end] - sumY[start]) / numpy.maximum(mass, 1),
+        'side': self.size / float(1 << level),
+      })
+    for (level, nodes) in enumerate(self.levels[:-1]):
+      children = self.levels[level + 1]['start']
+      nodes['firstChild'] = numpy.searchsorted(children, nodes['start'])
+      nodes['lastChild'] = numpy.searchsorted(children, nodes['end'])
+
+  def forces(self, theta=0.5, repulsion=inverseSquareRepulsion, chunkSize=1 << 12):
+    """Approximate total repulsion on every point from every other point
+
+    Return: (fx, fy) arrays, in the same order as the points given to the tree
+    """
+    n = len(self.x)
+    fx = numpy.zeros(n)
+    fy = numpy.zeros(n)
+    # Neighboring targets share most of their interactions, so working through
+    # them in Morton order, a chunk at a time, keeps memory use bounded.
+    for start in range(0, n, chunkSize):
+      targets = numpy.arange(start, min(n, start + chunkSize))
+      (cx, cy) = self._chunkForces(targets, theta, repulsion)
+      fx[targets] = cx
+      fy[targets] = cy
+
+    result = (numpy.empty(n), numpy.empty(n))
+    result[0][self.order] = fx
+    result[1][self.order] = fy
+    return result
+
+  def _chunkForces(self, targets, theta, repulsion):
+    first = targets[0]
+    count = len(targets)
+    fx = numpy.zeros(count)
+    fy = numpy.zeros(count)
+    thetaSquared = theta * theta
+
+    def accumulate(pairTargets, (px, py)):
+      fx[:] += numpy.bincount(pairTargets - first, weights=px, minlength=count)
+      fy[:] += numpy.bincount(pairTargets - first, weights=py, minlength=count)
+
+    tgt = targets
+    node = numpy.zeros(count, dtype=numpy.intp)
+    for (level, nodes) in enumerate(self.levels):
+      if not len(tgt):
+        break
+      dx = nodes['x'][node] - self.x[tgt]
+      dy = nodes['y'][node] - self.y[tgt]
+      containsTarget = (self.codes[tgt] >> (2 * (self.depth - level))) == nodes['key'][node]
+      far = ~containsTarget & (nodes['side'] * nodes['side'] < thetaSquared * (dx*dx + dy*dy))
+      if numpy.any(far):
+        (px, py) = repulsion(dx[far], dy[far])
+        mass = nodes['mass'][node[far]]
+        accumulate(tgt[far], (px * mass, py * mass))
+
+      near = ~far
+      mass = nodes['mass'][node]
+      exact = near & ((mass <= LEAF_SIZE) | (level == self.depth))
+      if numpy.any(exact):
+        # Sum over every point in the node, skipping ones identical to the target
+        starts = nodes['start'][node[exact]]
+        lengths = nodes['end'][node[exact]] - starts
+        pairTargets = numpy.repeat(tgt[exact], lengths)
+        offsets = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        sources = numpy.repeat(starts, lengths) + offsets
+        qx = self.x[sources] - self.x[pairTargets]
+        qy = self.y[sources] - self.y[pairTargets]
+        distinct = (qx != 0) | (qy != 0)
+        accumulate(pairTargets[distinct], repulsion(qx[distinct], qy[distinct]))
+
+      opened = near & ~exact
+      if level == self.depth or not numpy.any(opened):
+        break
+      firstChild = nodes['firstChild'][node[opened]]
+      children = nodes['lastChild'][node[opened]] - firstChild
+      tgt = numpy.repeat(tgt[opened], children)
+      offsets = numpy.arange(children.sum()) - numpy.repeat(numpy.cumsum(children) - children, children)
+      node = numpy.repeat(firstChild, children) + offsets
+
+    return fx, fy
+
+def repulsionForces(points, theta=0.5, repulsion=inverseSquareRepulsion):
+  """Approximate total repulsion on each of `points` from all the others
+
+  Return: A list of (fx, fy) tuples, parallel to `points`
+  """
+  (fx, fy) = QuadTree(points).forces(theta, repulsion)
+  return zip(fx.tolist(), fy.tolist())
@@ -0,0 +1,376 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""NumPy versions of the routines in geometry.py which work on many shapes (or
+segments) at once
+
+Every routine here performs the same floating-point operations, in the same
+order, as its counterpart in geometry.py, so the results are identical; they
+just handle a whole array of inputs per Python-level call.
+
+Clipping every cell at once is 4 to 6x faster than one cell at a time: the
+cells of 1000 points take about 1.5 s instead of 10 s when clipped against every
+point, and 0.1 s instead of 0.4 s with mapgen2.py's --cell_optimization grid.
+"""
+
+import numpy
+
+from geometry import cutShape
+from predicates import ORIENT_ERROR, orient2d
+
+UNIT_SQUARE = ((0,0), (1,0), (1,1), (0,1))
+
+class ShapeArray (object):
+  """A batch of convex polygons, stored as padded vertex arrays
+
+  Polygon i has vertices (x[i, k], y[i, k]) for k < count[i]. Columns past
+  count[i] are padding, and are never read.
+  """
+
+  def __init__(self, numShapes, vertices=UNIT_SQUARE):
+    width = len(vertices) + 1
+    self.x = numpy.zeros((numShapes, width))
+    self.y = numpy.zeros((numShapes, width))
+    self.x[:, :len(vertices)] = [v[0] for v in vertices]
+    self.y[:, :len(vertices)] = [v[1] for v in vertices]
+    self.count = numpy.full(numShapes, len(vertices), dtype=int)
+
+  def _widen(self):
+    pad = numpy.zeros((len(self.count), 1))
+    self.x = numpy.hstack((self.x, pad))
+    self.y = numpy.hstack((self.y, pad))
+
+  def vertices(self, index):
+    n = self.count[index]
+    return zip(self.x[index, :n].tolist(), self.y[index, :n].tolist())
+
+  def setVertices(self, index, vertices):
+    while len(vertices) > self.x.shape[1]:
+      self._widen()
+    n = len(vertices)
+    self.x[index, :n] = [v[0] for v in vertices]
+    self.y[index, :n] = [v[1] for v in vertices]
+    self.count[index] = n
+
+  def centroids(self):
+    """geometry.polygonCentroid of every polygon
+
+    Return: (x, y) arrays, one entry per polygon
+    """
+    columns = numpy.arange(self.x.shape[1])
+    valid = columns < self.count[:, None]
+    x0 = self.x[:, :1]
+    y0 = self.y[:, :1]
+    dx = self.x - x0
+    dy = self.y - y0
+    # Fan triangles (0, k, k+1), for every k+1 < count
+    x1, y1, x2, y2 = dx[:, 1:-1], dy[:, 1:-1], dx[:, 2:], dy[:, 2:]
+    cross = numpy.where(valid[:, 2:], x1 * y2 - x2 * y1, 0)
+    area = cross.sum(1)
+    sumX = ((x1 + x2) * cross).sum(1)
+    sumY = ((y1 + y2) * cross).sum(1)
+
+    flat = area == 0
+    area[flat] = 1
+    centerX = x0[:, 0] + sumX / (3 * area)
+    centerY = y0[:, 0] + sumY / (3 * area)
+    centerX[flat] = numpy.where(valid, self.x, 0)[flat].sum(1) / self.count[flat]
+    centerY[flat] = numpy.where(valid, self.y, 0)[flat].sum(1) / self.count[flat]
+    return centerX, centerY
+
+  def cut(self, centerX, centerY, midX, midY, slopeX, slopeY, rows=None):
+    """Apply geometry.cutShape to many polygons, each with its own line
+
+    Parameters: Arrays (one entry per polygon) of the shape centers, a point on
+      each cutting line and each line's direction. If `rows` is given, only
+      those polygons are cut, and the other arrays are indexed the same way.
+    """
+    if rows is None:
+      rows = numpy.arange(len(self.count))
+    width = self.x.shape[1]
+    columns = numpy.arange(width)
+    count = self.count[rows][:, None]
+    valid = columns < count
+
+    # Edges run from vertex k to vertex k+1 (wrapping around to 0)
+    following = numpy.where(columns + 1 < count, columns + 1, 0)
+    x0 = self.x[rows]
+    y0 = self.y[rows]
+    x1 = self.x[rows[:, None], following]
+    y1 = self.y[rows[:, None], following]
+
+    # segmentAndLineIntersection()
+    xc = midX[:, None]
+    yc = midY[:, None]
+    mx = slopeX[:, None]
+    my = slopeY[:, None]
+    left = my * (x0 - xc)
+    right = mx * (y0 - yc)
+    numerator   = left - right
+    denominator = my * (x0 - x1) - mx * (y0 - y1)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      t = numerator / denominator
+      hit = valid & (denominator != 0) & (t >= 0) & (t <= 1)
+    hits = hit.sum(1)
+
+    # cutShape()'s check that rounding can't have put any vertex, or the center
+    # of a polygon the line crosses, on the wrong side of the line. The polygons
+    # which fail it are cut by cutShape() itself.
+    side = numerator > 0
+    crossed = valid & (side != side[numpy.arange(len(rows))[:, None], following])
+    uncertain = valid & ~(abs(numerator) > ORIENT_ERROR * (abs(left) + abs(right)))
+    centerLeft = slopeY * (centerX - midX)
+    centerRight = slopeX * (centerY - midY)
+    centerSide = centerLeft - centerRight
+    centerUncertain = ~(abs(centerSide) > ORIENT_ERROR * (abs(centerLeft) + abs(centerRight)))
+    inexact = (
+      (uncertain | (hit != crossed)).any(1) | ((hits != 0) & (hits != 2)) |
+      (centerUncertain & (hits == 2))
+    )
+    for index in numpy.flatnonzero(inexact):
+      self.setVertices(rows[index], cutShape(
+        (centerX[index], centerY[index]), self.vertices(rows[index]),
+        (midX[index], midY[index]), (slopeX[index], slopeY[index])))
+    width = self.x.shape[1]
+    columns = numpy.arange(width)
+
+    cut = numpy.flatnonzero((hits == 2) & ~inexact)
+    if not len(cut):
+      return
+    hit = hit[cut]
+    t = t[cut]
+    x0, y0, x1, y1 = x0[cut], y0[cut], x1[cut], y1[cut]
+
+    # The two crossed edges, in the order cutShape finds them
+    first = numpy.argmax(hit, 1)
+    second = hit.shape[1] - 1 - numpy.argmax(hit[:, ::-1], 1)
+    local = numpy.arange(len(cut))
+
+    def intercept(edge):
+      # interpolateSegment()
+      te = t[local, edge]
+      return (x0[local, edge] * (1 - te) + x1[local, edge] * te,
+              y0[local, edge] * (1 - te) + y1[local, edge] * te)
+    (firstX, firstY) = intercept(first)
+    (secondX, secondY) = intercept(second)
+
+    # The clockwise one is the crossed edge which starts on the center's side
+    clockwiseFirst = side[cut][local, first] == (centerSide[cut] > 0)
+    cwEdge = numpy.where(clockwiseFirst, first, second)
+    ccwEdge = numpy.where(clockwiseFirst, second, first)
+    cwX = numpy.where(clockwiseFirst, firstX, secondX)
+    cwY = numpy.where(clockwiseFirst, firstY, secondY)
+    ccwX = numpy.where(clockwiseFirst, secondX, firstX)
+    ccwY = numpy.where(clockwiseFirst, secondY, firstY)
+
+    # New polygon: [ccw intercept] + circularSlice(vertices, ccw end, cw start) + [cw intercept]
+    n = self.count[rows[cut]]
+    start = (ccwEdge + 1) % n
+    kept = (cwEdge - start) % n + 1
+    newCount = kept + 2
+    if newCount.max() > width:
+      self._widen()
+      width += 1
+      columns = numpy.arange(width)
+    source = (start[:, None] + columns[None, :] - 1) % n[:, None]
+    target = rows[cut]
+    oldX = self.x[target[:, None], source]
+    oldY = self.y[target[:, None], source]
+    position = columns[None, :]
+    isFirst = position == 0
+    isLast = position == (kept + 1)[:, None]
+    self.x[target] = numpy.where(isFirst, ccwX[:, None], numpy.where(isLast, cwX[:, None], oldX))
+    self.y[target] = numpy.where(isFirst, ccwY[:, None], numpy.where(isLast, cwY[:, None], oldY))
+    self.count[target] = newCount
+
+def _bisect(shapes, cx, cy, qx, qy, active):
+  # Midpoint and slope of perpendicular bisector, as computed in mapgen2.py
+  rows = numpy.flatnonzero(active & ((qx != cx) | (qy != cy)))
+  cx, cy, qx, qy = cx[rows], cy[rows], qx[rows], qy[rows]
+  midX = (cx + qx) / 2.0
+  midY = (cy + qy) / 2.0
+  dx = qx - cx
+  dy = qy - cy
+  shapes.cut(cx, cy, midX, midY, dy, -dx, rows)
+
+def clipCellsAgainstAll(points):
+  """Voronoi cells of `points` in the unit square, clipping each cell against
+  every other point in turn (like mapgen2.py's nonOptimizedIterator)
+
+  Return: A ShapeArray, where shape i is the cell of points[i]
+  """
+  coords = numpy.array(points, dtype=float).reshape(-1, 2)
+  cx = coords[:, 0].copy()
+  cy = coords[:, 1].copy()
+  shapes = ShapeArray(len(coords))
+  everything = numpy.ones(len(coords), dtype=bool)
+  for (qx, qy) in coords:
+    _bisect(shapes, cx, cy, numpy.full_like(cx, qx), numpy.full_like(cy, qy), everything)
+  return shapes
+
+def _pad(coords, candidates):
+  """Candidate lists as (len(candidates), longest) coordinate arrays, plus lengths"""
+  lengths = numpy.array([len(c) for c in candidates], dtype=int)
+  depth = lengths.max() if len(lengths) else 0
+  qx = numpy.zeros((len(candidates), depth))
+  qy = numpy.zeros((len(candidates), depth))
+  for (row, others) in enumerate(candidates):
+    if len(others):
+      others = coords[others] if coords is not None else numpy.array(others, dtype=float)
+      qx[row, :len(others)] = others[:, 0]
+      qy[row, :len(others)] = others[:, 1]
+  return qx, qy, lengths
+
+def clipCells(cores, candidates):
+  """Voronoi cells in the unit square, clipping each core against its own list
+  of candidate points, in order
+
+  Parameters:
+    cores -- list of (x, y) cell centers
+    candidates -- list parallel to `cores`; each entry a list of (x, y) points
+
+  Return: A ShapeArray, where shape i is the cell of cores[i]
+  """
+  coords = numpy.array(cores, dtype=float).reshape(-1, 2)
+  cx = coords[:, 0].copy()
+  cy = coords[:, 1].copy()
+  (qx, qy, lengths) = _pad(None, candidates)
+
+  shapes = ShapeArray(len(coords))
+  for column in range(qx.shape[1]):
+    _bisect(shapes, cx, cy, qx[:, column], qy[:, column], column < lengths)
+  return shapes
+
+def clipCellsWithGrid(grid):
+  """Voronoi cells of grid.points in the unit square, using the same outward
+  ring search as grid.PointGrid.neighbors, but for every cell at once
+
+  Return: A ShapeArray, where shape i is the cell of grid.points[i]
+  """
+  coords = numpy.array(grid.points, dtype=float).reshape(-1, 2)
+  cx = coords[:, 0].copy()
+  cy = coords[:, 1].copy()
+  buckets = [grid.bucketOf(p) for p in grid.points]
+  shapes = ShapeArray(len(coords))
+
+  searching = numpy.arange(len(coords))
+  r = 0
+  while len(searching):
+    (qx, qy, lengths) = _pad(coords, [grid.ring(buckets[i], r) for i in searching])
+    for column in range(qx.shape[1]):
+      active = numpy.zeros(len(coords), dtype=bool)
+      active[searching] = column < lengths
+      fullX = numpy.zeros(len(coords))
+      fullY = numpy.zeros(len(coords))
+      fullX[searching] = qx[:, column]
+      fullY[searching] = qy[:, column]
+      _bisect(shapes, cx, cy, fullX, fullY, active)
+
+    # Keep searching only where the next ring could still cut the shape
+    columns = numpy.arange(shapes.x.shape[1])
+    dx = shapes.x[searching] - cx[searching][:, None]
+    dy = shapes.y[searching] - cy[searching][:, None]
+    distance = numpy.where(columns < shapes.count[searching][:, None], dx*dx + dy*dy, 0)
+    radiusSquared = distance.max(1)
+    clearance = numpy.array([
+      grid.clearance(grid.points[i], buckets[i], r) for i in searching
+    ])
+    searching = searching[clearance * clearance < 4 * radiusSquared]
+    r += 1
+
+  return shapes
+
+def intersections(a, b):
+  """geometry.intersection for arrays of segments
+
+  Parameters: Two array-likes of segments, each of shape (..., 2, 2), which are
+    broadcast against each other. A single segment and an (m, 2, 2) array test
+    one segment against many; an (m, 1, 2, 2) and a (k, 2, 2) array test every
+    pair.
+
+  Return: Arrays ta, tb of the broadcast shape. Both are NaN wherever the
+    segments are parallel.
+  """
+  a = numpy.asarray(a, dtype=float)
+  b = numpy.asarray(b, dtype=float)
+  adx = a[..., 0, 0] - a[..., 1, 0]
+  ady = a[..., 0, 1] - a[..., 1, 1]
+  bdx = b[..., 0, 0] - b[..., 1, 0]
+  bdy = b[..., 0, 1] - b[..., 1, 1]
+  d0x = a[..., 0, 0] - b[..., 0, 0]
+  d0y = a[..., 0, 1] - b[..., 0, 1]
+  det = -adx*bdy + ady*bdx
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    ta = ( -bdy*d0x + bdx*d0y ) / det
+    tb = ( -ady*d0x + adx*d0y ) / det
+  parallel = det == 0
+  return numpy.where(parallel, numpy.nan, ta), numpy.where(parallel, numpy.nan, tb)
+
+def orientations(a, b, c):
+  """predicates.orient2d for arrays of points, each of shape (..., 2), which are
+  broadcast against each other. Entries too close to zero to trust are worked
+  out again exactly, one at a time.
+  """
+  shape = numpy.broadcast(a[..., 0], b[..., 0], c[..., 0]).shape
+  (a, b, c) = [numpy.broadcast_to(p, shape + (2,)).reshape(-1, 2) for p in (a, b, c)]
+  left = (a[:, 0] - c[:, 0]) * (b[:, 1] - c[:, 1])
+  right = (a[:, 1] - c[:, 1]) * (b[:, 0] - c[:, 0])
+  det = left - right
+  for index in numpy.flatnonzero(~(abs(det) > ORIENT_ERROR * (abs(left) + abs(right)))):
+    det[index] = orient2d(tuple(a[index]), tuple(b[index]), tuple(c[index]))
+  return det.reshape(shape)
+
+def segmentsIntersect(a, b):
+  """geometry.segmentsIntersect for arrays of segments, broadcast as in
+  intersections()
+
+  Return: A boolean array. Segments which share an endpoint never intersect,
+    and neither do parallel ones.
+  """
+  a = numpy.asarray(a, dtype=float)
+  b = numpy.asarray(b, dtype=float)
+  def same(p, q):
+    return (p[..., 0] == q[..., 0]) & (p[..., 1] == q[..., 1])
+  (a0, a1, b0, b1) = (a[..., 0, :], a[..., 1, :], b[..., 0, :], b[..., 1, :])
+  shared = same(a0, b0) | same(a0, b1) | same(a1, b0) | same(a1, b1)
+  (o1, o2) = (orientations(a0, a1, b0), orientations(a0, a1, b1))
+  (o3, o4) = (orientations(b0, b1, a0), orientations(b0, b1, a1))
+  apart = (
+    ((o1 > 0) & (o2 > 0)) | ((o1 < 0) & (o2 < 0)) | ((o1 == 0) & (o2 == 0)) |
+    ((o3 > 0) & (o4 > 0)) | ((o3 < 0) & (o4 < 0))
+  )
+  return ~shared & ~apart
+
+class SegmentSet (object):
+  """A changing collection of segments, stored so that a new segment can be
+  tested against all of them at once
+
+  Each added segment gets a slot number. Slots are handed out in increasing
+  order and never reused, so listing live slots in order lists the segments in
+  the order they were added.
+  """
+
+  def __init__(self, capacity=64):
+    self.coords = numpy.zeros((capacity, 2, 2))
+    self.alive = numpy.zeros(capacity, dtype=bool)
+    self.segments = []
+
+  def add(self, segment):
+    slot = len(self.segments)
+    if slot == len(self.alive):
+      self.coords = numpy.concatenate((self.coords, numpy.zeros_like(self.coords)))
+      self.alive = numpy.concatenate((self.alive, numpy.zeros_like(self.alive)))
+    self.coords[slot] = segment
+    self.alive[slot] = True
+    self.segments.append(segment)
+    return slot
+
+  def remove(self, slot):
+    self.alive[slot] = False
+
+  def __len__(self):
+    return int(self.alive.sum())
+
+  def crossing(self, segment):
+    """Slots of the live segments which segment intersects, in order"""
+    live = numpy.flatnonzero(self.alive[:len(self.segments)])
+    return live[segmentsIntersect(segment, self.coords[live])]
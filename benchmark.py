@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks of every engine, over fixed-seed point sets of growing size
+
+Each case is timed on each point count in its own process, so its peak memory
+(ru_maxrss, which never goes down) is its own. Generating the points isn't
+timed. Sizes are tried smallest first, and a case stops at the first size it is
+predicted to take longer than --time_limit on, so the cases which are
+quadratic or worse (voronoi_brute, relaxation_exact, and the greedy and
+shortest_first triangulations) don't run for days on a million points.
+
+The time of each case is fitted to a power of the number of points, n^k, over
+the sizes which took long enough to measure. Results can be saved with --output
+and compared against with --baseline, which flags every case and size that got
+more than --tolerance slower:
+
+  python benchmark.py --output before.json
+  (make changes)
+  python benchmark.py --baseline before.json
+"""
+
+import argparse
+import json
+import math
+import platform
+import subprocess
+import sys
+import time
+
+import instrument
+import pipeline
+
+def gridDivs(n):
+  return max(1, int((n / 2.0) ** 0.5))
+
+# name -> function of the points and the seed
+CASES = [
+  ('delaunay', lambda points, seed: pipeline.buildTriangulation(points, 'delaunay')),
+  ('triangulation_greedy', lambda points, seed: pipeline.buildTriangulation(points, 'greedy')),
+  ('triangulation_shortest_first', lambda points, seed: pipeline.buildTriangulation(points, 'shortest_first')),
+  ('voronoi_brute', lambda points, seed: pipeline.buildVoronoi(points)),
+  ('voronoi_grid', lambda points, seed: pipeline.buildVoronoi(points, gridDivs(len(points)))),
+  ('voronoi_fortune', lambda points, seed: pipeline.buildVoronoi(points, engine='fortune')),
+  ('voronoi_delaunay', lambda points, seed: pipeline.buildVoronoi(points, engine='delaunay')),
+  ('voronoi_workers', lambda points, seed: pipeline.buildVoronoi(points, gridDivs(len(points)), workers=2)),
+  ('voronoi_vectorized', lambda points, seed: pipeline.buildVoronoi(points, gridDivs(len(points)), vectorized=True)),
+  ('relaxation_exact', lambda points, seed: pipeline.relax(points, 1, 'exact')),
+  ('relaxation_lloyd', lambda points, seed: pipeline.relax(points, 1, 'lloyd', divs=gridDivs(len(points)))),
+  ('relaxation_barnes_hut', lambda points, seed: pipeline.relax(points, 1, 'barnes_hut')),
+  ('points_poisson', lambda points, seed: pipeline.generatePoints(len(points), seed, sampler='poisson')),
+]
+CASE_NAMES = [name for (name, run) in CASES]
+
+# Runs shorter than this are too noisy to fit exponents to, or to flag as
+# regressions
+MIN_SECONDS = 0.05
+
+PARSER = argparse.ArgumentParser(description='Benchmark the map generators')
+PARSER.add_argument('--cases', default=','.join(CASE_NAMES), help='Comma-separated cases to run, out of: ' + ', '.join(CASE_NAMES))
+PARSER.add_argument('--sizes', default='100,1000,10000,100000,1000000', help='Comma-separated numbers of points')
+PARSER.add_argument('--seed', default=0, type=int, help='Random seed of the point sets')
+PARSER.add_argument('--repeat', default=1, type=int, help='Run each case this many times per size and keep the fastest')
+PARSER.add_argument('--time_limit', default=60.0, type=float, help='Skip sizes a case is predicted to take longer than this many seconds on')
+PARSER.add_argument('--output', help='Save the results to a JSON file, to use as a --baseline later')
+PARSER.add_argument('--baseline', help='Compare against results saved with --output, and exit with status 1 if anything got slower')
+PARSER.add_argument('--tolerance', default=0.2, type=float, help='Fraction by which a case may get slower than the baseline before it is flagged')
+PARSER.add_argument('--measure', nargs=2, metavar=('CASE', 'SIZE'), help=argparse.SUPPRESS)
+
+def measure(case, size, seed, repeat):
+  """Run one case on one point set, in this process
+
+  Return: A dictionary of the fastest time and the peak memory use
+  """
+  run = dict(CASES)[case]
+  points = pipeline.generatePoints(size, seed)
+  # Run once untimed on a few points first, so that the modules the case
+  # imports lazily (numpy, batchgeometry, barneshut...) are loaded before the
+  # clock starts
+  run(pipeline.generatePoints(10, seed), seed)
+  times = []
+  for i in range(repeat):
+    start = time.time()
+    run(points, seed)
+    times.append(time.time() - start)
+  return {'seconds': min(times), 'peak_rss_kb': instrument.peakMemoryKb()}
+
+def measureInSubprocess(case, size, seed, repeat):
+  """Run measure() in a fresh interpreter
+
+  Return: measure()'s result, or None if the case couldn't run (such as when
+    it needs numpy and there is none)
+  """
+  child = subprocess.Popen(
+    [sys.executable, __file__, '--measure', case, str(size), '--seed', str(seed), '--repeat', str(repeat)],
+    stdout=subprocess.PIPE)
+  (output, _) = child.communicate()
+  if child.returncode != 0:
+    return None
+  return json.loads(output)
+
+def fitExponent(sizes, seconds):
+  """Least-squares k such that seconds is about c * size^k, over the runs which
+  took at least MIN_SECONDS
+
+  Return: k, or None if fewer than two runs were long enough
+  """
+  pairs = [(math.log(n), math.log(t)) for (n, t) in zip(sizes, seconds) if t >= MIN_SECONDS]
+  if len(pairs) < 2:
+    return None
+  meanX = sum(x for (x, y) in pairs) / len(pairs)
+  meanY = sum(y for (x, y) in pairs) / len(pairs)
+  spread = sum((x - meanX) ** 2 for (x, y) in pairs)
+  if spread == 0:
+    return None
+  return sum((x - meanX) * (y - meanY) for (x, y) in pairs) / spread
+
+def predict(runs, size):
+  """Predicted time of a case on `size` points, from the runs so far"""
+  measured = [(n, run['seconds']) for (n, run) in sorted(runs.items()) if run]
+  if not measured:
+    return 0.0
+  (lastSize, lastSeconds) = measured[-1]
+  exponent = fitExponent(*zip(*measured)) or 1.0
+  return lastSeconds * (float(size) / lastSize) ** max(1.0, exponent)
+
+def runAll(cases, sizes, seed, repeat, timeLimit):
+  results = {}
+  for case in cases:
+    runs = {}
+    for size in sizes:
+      estimate = predict(runs, size)
+      if estimate > timeLimit:
+        print "{:<28} {:>8}: skipped (about {:.0f} s)".format(case, size, estimate)
+        continue
+      run = measureInSubprocess(case, size, seed, repeat)
+      runs[size] = run
+      if run is None:
+        print "{:<28} {:>8}: failed".format(case, size)
+        break
+      run['points_per_second'] = size / run['seconds'] if run['seconds'] else None
+      print "{:<28} {:>8}: {:>9.3f} s {:>12.0f} points/s {:>9} KB".format(
+        case, size, run['seconds'], run['points_per_second'] or 0, run['peak_rss_kb'])
+      sys.stdout.flush()
+
+    measured = [(n, run['seconds']) for (n, run) in sorted(runs.items()) if run]
+    exponent = fitExponent(*zip(*measured)) if measured else None
+    if exponent is not None:
+      print "{:<28} scales as n^{:.2f}".format(case, exponent)
+    results[case] = {
+      'exponent': exponent,
+      'runs': dict((str(n), run) for (n, run) in runs.items() if run),
+    }
+  return results
+
+def compare(results, baseline, tolerance):
+  """Print every case and size which got slower than the baseline by more than
+  `tolerance`
+
+  Return: The number of regressions
+  """
+  regressions = 0
+  for (case, result) in sorted(results.items()):
+    before = baseline['results'].get(case)
+    if before is None:
+      continue
+    for (size, run) in sorted(result['runs'].items(), key=lambda (size, run): int(size)):
+      old = before['runs'].get(size)
+      if old is None or max(run['seconds'], old['seconds']) < MIN_SECONDS:
+        continue
+      ratio = run['seconds'] / old['seconds']
+      flag = ratio > 1 + tolerance
+      regressions += flag
+      print "{} {:<28} {:>8}: {:.3f} s -> {:.3f} s ({:+.0f}%)".format(
+        'REGRESSION' if flag else '          ', case, size, old['seconds'], run['seconds'], 100 * (ratio - 1))
+  return regressions
+
+if __name__ == '__main__':
+  ARGS = PARSER.parse_args()
+
+  if ARGS.measure:
+    (case, size) = ARGS.measure
+    print json.dumps(measure(case, int(size), ARGS.seed, ARGS.repeat))
+    sys.exit()
+
+  cases = ARGS.cases.split(',')
+  for case in cases:
+    if case not in CASE_NAMES:
+      PARSER.error('unknown case {}'.format(case))
+  sizes = sorted(int(size) for size in ARGS.sizes.split(','))
+
+  results = runAll(cases, sizes, ARGS.seed, ARGS.repeat, ARGS.time_limit)
+
+  if ARGS.output:
+    with open(ARGS.output, 'w') as outfile:
+      json.dump({
+        'command': sys.argv,
+        'python': sys.version,
+        'platform': platform.platform(),
+        'seed': ARGS.seed,
+        'results': results,
+      }, outfile, indent=2, sort_keys=True)
+
+  if ARGS.baseline:
+    with open(ARGS.baseline) as infile:
+      baseline = json.load(infile)
+    if compare(results, baseline, ARGS.tolerance):
+      sys.exit(1)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Content-addressed on-disk cache of finished diagrams
+
+An entry is keyed by a hash of the input points and every parameter which
+affects the result, and holds the relaxed points and their finished cells, so a
+hit skips both relaxation and clipping. Each entry is one binary file: a 24-byte
+header followed by three contiguous little-endian arrays,
+
+  bytes 0-3    magic number "MGDC"
+  byte  4      format version (1)
+  bytes 5-7    unused (zero)
+  bytes 8-15   number of points n, as an unsigned 64-bit integer
+  bytes 16-23  total number of cell vertices m, as an unsigned 64-bit integer
+
+  n (x, y) float64 pairs: the points
+  m (x, y) float64 pairs: the vertices of every cell, one cell after another
+  n uint32: the number of vertices in each cell
+
+Entries are written to a temporary file and renamed into place, so readers
+never see half of one, and any number of processes can share a directory.
+Reading an entry touches its modification time; once the directory holds more
+than its limit, the entries read or written longest ago are deleted first.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+from array import array
+
+MAGIC = 'MGDC'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xQQ')
+BIG_ENDIAN = struct.pack('=H', 1) != struct.pack('<H', 1)
+UINT32 = 'I' if array('I').itemsize == 4 else 'L'
+EXTENSION = '.mgdc'
+TEMP_PREFIX = '.tmp-'
+
+# Temporary files left this long (by a crashed writer) are deleted
+STALE_SECONDS = 3600
+
+def key(points, params):
+  """Hex digest identifying a diagram
+
+  Parameters:
+    points -- The input points, before any relaxation
+    params -- A dictionary of every setting which affects the result
+  """
+  coords = array('d')
+  for (x, y) in points:
+    coords.append(x)
+    coords.append(y)
+  if BIG_ENDIAN:
+    coords.byteswap()
+  digest = hashlib.sha256()
+  digest.update(HEADER.pack(MAGIC, VERSION, len(points), 0))
+  digest.update(json.dumps(params, sort_keys=True))
+  digest.update(coords.tostring())
+  return digest.hexdigest()
+
+class DiagramCache (object):
+  def __init__(self, directory, maxBytes):
+    self.directory = directory
+    self.maxBytes = maxBytes
+    if not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        if not os.path.isdir(directory):  # Not just another process winning the race
+          raise
+
+  def path(self, key):
+    return os.path.join(self.directory, key + EXTENSION)
+
+  def load(self, key):
+    """Return: (points, cells) stored under `key`, where cells is a list of
+      vertex lists parallel to points, or None if there is no such entry
+
+    An entry which can't be read (written by another version, or cut short) is
+    deleted and treated as missing.
+    """
+    path = self.path(key)
+    try:
+      with open(path, 'rb') as infile:
+        data = infile.read()
+    except IOError:
+      return None
+
+    if len(data) < HEADER.size:
+      return self._discard(path)
+    (magic, version, n, m) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION or len(data) != HEADER.size + 20 * n + 16 * m:
+      return self._discard(path)
+    try:
+      os.utime(path, None)
+    except OSError:
+      pass  # Evicted since we opened it
+
+    offset = HEADER.size
+    coords = array('d', data[offset:offset + 16 * n])
+    offset += 16 * n
+    vertexCoords = array('d', data[offset:offset + 16 * m])
+    offset += 16 * m
+    counts = array(UINT32, data[offset:offset + 4 * n])
+    if BIG_ENDIAN:
+      for values in (coords, vertexCoords, counts):
+        values.byteswap()
+    if sum(counts) != m:
+      return self._discard(path)
+
+    points = zip(coords[0::2].tolist(), coords[1::2].tolist())
+    vertices = zip(vertexCoords[0::2].tolist(), vertexCoords[1::2].tolist())
+    cells = []
+    start = 0
+    for count in counts:
+      cells.append(vertices[start:start + count])
+      start += count
+    return points, cells
+
+  def _discard(self, path):
+    """Delete an unreadable entry, and report it missing"""
+    try:
+      os.remove(path)
+    except OSError:
+      pass  # Already replaced or evicted by another process
+    return None
+
+  def store(self, key, points, cells):
+    """Save points and their cells (vertex lists) under `key`, then evict
+    entries until the cache fits in its limit again
+    """
+    coords = array('d')
+    for (x, y) in points:
+      coords.append(x)
+      coords.append(y)
+    vertexCoords = array('d')
+    counts = array(UINT32)
+    for vertices in cells:
+      counts.append(len(vertices))
+      for (x, y) in vertices:
+        vertexCoords.append(x)
+        vertexCoords.append(y)
+    if BIG_ENDIAN:
+      for values in (coords, vertexCoords, counts):
+        values.byteswap()
+
+    (fd, temp) = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.directory)
+    try:
+      with os.fdopen(fd, 'wb') as outfile:
+        outfile.write(HEADER.pack(MAGIC, VERSION, len(points), len(vertexCoords) // 2))
+        coords.tofile(outfile)
+        vertexCoords.tofile(outfile)
+        counts.tofile(outfile)
+      os.chmod(temp, 0644)  # mkstemp makes it private to this user
+      os.rename(temp, self.path(key))
+    except:
+      os.remove(temp)
+      raise
+    self.evict()
+
+  def evict(self):
+    """Delete the least recently used entries until the rest fit in maxBytes"""
+    entries = []
+    now = time.time()
+    for name in os.listdir(self.directory):
+      path = os.path.join(self.directory, name)
+      try:
+        stat = os.stat(path)
+        if name.startswith(TEMP_PREFIX):
+          if now - stat.st_mtime > STALE_SECONDS:
+            os.remove(path)
+        elif name.endswith(EXTENSION):
+          entries.append((stat.st_mtime, stat.st_size, path))
+      except OSError:
+        pass  # Deleted by another process in the meantime
+
+    total = sum(size for (mtime, size, path) in entries)
+    for (mtime, size, path) in sorted(entries):
+      if total <= self.maxBytes:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      total -= size
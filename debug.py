@@ -1,10 +1,10 @@
-_profiling = False
-call_counts = {}
+import instrument
+from instrument import profile
 
 def assertEqual(a, b):
   assert a == b, "{} != {}".format(repr(a), repr(b))
 
-def debug (func):
+def _debugShim (func):
   def debug_shim(*args, **kwargs):
     try:
       ret = func(*args, **kwargs)
@@ -20,16 +20,14 @@ def debug (func):
 
   return debug_shim
 
-def enable_profiling ():
-  global _profiling
-  _profiling = True
+def debug (func):
+  """Decorator: print the arguments `func` was called with if it raises, once
+  enable_debugging() has been called
+  """
+  return instrument.register(func, 'debug', _debugShim)
 
-def profile (func):
-  def profile_shim(*args, **kwargs):
-    if _profiling:
-      if func in call_counts:
-        call_counts[func] += 1
-      else:
-        call_counts[func] = 1
-    return func(*args, **kwargs)
-  return profile_shim
+def enable_debugging ():
+  instrument.enable('debug')
+
+def enable_profiling ():
+  instrument.enable('profile')
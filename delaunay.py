@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Incremental Delaunay triangulation (Bowyer-Watson)
+
+Points are inserted one at a time in Hilbert-curve order. Each new point is
+located by walking across triangles from the previously inserted one, then every
+triangle whose circumcircle contains the point (its "cavity") is removed and the
+hole is re-filled with a fan of triangles around the new point.
+
+Rather than wrapping the input in a huge super-triangle, the convex hull is
+closed off with "ghost" triangles which share a single vertex at infinity
+(GHOST). A ghost's "circumcircle" is the open half-plane on the far side of its
+hull edge, so points outside the hull are handled exactly like points inside.
+"""
+
+from geometry import cutBisector
+from predicates import INCIRCLE_ERROR, ORIENT_ERROR, circumcenter, circumcenterExact, incircle, orient2d
+
+GHOST = -1
+
+# (corner, edge start, edge end) for the edge opposite each corner of a triangle
+_EDGES = ((0, 1, 2), (1, 2, 0), (2, 0, 1))
+
+def orientation(a, b, c):
+  """Twice the signed area of triangle abc: positive if counterclockwise. The
+  sign is always right (see predicates.py).
+  """
+  return orient2d(a, b, c)
+
+def inCircle(a, b, c, d):
+  """Positive if d lies inside the circumcircle of counterclockwise triangle
+  abc. The sign is always right (see predicates.py).
+  """
+  return incircle(a, b, c, d)
+
+# Bound on the rounding error of the inlined inCircle() in _insert(), relative
+# to alift*blift + blift*clift + clift*alift. That's at least the permanent
+# predicates.incircle() bounds the error with (since |xy| <= (x^2 + y^2) / 2),
+# and cheaper to work out; doubling the bound covers the rounding in it.
+_LOOSE_INCIRCLE_ERROR = 2 * INCIRCLE_ERROR
+
+def hilbertIndex(x, y, order=16):
+  """Distance of integer cell (x, y) along a Hilbert curve covering 2^order cells"""
+  n = 1 << order
+  d = 0
+  s = n >> 1
+  while s > 0:
+    rx = 1 if x & s else 0
+    ry = 1 if y & s else 0
+    d += s * s * ((3 * rx) ^ ry)
+    if ry == 0:
+      if rx == 1:
+        x = n - 1 - x
+        y = n - 1 - y
+      x, y = y, x
+    s >>= 1
+  return d
+
+def hilbertOrder(points, order=None):
+  """Indices of `points` sorted so that consecutive points are spatially close"""
+  if not points:
+    return []
+  if order is None:
+    # About one point per curve cell is enough to keep the walks short
+    order = max(1, min(16, (len(points).bit_length() + 1) // 2))
+  xs = [p[0] for p in points]
+  ys = [p[1] for p in points]
+  xmin, ymin = min(xs), min(ys)
+  span = max(max(xs) - xmin, max(ys) - ymin) or 1.0
+  scale = ((1 << order) - 1) / float(span)
+  keys = [
+    hilbertIndex(int((x - xmin) * scale), int((y - ymin) * scale), order)
+    for (x, y) in zip(xs, ys)
+  ]
+  return sorted(range(len(points)), key=keys.__getitem__)
+
+class DelaunayTriangulation (object):
+  """Delaunay triangulation of a list of (x, y) points
+
+  Triangles are stored in flat lists, three entries per triangle:
+    vertices[3*t + i]  -- index into `points` of corner i (GHOST for infinity)
+    neighbors[3*t + i] -- triangle sharing the edge opposite corner i
+  Real triangles are counterclockwise. Duplicate points are not inserted; their
+  indices are listed in `duplicates`.
+  """
+
+  def __init__(self, points):
+    self.points = points
+    self.vertices = []
+    self.neighbors = []
+    self.duplicates = []
+    self._circumcenters = None
+    self._slivers = None
+    self.stats = {
+      'insertPoint': 0,
+      'locateStep': 0,
+      'inCircle': 0,
+    }
+
+    order = hilbertOrder(points)
+    seed = self._start(order)
+    if seed:
+      for index in order:
+        if index not in seed:
+          self._insert(index)
+
+  def _start(self, order):
+    """Create the first triangle and its three ghosts
+
+    Return: The seed triangle's corners, or None if every point is collinear
+    """
+    points = self.points
+    if not order:
+      return None
+    a = order[0]
+    b = c = None
+    for index in order[1:]:
+      if b is None:
+        if points[index][0] != points[a][0] or points[index][1] != points[a][1]:
+          b = index
+      elif orientation(points[a], points[b], points[index]) != 0:
+        c = index
+        break
+    if c is None:
+      return None
+    if orientation(points[a], points[b], points[c]) < 0:
+      b, c = c, b
+
+    self.vertices[:] = [
+      a, b, c,
+      c, b, GHOST,
+      a, c, GHOST,
+      b, a, GHOST,
+    ]
+    self.neighbors[:] = [None] * 12
+    edges = {}
+    for t in range(4):
+      for i in range(3):
+        edges[(self.vertices[3*t + (i+1) % 3], self.vertices[3*t + (i+2) % 3])] = 3*t + i
+    for ((u, w), slot) in edges.items():
+      self.neighbors[slot] = edges[(w, u)] // 3
+    self._last = 0
+    return set((a, b, c))
+
+  def _locate(self, p):
+    """Walk from the last inserted triangle to one whose circumcircle contains p"""
+    V = self.vertices
+    N = self.neighbors
+    points = self.points
+    px, py = p
+    t = self._last
+    steps = 0
+    while True:
+      steps += 1
+      base = 3 * t
+      a, b, c = V[base], V[base+1], V[base+2]
+      if a == GHOST or b == GHOST or c == GHOST:
+        break
+      (ax, ay), (bx, by), (cx, cy) = points[a], points[b], points[c]
+      # Rotate the order in which edges are tested so the walk can't cycle
+      first = steps % 3
+      for i in (first, (first + 1) % 3, (first + 2) % 3):
+        # Step across the edge opposite corner i if p is beyond it
+        if i == 0:
+          left = (cx - bx) * (py - by)
+          right = (cy - by) * (px - bx)
+        elif i == 1:
+          left = (ax - cx) * (py - cy)
+          right = (ay - cy) * (px - cx)
+        else:
+          left = (bx - ax) * (py - ay)
+          right = (by - ay) * (px - ax)
+        det = left - right
+        if not abs(det) > ORIENT_ERROR * (abs(left) + abs(right)):
+          # Too close to call in floating point
+          det = orient2d(points[V[base + (i+1) % 3]], points[V[base + (i+2) % 3]], p)
+        if det < 0:
+          t = N[base + i]
+          break
+      else:
+        break
+    self.stats['locateStep'] += steps
+    return t
+
+  def _conflicts(self, t, p):
+    """Whether p lies inside the circumcircle of triangle t"""
+    V = self.vertices
+    points = self.points
+    base = 3 * t
+    a, b, c = V[base], V[base+1], V[base+2]
+    if a == GHOST:
+      u, w = b, c
+    elif b == GHOST:
+      u, w = c, a
+    elif c == GHOST:
+      u, w = a, b
+    else:
+      return inCircle(points[a], points[b], points[c], p) > 0
+
+    # Ghost triangle: p conflicts if it is beyond the hull edge (u, w), or on
+    # the edge itself.
+    (ux, uy), (wx, wy) = points[u], points[w]
+    side = orient2d((ux, uy), (wx, wy), p)
+    if side != 0:
+      return side > 0
+    return (min(ux, wx) <= p[0] <= max(ux, wx) and
+            min(uy, wy) <= p[1] <= max(uy, wy))
+
+  def _insert(self, index):
+    V = self.vertices
+    N = self.neighbors
+    points = self.points
+    p = points[index]
+    px, py = p
+    self.stats['insertPoint'] += 1
+
+    t = self._locate(p)
+    for corner in V[3*t:3*t+3]:
+      if corner != GHOST:
+        q = points[corner]
+        if q[0] == px and q[1] == py:
+          self.duplicates.append(index)
+          return
+
+    # Flood outward from t to find the cavity and its boundary edges
+    cavity = [t]
+    state = {t: True}
+    boundary = []
+    stack = [t]
+    tests = 0
+    while stack:
+      c = stack.pop()
+      base = 3 * c
+      for (i, j, k) in _EDGES:
+        n = N[base + i]
+        conflict = state.get(n)
+        if conflict is None:
+          nbase = 3 * n
+          a, b, d = V[nbase], V[nbase+1], V[nbase+2]
+          if a == GHOST or b == GHOST or d == GHOST:
+            conflict = self._conflicts(n, p)
+          else:
+            # inCircle(), inlined since this is the innermost loop
+            tests += 1
+            (ax, ay), (bx, by), (dx, dy) = points[a], points[b], points[d]
+            adx = ax - px
+            ady = ay - py
+            bdx = bx - px
+            bdy = by - py
+            ddx = dx - px
+            ddy = dy - py
+            alift = adx * adx + ady * ady
+            blift = bdx * bdx + bdy * bdy
+            dlift = ddx * ddx + ddy * ddy
+            det = (
+              alift * (bdx * ddy - ddx * bdy) +
+              blift * (ddx * ady - adx * ddy) +
+              dlift * (adx * bdy - bdx * ady)
+            )
+            if abs(det) <= _LOOSE_INCIRCLE_ERROR * (alift * blift + blift * dlift + dlift * alift):
+              # Too close to call in floating point
+              det = incircle(points[a], points[b], points[d], p)
+            conflict = det > 0
+          state[n] = conflict
+          if conflict:
+            cavity.append(n)
+            stack.append(n)
+            continue
+        if not conflict:
+          boundary.append((V[base + j], V[base + k], n))
+    self.stats['inCircle'] += tests
+
+    # Re-fill the cavity with a fan around p, reusing the cavity's slots
+    extra = len(boundary) - len(cavity)
+    slots = cavity + range(len(V) // 3, len(V) // 3 + extra)
+    V.extend([None] * (3 * extra))
+    N.extend([None] * (3 * extra))
+    startsAt = {}
+    endsAt = {}
+    for ((u, w, n), s) in zip(boundary, slots):
+      startsAt[u] = s
+      endsAt[w] = s
+    for ((u, w, n), s) in zip(boundary, slots):
+      base = 3 * s
+      V[base], V[base+1], V[base+2] = index, u, w
+      N[base], N[base+1], N[base+2] = n, startsAt[w], endsAt[u]
+      # Point the outside neighbor back at the new triangle
+      nbase = 3 * n
+      if V[nbase] != u and V[nbase] != w:
+        N[nbase] = s
+      elif V[nbase+1] != u and V[nbase+1] != w:
+        N[nbase+1] = s
+      else:
+        N[nbase+2] = s
+      if u != GHOST and w != GHOST:
+        self._last = s
+
+  def triangles(self):
+    """List of (i, j, k) point indices of every real (counterclockwise) triangle"""
+    V = self.vertices
+    return [
+      (V[base], V[base+1], V[base+2])
+      for base in range(0, len(V), 3)
+      if V[base] != GHOST and V[base+1] != GHOST and V[base+2] != GHOST
+    ]
+
+  def edges(self):
+    """Set of (i, j) point-index pairs, i < j, of every edge in the triangulation"""
+    if not self.vertices:
+      # Every point was collinear, so the "triangulation" is a chain of segments
+      points = self.points
+      order = sorted(range(len(points)), key=lambda i: tuple(points[i]))
+      chain = [order[0]] if order else []
+      for index in order[1:]:
+        if tuple(points[index]) != tuple(points[chain[-1]]):
+          chain.append(index)
+      return set((min(i, j), max(i, j)) for (i, j) in zip(chain, chain[1:]))
+
+    V = self.vertices
+    edges = set()
+    for base in range(0, len(V), 3):
+      for i in range(3):
+        u, w = V[base + i], V[base + (i+1) % 3]
+        if u != GHOST and w != GHOST:
+          edges.add((u, w) if u < w else (w, u))
+    return edges
+
+  def segments(self):
+    """Edges as pairs of endpoints, in the same form mapgen.py's segments use"""
+    points = self.points
+    return [(points[i], points[j]) for (i, j) in self.edges()]
+
+  def circumcenters(self):
+    """Circumcenter of every triangle, indexed like the triangles (None for
+    ghosts). Worked out once, then cached; slivers' are worked out exactly (see
+    predicates.circumcenter), then rounded, and the slivers are noted in
+    self._slivers.
+    """
+    if self._circumcenters is None:
+      V = self.vertices
+      points = self.points
+      centers = []
+      slivers = set()
+      for base in range(0, len(V), 3):
+        a, b, c = V[base], V[base+1], V[base+2]
+        if a == GHOST or b == GHOST or c == GHOST:
+          centers.append(None)
+          continue
+        center = circumcenter(points[a], points[b], points[c])
+        if center is None:
+          center = tuple(map(float, circumcenterExact(points[a], points[b], points[c])))
+          slivers.add(base // 3)
+        centers.append(center)
+      self._circumcenters = centers
+      self._slivers = slivers
+    return self._circumcenters
+
+  def voronoiCells(self, ((xmin, xmax), (ymin, ymax))=((0,1),(0,1))):
+    """Voronoi cells of the points, within the given bounds
+
+    The Voronoi vertices around a point are the circumcenters of the triangles
+    around it, so each cell is read off by walking the point's fan of triangles
+    counterclockwise. The cells which can't be read off reliably -- those of
+    hull points, which are unbounded, those with a circumcenter outside the
+    bounds, and those with a sliver in their fan, whose nearly collinear
+    corners make tiny errors in its circumcenter add up to a visibly wrong
+    cell -- are clipped instead, by cutting the bounding box with the
+    bisectors between the point and its neighbors in the fan.
+
+    Return: A list parallel to `points` of each cell's vertices,
+      counterclockwise. Duplicate points get the same cell as the point they
+      duplicate.
+    """
+    points = self.points
+    box = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+
+    def clipped(index, others):
+      p = points[index]
+      vertices = box
+      for q in others:
+        if q != p:
+          vertices = cutBisector(p, vertices, q)
+      return vertices
+
+    if not self.vertices:
+      # Every point was collinear, so there are no triangles to walk
+      return [clipped(index, points) for index in range(len(points))]
+
+    V = self.vertices
+    N = self.neighbors
+    centers = self.circumcenters()
+    slivers = self._slivers
+
+    # One triangle (and the corner) at each point
+    corners = {}
+    for slot in range(len(V)):
+      if V[slot] != GHOST:
+        corners[V[slot]] = slot
+
+    cells = [None] * len(points)
+    for (index, slot) in corners.items():
+      # Walk counterclockwise around the point: triangle t has the point at
+      # corner i, and its next neighbor around shares the edge opposite corner
+      # i+1.
+      vertices = []
+      fan = []
+      clip = False
+      start = t = slot // 3
+      i = slot % 3
+      while True:
+        center = centers[t]
+        if center is None or t in slivers:
+          clip = True
+        if center is not None and (not vertices or center != vertices[-1]):
+          # (Cocircular points give several triangles the same circumcenter)
+          vertices.append(center)
+        fan.append(V[3*t + (i+1) % 3])
+        n = N[3*t + (i+1) % 3]
+        i = V[3*n:3*n+3].index(index)
+        t = n
+        if t == start:
+          break
+
+      if len(vertices) > 1 and vertices[0] == vertices[-1]:
+        vertices.pop()
+      if clip or any(not (xmin <= x <= xmax and ymin <= y <= ymax) for (x, y) in vertices):
+        vertices = clipped(index, [points[other] for other in fan if other != GHOST])
+      cells[index] = vertices
+
+    if self.duplicates:
+      kept = dict((tuple(points[index]), index) for index in corners)
+      for index in self.duplicates:
+        cells[index] = cells[kept[tuple(points[index])]]
+    return cells
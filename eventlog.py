@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Binary logs of each step the generators take, for replaying later
+
+Animating a run means pausing it to draw every step, which is much too slow for
+big maps. Recording one instead writes each step to a log as it happens, at
+full speed, and replay.py plays the log back afterwards.
+
+A log starts with an 8-byte header (magic number "MGEV", format version 1,
+three unused bytes) followed by events, each a one-byte type and its fields,
+all little-endian:
+
+  POINTS              uint32 n, then n (x, y) float64 pairs
+  CELLS_CLEARED       -
+  CELL_STARTED        uint32 site
+  BISECTOR_APPLIED    uint32 other point
+  POLYGON_UPDATED     uint16 n, then n (x, y) float32 pairs
+  CELL_FINISHED       -
+  SEGMENT_CONSIDERED  uint32 i, uint32 j
+  SEGMENT_ACCEPTED    uint32 i, uint32 j
+  SEGMENT_REJECTED    uint32 i, uint32 j
+  SEGMENT_INVALIDATED uint32 i, uint32 j
+
+Points are referred to by their index in the last POINTS event, and segments by
+the indices of their endpoints. Polygons are only ever drawn, so single
+precision is plenty for them.
+"""
+
+import struct
+
+MAGIC = 'MGEV'
+VERSION = 1
+HEADER = struct.Struct('<4sB3x')
+
+(POINTS, CELLS_CLEARED, CELL_STARTED, BISECTOR_APPLIED, POLYGON_UPDATED,
+ CELL_FINISHED, SEGMENT_CONSIDERED, SEGMENT_ACCEPTED, SEGMENT_REJECTED,
+ SEGMENT_INVALIDATED) = range(1, 11)
+SEGMENT_EVENTS = (SEGMENT_CONSIDERED, SEGMENT_ACCEPTED, SEGMENT_REJECTED, SEGMENT_INVALIDATED)
+
+_TYPE = struct.Struct('<B')
+_COUNT = struct.Struct('<I')
+_INDEX = struct.Struct('<BI')
+_PAIR = struct.Struct('<BII')
+_VERTICES = struct.Struct('<BH')
+
+UNIT_SQUARE = [(0,0), (1,0), (1,1), (0,1)]
+
+class EventLog (object):
+  """Writes events to a log file
+
+  Events take points (and segments) the way the generators hold them, as
+  coordinate pairs; they are written as indices into the last points() call.
+  """
+
+  def __init__(self, path):
+    self.outfile = open(path, 'wb', 1 << 20)
+    self.outfile.write(HEADER.pack(MAGIC, VERSION))
+    self.index = {}
+
+  def points(self, points):
+    self.index = dict((p, i) for (i, p) in enumerate(points))
+    self.outfile.write(_TYPE.pack(POINTS) + _COUNT.pack(len(points)))
+    self.outfile.write(struct.pack('<{}d'.format(2 * len(points)), *[c for p in points for c in p]))
+
+  def cellsCleared(self):
+    self.outfile.write(_TYPE.pack(CELLS_CLEARED))
+
+  def cellStarted(self, site):
+    self.outfile.write(_INDEX.pack(CELL_STARTED, self.index[site]))
+
+  def bisectorApplied(self, other):
+    self.outfile.write(_INDEX.pack(BISECTOR_APPLIED, self.index[other]))
+
+  def polygonUpdated(self, vertices):
+    self.outfile.write(_VERTICES.pack(POLYGON_UPDATED, len(vertices)))
+    self.outfile.write(struct.pack('<{}f'.format(2 * len(vertices)), *[c for v in vertices for c in v]))
+
+  def cellFinished(self):
+    self.outfile.write(_TYPE.pack(CELL_FINISHED))
+
+  def _segment(self, kind, (a, b)):
+    self.outfile.write(_PAIR.pack(kind, self.index[a], self.index[b]))
+
+  def segmentConsidered(self, segment):
+    self._segment(SEGMENT_CONSIDERED, segment)
+
+  def segmentAccepted(self, segment):
+    self._segment(SEGMENT_ACCEPTED, segment)
+
+  def segmentRejected(self, segment):
+    self._segment(SEGMENT_REJECTED, segment)
+
+  def segmentInvalidated(self, segment):
+    self._segment(SEGMENT_INVALIDATED, segment)
+
+  def close(self):
+    self.outfile.close()
+
+class Cell (object):
+  """The parts of mapgen2.Shape which the renderers draw"""
+  def __init__(self, core, vertices):
+    self.core = core
+    self.vertices = vertices
+
+class Replay (object):
+  """The state of a recorded run, after any number of its events
+
+  The lists here stand in for the generators' own, so their renderers can draw
+  them: points, shapes (finished cells), and the accepted, invalidated,
+  neverValid (rejected) and highlighted segments. They are only ever changed in
+  place. activeShape, activePoint and consideringPoint are the cell being
+  clipped and the points it is being clipped between.
+
+  A snapshot of the state is kept every KEYFRAME_INTERVAL events, so seeking
+  backwards only replays the events since the nearest one.
+  """
+
+  KEYFRAME_INTERVAL = 100000
+
+  def __init__(self, path):
+    with open(path, 'rb') as infile:
+      self.data = infile.read()
+    if len(self.data) < HEADER.size or HEADER.unpack_from(self.data)[0] != MAGIC:
+      raise ValueError("{} is not an event log".format(path))
+    if HEADER.unpack_from(self.data)[1] != VERSION:
+      raise ValueError("{} is not a version {} event log".format(path, VERSION))
+
+    self.points = []
+    self.shapes = []
+    self.accepted = []
+    self.invalidated = []
+    self.neverValid = []
+    self.highlighted = []
+    self.keyframes = []
+    self.pointsChanged = False
+    self._restart()
+
+  def _restart(self):
+    self.position = 0
+    self.offset = HEADER.size
+    for state in self._lists():
+      del state[:]
+    self.activeShape = self.activePoint = self.consideringPoint = None
+    self.pointsChanged = True
+
+  def _lists(self):
+    return [self.points, self.shapes, self.accepted, self.invalidated, self.neverValid, self.highlighted]
+
+  @property
+  def finished(self):
+    return self.offset >= len(self.data)
+
+  def seek(self, position):
+    """Move to just after the first `position` events (or to the end of the
+    log, if there are fewer)
+    """
+    position = max(0, position)
+    if position < self.position:
+      earlier = [frame for frame in self.keyframes if frame[0] <= position]
+      if earlier:
+        self._restore(earlier[-1])
+      else:
+        self._restart()
+    while self.position < position and not self.finished:
+      if self.position == len(self.keyframes) * self.KEYFRAME_INTERVAL:
+        self.keyframes.append(self._snapshot())
+      self._apply()
+
+  # Finished cells never change again, but the active one does, so keyframes
+  # keep a copy of it, and hand out copies of that
+
+  def _snapshot(self):
+    active = self.activeShape and Cell(self.activeShape.core, self.activeShape.vertices)
+    return (self.position, self.offset, [list(state) for state in self._lists()],
+            active, self.activePoint, self.consideringPoint)
+
+  def _restore(self, (position, offset, lists, active, activePoint, consideringPoint)):
+    (self.position, self.offset) = (position, offset)
+    for (state, saved) in zip(self._lists(), lists):
+      state[:] = saved
+    self.activeShape = active and Cell(active.core, active.vertices)
+    (self.activePoint, self.consideringPoint) = (activePoint, consideringPoint)
+    self.pointsChanged = True
+
+  def _apply(self):
+    data = self.data
+    offset = self.offset
+    (kind,) = _TYPE.unpack_from(data, offset)
+    offset += _TYPE.size
+
+    if kind == POINTS:
+      (n,) = _COUNT.unpack_from(data, offset)
+      offset += _COUNT.size
+      coords = struct.unpack_from('<{}d'.format(2 * n), data, offset)
+      offset += 16 * n
+      self.points[:] = zip(coords[0::2], coords[1::2])
+      self.pointsChanged = True
+    elif kind == CELLS_CLEARED:
+      del self.shapes[:]
+      self.activeShape = self.activePoint = self.consideringPoint = None
+    elif kind in (CELL_STARTED, BISECTOR_APPLIED):
+      (index,) = _COUNT.unpack_from(data, offset)
+      offset += _COUNT.size
+      if kind == CELL_STARTED:
+        self.activePoint = self.points[index]
+        self.activeShape = Cell(self.activePoint, UNIT_SQUARE)
+        self.consideringPoint = None
+      else:
+        self.consideringPoint = self.points[index]
+    elif kind == POLYGON_UPDATED:
+      (n,) = struct.unpack_from('<H', data, offset)
+      offset += 2
+      coords = struct.unpack_from('<{}f'.format(2 * n), data, offset)
+      offset += 8 * n
+      self.activeShape.vertices = zip(coords[0::2], coords[1::2])
+    elif kind == CELL_FINISHED:
+      self.shapes.append(self.activeShape)
+    elif kind in SEGMENT_EVENTS:
+      (i, j) = struct.unpack_from('<II', data, offset)
+      offset += 8
+      segment = (self.points[i], self.points[j])
+      if kind == SEGMENT_CONSIDERED:
+        self.highlighted[:] = [segment]
+      elif kind == SEGMENT_ACCEPTED:
+        self.accepted.append(segment)
+      elif kind == SEGMENT_REJECTED:
+        self.neverValid.append(segment)
+      else:
+        self.accepted.remove(segment)
+        self.invalidated.append(segment)
+    else:
+      raise ValueError("Unknown event type {} at byte {}".format(kind, self.offset))
+
+    self.offset = offset
+    self.position += 1
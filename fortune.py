@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Fortune's sweep-line algorithm for Voronoi diagrams
+
+The sweep line moves in the +y direction. Behind it, the "beach line" is made of
+parabolic arcs, one per site whose region is still growing, ordered by x.
+Neighboring arcs meet at breakpoints which trace out the Voronoi edges, so every
+pair of sites that is ever adjacent on the beach line shares an edge.
+
+This module only records which sites share an edge. Clipping each site's cell
+against its neighbors' bisectors (see geometry.cutShape) then yields exactly the
+same cell as clipping it against every other site, in O(n log n) overall.
+"""
+
+import heapq
+import math
+import random
+from fractions import Fraction
+
+from predicates import circumcenter, circumcenterExact, orient2d
+
+SITE_EVENT = 0
+CIRCLE_EVENT = 1
+
+class Arc (object):
+  """An arc of the beach line. Also a node of the treap which orders them"""
+  __slots__ = ('site', 'prev', 'next', 'left', 'right', 'parent', 'priority', 'event')
+
+  def __init__(self, site):
+    self.site = site
+    self.prev = self.next = None
+    self.left = self.right = self.parent = None
+    self.priority = 0.0   # Set by BeachLine.insertAfter
+    self.event = None
+
+class BeachLine (object):
+  """Treap of arcs, kept in the same order as their prev/next links"""
+
+  def __init__(self):
+    self.root = None
+    # Its own generator, so building a diagram doesn't draw from (and shift) the
+    # module-level one which --seed seeds
+    self._random = random.Random(0)
+
+  def _rotateUp(self, node):
+    parent = node.parent
+    grandparent = parent.parent
+    if parent.left is node:
+      parent.left = node.right
+      if node.right: node.right.parent = parent
+      node.right = parent
+    else:
+      parent.right = node.left
+      if node.left: node.left.parent = parent
+      node.left = parent
+    parent.parent = node
+    node.parent = grandparent
+    if grandparent is None:
+      self.root = node
+    elif grandparent.left is parent:
+      grandparent.left = node
+    else:
+      grandparent.right = node
+
+  def insertAfter(self, existing, node):
+    """Insert `node` immediately after `existing` (or as the only arc, if None)"""
+    node.priority = self._random.random()
+    if existing is None:
+      self.root = node
+      return
+    if existing.right is None:
+      existing.right = node
+      node.parent = existing
+    else:
+      successor = existing.next
+      successor.left = node
+      node.parent = successor
+
+    node.prev = existing
+    node.next = existing.next
+    if existing.next: existing.next.prev = node
+    existing.next = node
+
+    while node.parent is not None and node.parent.priority < node.priority:
+      self._rotateUp(node)
+
+  def remove(self, node):
+    while node.left is not None or node.right is not None:
+      if node.right is None or (node.left is not None and
+                                node.left.priority > node.right.priority):
+        self._rotateUp(node.left)
+      else:
+        self._rotateUp(node.right)
+    if node.parent is None:
+      self.root = None
+    elif node.parent.left is node:
+      node.parent.left = None
+    else:
+      node.parent.right = None
+
+    if node.prev: node.prev.next = node.next
+    if node.next: node.next.prev = node.prev
+    node.parent = node.prev = node.next = None
+
+def breakpoint((ax, ay), (bx, by), directrix):
+  """x-coordinate where the arc of site a meets the arc of site b on its right"""
+  if ay == by:
+    return (ax + bx) * 0.5
+  if ay == directrix:
+    return ax
+  if by == directrix:
+    return bx
+
+  # Each arc is the set of points as far from its site as from the sweep line.
+  # Relative to a, with pa and pb the (negative) heights of the sites above the
+  # sweep line, the two arcs meet where
+  #
+  #   dy * u^2 + 2 * pa * dx * u - pa * (dx^2 + pb * dy) = 0
+  #
+  # whose discriminant is 4 * pa * pb * |b - a|^2. Writing the arcs out in
+  # absolute coordinates instead (y = ((x - sx)^2 + sy^2 - d^2) / 2(sy - d))
+  # loses every significant digit when the sites are close together.
+  #
+  # The site nearer the sweep line has the narrower arc, which only shows
+  # between the two intersections: if a is the narrower arc (dy < 0) its right
+  # edge is the larger root, and otherwise b's left edge is the smaller one.
+  # Either way, that's the root with -sqrt(discriminant) on top, which is worked
+  # out in whichever of its two forms doesn't subtract nearly equal numbers.
+  pa = ay - directrix
+  pb = by - directrix
+  dx = bx - ax
+  dy = by - ay
+  root = math.sqrt(pa * pb * (dx*dx + dy*dy))
+  if dx > 0:
+    return ax + pa * (dx*dx + pb * dy) / (pa * dx - root)
+  return ax - (pa * dx + root) / dy
+
+# Bound on the rounding error of breakpoint(), relative to |ax| + |bx| + |x|
+# for the x it returns. The worst seen on random, near-coincident and
+# near-directrix sites is about 4e-16; this leaves a wide margin.
+BREAKPOINT_ERROR = 2.0 ** -40
+
+def breakpointSide(x, a, b, directrix):
+  """Which side of breakpoint(a, b, directrix) x is on: negative if left,
+  positive if right and zero if exactly on it. Like the predicates in
+  predicates.py, the sign is always right: when x is too close to the rounded
+  breakpoint to tell, it's worked out exactly.
+  """
+  edge = breakpoint(a, b, directrix)
+  side = x - edge
+  if abs(side) > BREAKPOINT_ERROR * (abs(a[0]) + abs(b[0]) + abs(edge)):
+    return side
+  return _breakpointSideExactly(x, a, b, directrix)
+
+def _breakpointSideExactly(x, (ax, ay), (bx, by), directrix):
+  (x, ax, ay, bx, by, directrix) = map(Fraction, (x, ax, ay, bx, by, directrix))
+  if ay == by:
+    return _sign(2 * x - ax - bx)
+  if ay == directrix:
+    return _sign(x - ax)
+  if by == directrix:
+    return _sign(x - bx)
+
+  # The breakpoint is a root of the quadratic q(u) in breakpoint(), at
+  # u = x - ax: the larger root if dy < 0, where q opens downward, and the
+  # smaller if dy > 0. Which side of it u is on follows from the sign of q(u)
+  # and which side of q's vertex, at -pa * dx / dy, u is on.
+  pa = ay - directrix
+  pb = by - directrix
+  dx = bx - ax
+  dy = by - ay
+  u = x - ax
+  q = dy * u * u + 2 * pa * dx * u - pa * (dx * dx + pb * dy)
+  beforeVertex = u * dy < -pa * dx if dy > 0 else u * dy > -pa * dx
+  if dy < 0:
+    # Left of the larger root: between the roots (q > 0) or before both
+    return -1.0 if q > 0 or beforeVertex else 0.0 if q == 0 else 1.0
+  else:
+    # Left of the smaller root: outside the roots (q > 0) and before both
+    return -1.0 if q > 0 and beforeVertex else 0.0 if q == 0 and beforeVertex else 1.0
+
+def _sign(value):
+  return 1.0 if value > 0 else -1.0 if value < 0 else 0.0
+
+def circleEvent(a, b, c):
+  """Where the sweep line is when the middle of three consecutive arcs vanishes
+
+  Return: (y, x) of the event, or None if the arcs' breakpoints diverge
+  """
+  # The middle arc only shrinks to nothing if a, b, c turn counterclockwise
+  # (in y-up coordinates).
+  if orient2d(a, b, c) <= 0:
+    return None
+
+  # Slivers, which nearly coincident sites make plenty of, have circumcenters
+  # too far off in floating point to order the events by
+  center = circumcenter(a, b, c)
+  (ux, uy) = center if center is not None else map(float, circumcenterExact(a, b, c))
+  radius = math.hypot(a[0] - ux, a[1] - uy)
+  return (uy + radius, ux)
+
+def voronoiNeighbors(points):
+  """Find the Voronoi neighbors of every point
+
+  Parameters: A list of (x, y) points
+
+  Return: A list parallel to `points`, where each entry is a sorted list of the
+    indices of the points whose Voronoi cells share an edge with that point's.
+    Duplicate points are given the same neighbors as their first occurrence.
+  """
+  neighbors = [set() for p in points]
+  beach = BeachLine()
+  events = []
+  counter = [0]
+
+  def link(i, j):
+    if i != j:
+      neighbors[i].add(j)
+      neighbors[j].add(i)
+
+  def checkCircle(arc):
+    if arc.event is not None:
+      arc.event[-1] = False
+      arc.event = None
+    if arc.prev is None or arc.next is None:
+      return
+    circle = circleEvent(points[arc.prev.site], points[arc.site], points[arc.next.site])
+    if circle is not None:
+      counter[0] += 1
+      arc.event = [circle[0], circle[1], counter[0], CIRCLE_EVENT, arc, True]
+      heapq.heappush(events, arc.event)
+
+  # Sites are processed in (y, x) order. Exact duplicates are set aside.
+  order = sorted(range(len(points)), key=lambda i: (points[i][1], points[i][0]))
+  duplicates = []
+  for (k, index) in enumerate(order):
+    if k and tuple(points[index]) == tuple(points[order[k-1]]):
+      duplicates.append((index, order[k-1]))
+    else:
+      events.append([points[index][1], points[index][0], -1, SITE_EVENT, index, True])
+  heapq.heapify(events)
+
+  while events:
+    event = heapq.heappop(events)
+    directrix, x, _, kind, data, valid = event
+    if not valid:
+      continue
+
+    if kind == SITE_EVENT:
+      site = Arc(data)
+      if beach.root is None:
+        beach.insertAfter(None, site)
+        continue
+
+      # Find the arc directly above the new site
+      arc = beach.root
+      while True:
+        if (arc.left is not None and
+            breakpointSide(x, points[arc.prev.site], points[arc.site], directrix) < 0):
+          arc = arc.left
+        elif (arc.right is not None and
+              breakpointSide(x, points[arc.site], points[arc.next.site], directrix) > 0):
+          arc = arc.right
+        else:
+          break
+
+      link(arc.site, data)
+      if points[arc.site][1] == directrix:
+        # Only happens for the first row of sites, which all share the lowest
+        # y: their "arcs" are vertical rays, so the new one just goes beside it.
+        beach.insertAfter(arc, site)
+        continue
+
+      # Split the arc in two, with the new site's arc in the middle
+      beach.insertAfter(arc, site)
+      beach.insertAfter(site, Arc(arc.site))
+      checkCircle(arc)
+      checkCircle(site.next)
+
+    else:
+      arc = data
+      left, right = arc.prev, arc.next
+      arc.event = None
+      beach.remove(arc)
+      link(left.site, right.site)
+      checkCircle(left)
+      checkCircle(right)
+
+  for (index, original) in duplicates:
+    neighbors[index] = neighbors[original]
+
+  return [sorted(n) for n in neighbors]
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from debug import *
+import predicates
+from predicates import ORIENT_ERROR, lineSideExact, orient2d
 
 NaN = float('NaN')
 
@@ -67,22 +69,23 @@ def intersection (((a0x, a0y), (a1x, a1y)), ((b0x, b0y), (b1x, b1y))):
 
   return ta, tb
 
-assertEqual(intersection( ((1,1),(2,2)), ((2,1),(1,2)) ), (0.5,0.5))
-assertEqual(intersection( ((3,1),(3,4)), ((1,2),(4,2)) ), (1.0/3,2.0/3))
-
-
+@profile
 def segmentsIntersect ((a1, b1), (a2, b2)):
+  """Whether two segments cross or touch. Segments which share an endpoint
+  don't count, and neither do parallel ones, even if they overlap.
+
+  Decided exactly, by which side of each segment the other's endpoints are on
+  (see predicates.py), rather than by rounding intersection()'s answer.
+  """
   if a1 == a2 or a1 == b2 or b1 == a2 or b1 == b2:
     return False
-  t1, t2 = intersection((a1, b1), (a2, b2))
-  return 0 <= t1 and t1 <= 1 and 0 <= t2 and t2 <= 1
-
-assert(segmentsIntersect( ((1,1),(2,2)), ((2,1),(1,2)) ))
-assert(segmentsIntersect( ((3,1),(3,4)), ((1,2),(4,2)) ))
-assert(not segmentsIntersect( ((1,1),(1,2)), ((2,1),(2,2)) ))
-assert(not segmentsIntersect( ((2,2),(3,3)), ((2,1),(1,2)) ))
-assert(not segmentsIntersect( ((1,1),(1,2)), ((1,1),(2,1)) ))
-
+  o1 = orient2d(a1, b1, a2)
+  o2 = orient2d(a1, b1, b2)
+  if (o1 > 0 and o2 > 0) or (o1 < 0 and o2 < 0) or (o1 == 0 and o2 == 0):
+    return False
+  o3 = orient2d(a2, b2, a1)
+  o4 = orient2d(a2, b2, b1)
+  return not ((o3 > 0 and o4 > 0) or (o3 < 0 and o4 < 0))
 
 def segmentCompare(((a1x, a1y), (b1x, b1y)), ((a2x, a2y), (b2x, b2y))):
   d1x = a1x - b1x
@@ -91,10 +94,6 @@ def segmentCompare(((a1x, a1y), (b1x, b1y)), ((a2x, a2y), (b2x, b2y))):
   d2y = a2y - b2y
   return cmp(d1x*d1x + d1y*d1y, d2x*d2x + d2y*d2y)
 
-assert(segmentCompare( ((1,1),(2,2)), ((2,1),(1,2)) ) == 0)
-assert(segmentCompare( ((1,1),(3,3)), ((2,1),(1,2)) ) > 0)
-assert(segmentCompare( ((1,1),(3,3)), ((1,4),(4,1)) ) < 0)
-
 @profile
 def interpolateSegment(((x1, y1), (x2, y2)), t):
   return (x1 * (1-t) + x2 * t), (y1 * (1-t) + y2 * t)
@@ -198,11 +197,6 @@ def perpendicularBisector((x1, y1), (x2, y2), ((xmin, xmax),(ymin,ymax))=((0,1),
 def segmentsEquivalent((p1, p2), (q1, q2)):
   return (p1 == q1 and p2 == q2) or (p1 == q2 and p2 == q1)
 
-assert(segmentsEquivalent( perpendicularBisector((0,0),(1,1)), ((1,0), (0,1)) ))
-assert(segmentsEquivalent( perpendicularBisector((1,1),(0,0)), ((1,0), (0,1)) ))
-assert(segmentsEquivalent( perpendicularBisector((1,0),(0,1)), ((1,1), (0,0)) ))
-assert(segmentsEquivalent( perpendicularBisector((0,1),(1,0)), ((1,1), (0,0)) ))
-
 def vecAdd(a, b):
   if type(a) is float or type(a) is int:
     if type(b) is float or type(b) is int:
@@ -215,11 +209,6 @@ def vecAdd(a, b):
     else:
       return (a[0] + b[0], a[1] + b[1])
 
-assertEqual(vecAdd(3,4), 7)
-assertEqual(vecAdd(3,(2,4)), (5,7))
-assertEqual(vecAdd((3,5),7), (10,12))
-assertEqual(vecAdd((3,5),(7,11)), (10,16))
-
 def vecSubtract(a, b):
   if type(a) is float or type(a) is int:
     if type(b) is float or type(b) is int:
@@ -232,11 +221,6 @@ def vecSubtract(a, b):
     else:
       return (a[0] - b[0], a[1] - b[1])
 
-assertEqual(vecSubtract(3,4), -1)
-assertEqual(vecSubtract(3,(2,4)), (1,-1))
-assertEqual(vecSubtract((3,5),7), (-4,-2))
-assertEqual(vecSubtract((3,5),(7,11)), (-4,-6))
-
 def vecMultiply(a, b):
   if type(a) is float or type(a) is int:
     if type(b) is float or type(b) is int:
@@ -249,17 +233,10 @@ def vecMultiply(a, b):
     else:
       return (a[0] * b[0], a[1] * b[1])
 
-assertEqual(vecMultiply(3,4), 12)
-assertEqual(vecMultiply(3,(2,4)), (6,12))
-assertEqual(vecMultiply((3,5),7), (21,35))
-assertEqual(vecMultiply((3,5),(7,11)), (21,55))
-
 @debug
 def vecSum(vectors):
   return tuple(( sum(components) for components in zip(*vectors) ))
 
-assertEqual(vecSum([(1,2),(3,4),(10,20)]), (14,26))
-
 @debug
 def crossProduct((x1, y1), (x2, y2)):
   #                                 ⎛⎡ i   j   k ⎤⎞
@@ -274,6 +251,27 @@ def crossProduct((x1, y1), (x2, y2)):
   #
   return x1 * y2 - x2 * y1
 
+def polygonCentroid(vertices):
+  """Area-weighted centroid of a simple polygon
+
+  The polygon is split into a fan of triangles around its first vertex, and the
+  triangles' centroids are averaged, weighted by their signed areas. Working
+  relative to the first vertex keeps the cross products small and accurate.
+  A polygon with no area falls back to the mean of its vertices.
+  """
+  (x0, y0) = vertices[0]
+  area = sumX = sumY = 0.0
+  for index in range(1, len(vertices) - 1):
+    (x1, y1) = (vertices[index][0] - x0, vertices[index][1] - y0)
+    (x2, y2) = (vertices[index+1][0] - x0, vertices[index+1][1] - y0)
+    cross = x1 * y2 - x2 * y1
+    area += cross
+    sumX += (x1 + x2) * cross
+    sumY += (y1 + y2) * cross
+  if area == 0:
+    return tuple(float(sum(components)) / len(vertices) for components in zip(*vertices))
+  return (x0 + sumX / (3 * area), y0 + sumY / (3 * area))
+
 def slice(segment1, segment2, point):
   t1, t2 = intersection(segment1, segment2)
   intersect = interpolate(segment1, t1)
@@ -345,38 +343,87 @@ def segmentAndLineIntersection(((x0, y0),(x1, y1)), (xc, yc), (mx, my)):
   else:
     return numerator / float(denominator)
 
-assertEqual(segmentAndLineIntersection( ((0,0),(1,0)), (0.5,1), (0,1) ),  0.5)
-assertEqual(segmentAndLineIntersection( ((0,0),(0,1)), (1,0.5), (1,0) ),  0.5)
-assertEqual(segmentAndLineIntersection( ((0,0),(1,1)), (1,0), (1,0) ),    0.0)
-assertEqual(segmentAndLineIntersection( ((0,0),(1,1)), (1,0), (0,1) ),    1.0)
-assertEqual(str(segmentAndLineIntersection( ((0,0),(1,0)), (0,1), (1,0) )), str(NaN))
-assertEqual(segmentAndLineIntersection( ((0,0),(1,0)), (0.5,0.5), (1,2) ),0.25)
-assertEqual(segmentAndLineIntersection( ((1,1),(2,3)), (2,2), (1,0) ),    0.5)
-assertEqual(segmentAndLineIntersection( ((1,1),(2,3)), (2,1), (1,-2) ),   0.5)
-assertEqual(segmentAndLineIntersection( ((0,4),(4,0)), (0,0), (1,1) ),    0.5)
+def _cutExactly(center, vertices, midpoint, slopeVector):
+  """cutShape() for when rounding could have put a vertex on the wrong side of
+  the line: each vertex is assigned to a side exactly (see predicates.py), and
+  the vertices on the far side from the center are replaced by the points where
+  the line crosses the edges leading to and from them
+  """
+  if slopeVector[0] == 0 and slopeVector[1] == 0:
+    return vertices
+  sides = [lineSideExact(midpoint, slopeVector, vertex) for vertex in vertices]
+  # Only a midpoint rounded onto one of two nearly coincident points can put the
+  # center exactly on the line. It belongs on the positive side then, as p does
+  # when the line is the bisector of p and q with slopeVector (dy, -dx) for
+  # q - p = (dx, dy), as everything here works it out.
+  keep = lineSideExact(midpoint, slopeVector, center) or 1
+  if all(side * keep >= 0 for side in sides):
+    # The line misses the shape, or only touches it
+    return vertices
+
+  result = []
+  for index in range(len(vertices)):
+    following = index + 1 if index + 1 < len(vertices) else 0
+    (start, end) = (vertices[index], vertices[following])
+    (startSide, endSide) = (sides[index], sides[following])
+    if startSide * keep >= 0:
+      result.append(start)
+    if startSide * endSide < 0:
+      # Worked out exactly, t is strictly between 0 and 1, so rounding it
+      # can't move the intercept off the edge
+      intercept = interpolateSegment((start, end), float(startSide / (startSide - endSide)))
+      if not result or intercept != result[-1]:
+        result.append(intercept)
+  if len(result) > 1 and result[0] == result[-1]:
+    result.pop()
+  return result
 
 @profile
 def cutShape(center, vertices, midpoint, slopeVector):
+  """Cut a convex shape along a line, keeping the part on the same side as
+  `center`
 
-  class Object (object):
-    def __init__(self, **kwargs):
-      self.__dict__.update(kwargs)
-    def __repr__(self):
-      return repr(self.__dict__)
+  Parameters:
+    center -- A point inside the shape
+    vertices -- The shape's vertices, counterclockwise
+    midpoint, slopeVector -- A point on the line and its direction, as
+      segmentAndLineIntersection() takes them. A zero slopeVector (the bisector
+      of a point and itself) leaves the shape unchanged. If center is exactly
+      on the line, the part on its positive side (see predicates.lineSide) is
+      kept.
+
+  Return: The new list of vertices, or `vertices` itself if the line misses
+  """
+  (xc, yc) = midpoint
+  (mx, my) = slopeVector
+  n = len(vertices)
 
+  # segmentAndLineIntersection() with each edge, inlined. Its numerator tells
+  # which side of the line the edge starts on; none of them may be close enough
+  # to zero for rounding to have changed its sign.
   intersections = []
-  for index in range(len(vertices)):
-    start = vertices[index]
-    end   = vertices[index + 1] if index + 1 < len(vertices) else vertices[0]
-    t = segmentAndLineIntersection((start, end), midpoint, slopeVector)
-
-    if t >= 0 and t <= 1:
-      intercept = interpolateSegment((start, end), t)
-      intersections.append(Object(
-        intercept=intercept,
-        startIndex=index,
-        endIndex=index + 1,
-      ))
+  sides = []
+  for index in range(n):
+    (x0, y0) = vertices[index]
+    (x1, y1) = vertices[index + 1] if index + 1 < n else vertices[0]
+    left = my * (x0 - xc)
+    right = mx * (y0 - yc)
+    numerator = left - right
+    if not abs(numerator) > ORIENT_ERROR * (abs(left) + abs(right)):
+      return _cutExactly(center, vertices, midpoint, slopeVector)
+    sides.append(numerator > 0)
+    denominator = my * (x0 - x1) - mx * (y0 - y1)
+    if denominator != 0:
+      t = numerator / float(denominator)
+      if t >= 0 and t <= 1:
+        # interpolateSegment()
+        intersections.append((index, (x0 * (1-t) + x1 * t, y0 * (1-t) + y1 * t)))
+
+  # The edges found to be crossed must also be exactly those whose ends are on
+  # opposite sides
+  crossed = [index for index in range(n) if sides[index] != sides[index + 1 if index + 1 < n else 0]]
+  if crossed != [index for (index, intercept) in intersections]:
+    return _cutExactly(center, vertices, midpoint, slopeVector)
 
   def circularSlice(list, start, end):
     return (list[start:end+1] if (end >= start) else
@@ -388,39 +435,115 @@ def cutShape(center, vertices, midpoint, slopeVector):
     # Shape is returned unchanged
     return vertices
   elif len(intersections) == 2:
-    # Determine the relative order of the intersections relative to the center
-    # using the cross product. The right-hand rule says that the cross product
-    # will be positive if the LHS vector is clockwise relative to the RHS vector
+    # Determine the relative order of the intersections relative to the center.
+    # Going counterclockwise, the part of the shape which is kept runs from the
+    # counterclockwise intersection to the clockwise one, so the edge crossed
+    # at the clockwise intersection is the one which starts on the center's
+    # side of the line. (Telling them apart with the cross product of the
+    # intersections relative to the center gets it wrong when they're nearly
+    # on top of each other.)
     #
-    #   counterclockwise     
-    #       \▄▀▄   ↺         
-    #      ▄▀\↖ ▀▄           
-    #    ▄▀ ↓ \   ▀▄         
-    #   █   ↓ ↺\    █        
-    #    █  X↘  \↖ █         
-    #     █     ↘\█    ↻     
+    #   counterclockwise
+    #       \▄▀▄   ↺
+    #      ▄▀\↖ ▀▄
+    #    ▄▀ ↓ \   ▀▄
+    #   █   ↓ ↺\    █
+    #    █  X↘  \↖ █
+    #     █     ↘\█    ↻
     #      █▄▄▄▄▄█\ clockwise
     #
-    (clockwise, counterclockwise) = (
+    (x, y) = center
+    left = my * (x - xc)
+    right = mx * (y - yc)
+    numerator = left - right
+    if not abs(numerator) > ORIENT_ERROR * (abs(left) + abs(right)):
+      return _cutExactly(center, vertices, midpoint, slopeVector)
+    ((cwIndex, clockwise), (ccwIndex, counterclockwise)) = (
       (intersections[0], intersections[1])
-      if crossProduct(
-        vecSubtract(intersections[0].intercept, center),
-        vecSubtract(intersections[1].intercept, center)) > 0
+      if sides[intersections[0][0]] == (numerator > 0)
       else (intersections[1], intersections[0])
     )
 
     return (
-      [counterclockwise.intercept] +
-      circularSlice(vertices, counterclockwise.endIndex, clockwise.startIndex) +
-      [clockwise.intercept]
+      [counterclockwise] +
+      circularSlice(vertices, ccwIndex + 1, cwIndex) +
+      [clockwise]
     )
 
   else:
-    assert False, (
-      ("Somehow, line @ position {}, slope {} intersects " +
-      "supposedly-convex shape {} in {} places:\n{}").format(
-        midpoint, slopeVector, vertices, len(intersections), intersections
-      )
-    )
+    # Only a shape which isn't quite convex can be crossed more than twice
+    return _cutExactly(center, vertices, midpoint, slopeVector)
 
+def cutBisector(p, vertices, q):
+  """Cut the cell around p by its perpendicular bisector with q, keeping p's
+  side; cutShape() with the bisector worked out as mapgen2.py does it, so the
+  results are the same to the last bit
 
+  Return: The new list of vertices, or `vertices` itself if the bisector misses
+  """
+  # Midpoint and slope of perpendicular bisector
+  midpoint = ((p[0] + q[0]) / 2.0, (p[1] + q[1]) / 2.0)
+  slope    = (q[1] - p[1], -(q[0] - p[0])) # 90-degree counterclockwise rotation
+  return cutShape(p, vertices, midpoint, slope)
+
+def selfcheck():
+  """Check the routines here against a few known answers"""
+  assertEqual(intersection( ((1,1),(2,2)), ((2,1),(1,2)) ), (0.5,0.5))
+  assertEqual(intersection( ((3,1),(3,4)), ((1,2),(4,2)) ), (1.0/3,2.0/3))
+
+  assert(segmentsIntersect( ((1,1),(2,2)), ((2,1),(1,2)) ))
+  assert(segmentsIntersect( ((3,1),(3,4)), ((1,2),(4,2)) ))
+  assert(not segmentsIntersect( ((1,1),(1,2)), ((2,1),(2,2)) ))
+  assert(not segmentsIntersect( ((2,2),(3,3)), ((2,1),(1,2)) ))
+  assert(not segmentsIntersect( ((1,1),(1,2)), ((1,1),(2,1)) ))
+
+  assert(segmentCompare( ((1,1),(2,2)), ((2,1),(1,2)) ) == 0)
+  assert(segmentCompare( ((1,1),(3,3)), ((2,1),(1,2)) ) > 0)
+  assert(segmentCompare( ((1,1),(3,3)), ((1,4),(4,1)) ) < 0)
+
+  assert(segmentsEquivalent( perpendicularBisector((0,0),(1,1)), ((1,0), (0,1)) ))
+  assert(segmentsEquivalent( perpendicularBisector((1,1),(0,0)), ((1,0), (0,1)) ))
+  assert(segmentsEquivalent( perpendicularBisector((1,0),(0,1)), ((1,1), (0,0)) ))
+  assert(segmentsEquivalent( perpendicularBisector((0,1),(1,0)), ((1,1), (0,0)) ))
+
+  assertEqual(vecAdd(3,4), 7)
+  assertEqual(vecAdd(3,(2,4)), (5,7))
+  assertEqual(vecAdd((3,5),7), (10,12))
+  assertEqual(vecAdd((3,5),(7,11)), (10,16))
+
+  assertEqual(vecSubtract(3,4), -1)
+  assertEqual(vecSubtract(3,(2,4)), (1,-1))
+  assertEqual(vecSubtract((3,5),7), (-4,-2))
+  assertEqual(vecSubtract((3,5),(7,11)), (-4,-6))
+
+  assertEqual(vecMultiply(3,4), 12)
+  assertEqual(vecMultiply(3,(2,4)), (6,12))
+  assertEqual(vecMultiply((3,5),7), (21,35))
+  assertEqual(vecMultiply((3,5),(7,11)), (21,55))
+
+  assertEqual(vecSum([(1,2),(3,4),(10,20)]), (14,26))
+
+  assertEqual(polygonCentroid([(0,0), (2,0), (2,2), (0,2)]), (1.0,1.0))
+  assertEqual(polygonCentroid([(0,0), (0,3), (3,0)]), (1.0,1.0))
+  assertEqual(polygonCentroid([(0,0), (1,1), (2,2)]), (1.0,1.0))
+
+  assertEqual(segmentAndLineIntersection( ((0,0),(1,0)), (0.5,1), (0,1) ),  0.5)
+  assertEqual(segmentAndLineIntersection( ((0,0),(0,1)), (1,0.5), (1,0) ),  0.5)
+  assertEqual(segmentAndLineIntersection( ((0,0),(1,1)), (1,0), (1,0) ),    0.0)
+  assertEqual(segmentAndLineIntersection( ((0,0),(1,1)), (1,0), (0,1) ),    1.0)
+  assertEqual(str(segmentAndLineIntersection( ((0,0),(1,0)), (0,1), (1,0) )), str(NaN))
+  assertEqual(segmentAndLineIntersection( ((0,0),(1,0)), (0.5,0.5), (1,2) ),0.25)
+  assertEqual(segmentAndLineIntersection( ((1,1),(2,3)), (2,2), (1,0) ),    0.5)
+  assertEqual(segmentAndLineIntersection( ((1,1),(2,3)), (2,1), (1,-2) ),   0.5)
+  assertEqual(segmentAndLineIntersection( ((0,4),(4,0)), (0,0), (1,1) ),    0.5)
+
+  # Degenerate cases which plain floating point gets wrong
+  predicates.selfcheck()
+  assert(not segmentsIntersect( ((0,0),(1,1)), ((2,2),(3,3)) ))
+  assert(not segmentsIntersect( ((0,0),(2,2)), ((1,1),(3,3)) ))
+  assert(segmentsIntersect( ((0,0),(2,2)), ((1,1),(3,0)) ))
+  square = [(0,0), (1,0), (1,1), (0,1)]
+  assertEqual(cutShape((0.25,0.5), square, (0.5,0.5), (1,1)), [(0,0), (1,1), (0,1)])
+  assertEqual(cutShape((0.75,0.5), square, (0.5,0.5), (1,1)), [(0,0), (1,0), (1,1)])
+  assert(cutShape((0.5,0.5), square, (0.5,0.5), (0,0)) is square)
+  assert(cutShape((0.5,0.5), square, (1,1), (1,-1)) is square)
@@ -3,14 +3,32 @@ import sys
 
 from debug import *
 
-MAIN = sys.modules['__main__']
+# Set by setup()
+_size = None
+_surface = None
+_delay = None
+
+def setup(surface, delay=50):
+  """Draw onto `surface` by default, and pause for `delay` milliseconds in
+  waitForDelay()
+  """
+  global _size, _surface, _delay
+  _surface = surface
+  _size = surface.get_size()
+  _delay = delay
 
 @debug
 def screenCoord(point):
-  return int(point[0] * MAIN.SIZE[0]), int(point[1] * MAIN.SIZE[1])
+  return int(point[0] * _size[0]), int(point[1] * _size[1])
+
+def drawSegment(segment, color, surface=None):
+  """Draw a segment onto `surface` (the screen by default)
 
-def drawSegment(segment, color):
-  pygame.draw.line(MAIN.SURF, color, screenCoord(segment[0]), screenCoord(segment[1]), 2)
+  Return: The rectangle drawn over
+  """
+  if surface is None:
+    surface = _surface
+  return pygame.draw.line(surface, color, screenCoord(segment[0]), screenCoord(segment[1]), 2)
 
 def waitForKey():
   while True:
@@ -23,7 +41,7 @@ def waitForKey():
     pygame.time.wait(100)
 
 def waitForDelay():
-  pygame.time.wait(MAIN.ARGS.delay);
+  pygame.time.wait(_delay);
   for event in pygame.event.get():
     if event.type == pygame.QUIT or \
        (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
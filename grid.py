@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Uniform grid indexes over sets of points (and segments)
+
+The field is divided into divs-by-divs square buckets. Searches start at the
+bucket containing the query point and move outward one ring of buckets at a
+time, so they only ever look at points near the query.
+"""
+
+INFINITY = float('inf')
+
+class PointGrid (object):
+  def __init__(self, points, divs, ((xmin, xmax), (ymin, ymax))=((0,1),(0,1))):
+    self.points = points
+    self.divs = divs
+    self.xmin = xmin
+    self.ymin = ymin
+    self.width = (xmax - xmin) / float(divs)
+    self.height = (ymax - ymin) / float(divs)
+    self.buckets = [[] for i in range(divs * divs)]
+    for (index, point) in enumerate(points):
+      (i, j) = self.bucketOf(point)
+      self.buckets[j * divs + i].append(index)
+
+  def bucketOf(self, (x, y)):
+    """Column and row of the bucket containing (x, y), clamped to the grid"""
+    i = int((x - self.xmin) / self.width)
+    j = int((y - self.ymin) / self.height)
+    last = self.divs - 1
+    return (0 if i < 0 else last if i > last else i,
+            0 if j < 0 else last if j > last else j)
+
+  def ring(self, (i, j), r):
+    """Indices of the points in the buckets exactly r steps from bucket (i, j)"""
+    divs = self.divs
+    buckets = self.buckets
+    if r == 0:
+      return list(buckets[j * divs + i])
+    found = []
+    left, right = i - r, i + r
+    bottom, top = j - r, j + r
+    columns = range(max(left, 0), min(right, divs - 1) + 1)
+    if bottom >= 0:
+      for col in columns:
+        found.extend(buckets[bottom * divs + col])
+    if top < divs:
+      for col in columns:
+        found.extend(buckets[top * divs + col])
+    for row in range(max(bottom + 1, 0), min(top - 1, divs - 1) + 1):
+      if left >= 0:
+        found.extend(buckets[row * divs + left])
+      if right < divs:
+        found.extend(buckets[row * divs + right])
+    return found
+
+  def clearance(self, (x, y), (i, j), r):
+    """Smallest distance from (x, y) to any point outside the rings 0..r around
+    bucket (i, j). Sides of the block which reach the edge of the grid are
+    ignored, since no points lie beyond them.
+    """
+    last = self.divs - 1
+    gaps = []
+    if i - r > 0:
+      gaps.append(x - (self.xmin + (i - r) * self.width))
+    if i + r < last:
+      gaps.append(self.xmin + (i + r + 1) * self.width - x)
+    if j - r > 0:
+      gaps.append(y - (self.ymin + (j - r) * self.height))
+    if j + r < last:
+      gaps.append(self.ymin + (j + r + 1) * self.height - y)
+    return min(gaps) if gaps else INFINITY
+
+  def add(self, index):
+    """Start indexing points[index], which the caller has just set"""
+    (i, j) = self.bucketOf(self.points[index])
+    self.buckets[j * self.divs + i].append(index)
+
+  def remove(self, index):
+    """Stop indexing points[index]; call this before changing or deleting it"""
+    (i, j) = self.bucketOf(self.points[index])
+    self.buckets[j * self.divs + i].remove(index)
+
+  def neighbors(self, shape):
+    """Yield the points which might cut `shape`, the cell around shape.core
+
+    The search grows one ring at a time while the caller clips the shape. Once
+    every unvisited point is at least twice as far from the core as the shape's
+    farthest vertex, none of their bisectors can reach the shape, so the
+    search stops.
+    """
+    points = self.points
+    p = shape.core
+    (px, py) = p
+    bucket = self.bucketOf(p)
+    r = 0
+    while True:
+      for index in self.ring(bucket, r):
+        yield points[index]
+
+      clearance = self.clearance(p, bucket, r)
+      if clearance == INFINITY:
+        return
+      radiusSquared = max(
+        (vx - px) * (vx - px) + (vy - py) * (vy - py)
+        for (vx, vy) in shape.vertices
+      )
+      if clearance * clearance >= 4 * radiusSquared:
+        return
+      r += 1
+
+  def nearest(self, (x, y), k):
+    """Indices of the k points nearest to (x, y), nearest first"""
+    points = self.points
+    bucket = self.bucketOf((x, y))
+    found = []
+    r = 0
+    while True:
+      for index in self.ring(bucket, r):
+        (px, py) = points[index]
+        found.append(((px - x) * (px - x) + (py - y) * (py - y), index))
+      found.sort()
+      del found[k:]
+      # Points in later rings are at least `clearance` away
+      clearance = self.clearance((x, y), bucket, r)
+      if clearance == INFINITY or (len(found) == k and clearance * clearance >= found[-1][0]):
+        return [index for (distance, index) in found]
+      r += 1
+
+class SegmentGrid (object):
+  """Uniform grid index over a growing set of segments
+
+  Each segment is filed under every bucket it passes through, so a crossing test
+  only looks at segments filed under the new segment's buckets.
+  """
+
+  def __init__(self, divs, intersects, ((xmin, xmax), (ymin, ymax))=((0,1),(0,1))):
+    self.divs = divs
+    self.intersects = intersects
+    self.xmin = xmin
+    self.ymin = ymin
+    self.width = (xmax - xmin) / float(divs)
+    self.height = (ymax - ymin) / float(divs)
+    self.buckets = [[] for i in range(divs * divs)]
+    self.segments = []
+
+  def _buckets(self, ((x0, y0), (x1, y1))):
+    # A generator, so a crossing test which succeeds early stops early
+    last = self.divs - 1
+    def clamp(i):
+      return 0 if i < 0 else last if i > last else i
+    def row(y):
+      return (y - self.ymin) / self.height
+    if x1 < x0:
+      (x0, y0, x1, y1) = (x1, y1, x0, y0)
+
+    # Walk the columns the segment spans, taking the rows it covers within each.
+    # The rows are widened by a hair, so rounding never drops a bucket the
+    # segment only just touches.
+    (i0, i1) = (clamp(int((x0 - self.xmin) / self.width)), clamp(int((x1 - self.xmin) / self.width)))
+    for i in range(i0, i1 + 1):
+      left = max(x0, self.xmin + i * self.width)
+      right = min(x1, self.xmin + (i + 1) * self.width)
+      if x1 == x0:
+        (ya, yb) = (y0, y1)
+      else:
+        ya = y0 + (y1 - y0) * ((left - x0) / float(x1 - x0))
+        yb = y0 + (y1 - y0) * ((right - x0) / float(x1 - x0))
+      (ya, yb) = (min(ya, yb), max(ya, yb))
+      for j in range(clamp(int(row(ya) - 1e-9)), clamp(int(row(yb) + 1e-9)) + 1):
+        yield j * self.divs + i
+
+  def add(self, segment):
+    index = len(self.segments)
+    self.segments.append(segment)
+    for bucket in self._buckets(segment):
+      self.buckets[bucket].append(index)
+
+  def crosses(self, segment):
+    """Whether `segment` intersects any segment in the grid"""
+    seen = set()
+    for bucket in self._buckets(segment):
+      for index in self.buckets[bucket]:
+        if index not in seen:
+          seen.add(index)
+          if self.intersects(segment, self.segments[index]):
+            return True
+    return False
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Half-edge mesh stored in flat arrays
+
+Each face (a Voronoi cell, or a Delaunay triangle) is bounded by a
+counterclockwise loop of half-edges. Half-edge h runs from vertex origin[h] to
+vertex origin[next[h]], bounds face face[h], and twin[h] is the half-edge
+running the other way along the same edge, in the neighboring face (or -1 on
+the border of the map). faceEdge[f] is any one of face f's half-edges.
+
+Every vertex and edge is stored once, however many faces share it, and every
+field is a typed array rather than a list of Python objects. Walking from a face
+to its neighbors is a matter of following indices.
+"""
+
+import math
+import struct
+from array import array
+
+MAGIC = 'MGHE'
+VERSION = 1
+HEADER = struct.Struct('<4sB3xQQQQ')
+BIG_ENDIAN = struct.pack('=H', 1) != struct.pack('<H', 1)
+
+def _signedArea(polygon):
+  return sum(
+    polygon[k-1][0] * polygon[k][1] - polygon[k][0] * polygon[k-1][1]
+    for k in range(len(polygon))
+  )
+
+class HalfEdgeMesh (object):
+  def __init__(self):
+    self.x = array('d')
+    self.y = array('d')
+    self.origin = array('i')
+    self.twin = array('i')
+    self.next = array('i')
+    self.face = array('i')
+    self.faceEdge = array('i')
+    self.siteX = array('d')
+    self.siteY = array('d')
+
+  @classmethod
+  def fromPolygons(cls, polygons, sites=None, tolerance=1e-9):
+    """Build a mesh from a list of polygons, such as mapgen2.py's shapes
+
+    Neighboring cells each compute their shared vertices for themselves, so
+    vertices closer together than `tolerance` are welded into one. Edges which
+    collapse to nothing as a result are dropped.
+
+    Parameters:
+      polygons -- list of vertex lists; face i of the mesh is polygons[i]
+      sites -- optionally, a list of the points each face was built around
+    """
+    mesh = cls()
+    welded = {}
+    def vertexIndex((x, y)):
+      key = (int(math.floor(x / tolerance)), int(math.floor(y / tolerance)))
+      for dx in (0, -1, 1):
+        for dy in (0, -1, 1):
+          for index in welded.get((key[0] + dx, key[1] + dy), ()):
+            if abs(mesh.x[index] - x) <= tolerance and abs(mesh.y[index] - y) <= tolerance:
+              return index
+      index = len(mesh.x)
+      mesh.x.append(x)
+      mesh.y.append(y)
+      welded.setdefault(key, []).append(index)
+      return index
+
+    loops = []
+    for polygon in polygons:
+      if _signedArea(polygon) < 0:
+        polygon = polygon[::-1]
+      loop = [vertexIndex(vertex) for vertex in polygon]
+      loops.append([v for (k, v) in enumerate(loop) if v != loop[k-1]])
+    mesh._link(loops)
+
+    for site in (sites or ()):
+      mesh.siteX.append(site[0])
+      mesh.siteY.append(site[1])
+    return mesh
+
+  @classmethod
+  def fromTriangles(cls, points, triangles):
+    """Build a mesh from a list of points and counterclockwise index triples,
+    such as delaunay.DelaunayTriangulation makes
+    """
+    mesh = cls()
+    for (x, y) in points:
+      mesh.x.append(x)
+      mesh.y.append(y)
+    mesh._link([list(triangle) for triangle in triangles])
+    return mesh
+
+  def _link(self, loops):
+    # Pairing up twins needs a dictionary, but only while the mesh is built
+    edges = {}
+    for (f, loop) in enumerate(loops):
+      first = len(self.origin)
+      self.faceEdge.append(first if loop else -1)
+      for (k, vertex) in enumerate(loop):
+        h = first + k
+        following = loop[(k + 1) % len(loop)]
+        self.origin.append(vertex)
+        self.next.append(first + (k + 1) % len(loop))
+        self.face.append(f)
+        twin = edges.pop((following, vertex), -1)
+        self.twin.append(twin)
+        if twin >= 0:
+          self.twin[twin] = h
+        else:
+          edges[(vertex, following)] = h
+
+  def __len__(self):
+    """Number of faces"""
+    return len(self.faceEdge)
+
+  def destination(self, h):
+    return self.origin[self.next[h]]
+
+  def faceEdges(self, f):
+    """Yield the half-edges around face f, counterclockwise"""
+    h = first = self.faceEdge[f]
+    if h < 0:
+      return
+    while True:
+      yield h
+      h = self.next[h]
+      if h == first:
+        return
+
+  def faceVertices(self, f):
+    """Vertices of face f, as a counterclockwise list of (x, y)"""
+    return [(self.x[self.origin[h]], self.y[self.origin[h]]) for h in self.faceEdges(f)]
+
+  def neighbors(self, f):
+    """Faces which share an edge with face f, counterclockwise"""
+    return [self.face[self.twin[h]] for h in self.faceEdges(f) if self.twin[h] >= 0]
+
+  def save(self, path):
+    """Write the mesh to a binary file: a header giving the number of
+    vertices, half-edges, faces and sites, then each array in turn, little-endian
+    """
+    with open(path, 'wb') as outfile:
+      outfile.write(HEADER.pack(MAGIC, VERSION, len(self.x), len(self.origin),
+                                len(self.faceEdge), len(self.siteX)))
+      for values in self._arrays():
+        if BIG_ENDIAN:
+          values = array(values.typecode, values)
+          values.byteswap()
+        values.tofile(outfile)
+
+  @classmethod
+  def load(cls, path):
+    mesh = cls()
+    with open(path, 'rb') as infile:
+      (magic, version, vertices, halfEdges, faces, sites) = HEADER.unpack(infile.read(HEADER.size))
+      if magic != MAGIC or version != VERSION:
+        raise ValueError("{} is not a version {} mesh file".format(path, VERSION))
+      counts = [vertices] * 2 + [halfEdges] * 4 + [faces] + [sites] * 2
+      for (values, count) in zip(mesh._arrays(), counts):
+        values.fromfile(infile, count)
+        if BIG_ENDIAN:
+          values.byteswap()
+    return mesh
+
+  def _arrays(self):
+    return [self.x, self.y, self.origin, self.twin, self.next, self.face,
+            self.faceEdge, self.siteX, self.siteY]
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Timing instrumentation for both generators
+
+Functions are registered with @profile (or @debug; see debug.py) where they're
+defined, but are left exactly as they are, so with instrumentation off they
+cost nothing extra to call. enable() swaps a wrapper in for each of them,
+everywhere they've been imported, which counts their calls and times them.
+
+Runs are divided into phases (point generation, relaxation, cell construction
+and so on), which can be nested:
+
+  with phase('relaxation'):
+    ...
+
+Each phase records its wall time, the peak memory use of the process at its
+end (ru_maxrss, which never goes down) and the calls and time of every
+profiled function called during it. Times include the time spent in any
+profiled functions a function calls in turn.
+
+The results can be printed with report(), or saved with writeJson() and
+writeChromeTrace(); the latter opens in chrome://tracing or Perfetto.
+"""
+
+import contextlib
+import json
+import resource
+import sys
+import time
+
+_registered = []
+_enabled = set()
+_start = time.time()
+
+# The stats of the innermost phase: profiled function name -> [calls, seconds]
+_root = {'name': None, 'path': None, 'start': _start, 'end': None, 'peakKb': None,
+         'functions': {}, 'counters': {}, 'children': []}
+_stack = [_root]
+
+def qualifiedName(func):
+  return '{}.{}'.format(func.__module__, func.__name__)
+
+def peakMemoryKb():
+  """Largest resident set size of this process so far, in kilobytes"""
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  return peak // 1024 if sys.platform == 'darwin' else peak   # macOS reports bytes
+
+def _install(func, wrapper):
+  # Replace every reference to `func` held by a loaded module, so names copied
+  # by "from ... import" are covered too
+  for module in list(sys.modules.values()):
+    namespace = getattr(module, '__dict__', None)
+    if namespace is None:
+      continue
+    for (name, value) in namespace.items():
+      if value is func:
+        namespace[name] = wrapper
+
+def register(func, kind, makeWrapper):
+  """Register `func` to be replaced by makeWrapper(func) once instrumentation
+  of this kind is enabled
+
+  Return: func itself, or its wrapper if `kind` has already been enabled
+  """
+  _registered.append((func, kind, makeWrapper))
+  if kind in _enabled:
+    return makeWrapper(func)
+  return func
+
+def enable(kind='profile'):
+  """Install the wrappers of every function registered under `kind`"""
+  if kind in _enabled:
+    return
+  _enabled.add(kind)
+  for (func, registeredKind, makeWrapper) in _registered:
+    if registeredKind == kind:
+      _install(func, makeWrapper(func))
+
+def enabled(kind='profile'):
+  return kind in _enabled
+
+def _timed(func):
+  name = qualifiedName(func)
+  clock = time.time
+  def instrumented(*args, **kwargs):
+    start = clock()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      functions = _stack[-1]['functions']
+      entry = functions.get(name)
+      if entry is None:
+        entry = functions[name] = [0, 0.0]
+      entry[0] += 1
+      entry[1] += clock() - start
+  instrumented.__name__ = func.__name__
+  instrumented.__doc__ = func.__doc__
+  return instrumented
+
+def profile(func):
+  """Decorator: count and time calls to `func`, once profiling is enabled"""
+  return register(func, 'profile', _timed)
+
+def count(name, n=1):
+  """Add n to a named counter in the current phase (only when profiling)"""
+  if 'profile' in _enabled:
+    counters = _stack[-1]['counters']
+    counters[name] = counters.get(name, 0) + n
+
+def beginPhase(name):
+  """Start a phase, inside the current one (only when profiling). Every
+  beginPhase() must be matched by an endPhase(); phase() does this for you.
+  """
+  if 'profile' not in _enabled:
+    return
+  parent = _stack[-1]
+  record = {'name': name, 'path': name if parent['path'] is None else parent['path'] + '/' + name,
+            'start': time.time(), 'end': None, 'peakKb': None,
+            'functions': {}, 'counters': {}, 'children': []}
+  parent['children'].append(record)
+  _stack.append(record)
+
+def endPhase():
+  """End the phase started by the last unmatched beginPhase()"""
+  if 'profile' not in _enabled:
+    return
+  record = _stack.pop()
+  record['end'] = time.time()
+  record['peakKb'] = peakMemoryKb()
+
+@contextlib.contextmanager
+def phase(name):
+  """Record everything inside the `with` block as a phase (only when profiling)"""
+  beginPhase(name)
+  try:
+    yield
+  finally:
+    endPhase()
+
+def _phases(record=_root):
+  for child in record['children']:
+    yield child
+    for descendant in _phases(child):
+      yield descendant
+
+def _totals():
+  functions = {}
+  counters = {}
+  for record in [_root] + list(_phases()):
+    for (name, (calls, seconds)) in record['functions'].items():
+      total = functions.setdefault(name, [0, 0.0])
+      total[0] += calls
+      total[1] += seconds
+    for (name, n) in record['counters'].items():
+      counters[name] = counters.get(name, 0) + n
+  return functions, counters
+
+def _functionStats(functions):
+  return dict((name, {'calls': calls, 'seconds': seconds}) for (name, (calls, seconds)) in functions.items())
+
+def summary():
+  """Everything recorded so far, as a JSON-compatible dictionary"""
+  (functions, counters) = _totals()
+  return {
+    'command': sys.argv,
+    'seconds': time.time() - _start,
+    'peak_rss_kb': peakMemoryKb(),
+    'functions': _functionStats(functions),
+    'counters': counters,
+    'phases': [{
+      'name': record['path'],
+      'seconds': (record['end'] or time.time()) - record['start'],
+      'peak_rss_kb': record['peakKb'],
+      'functions': _functionStats(record['functions']),
+      'counters': record['counters'],
+    } for record in _phases()],
+  }
+
+def writeJson(path):
+  with open(path, 'w') as outfile:
+    json.dump(summary(), outfile, indent=2, sort_keys=True)
+
+def writeChromeTrace(path):
+  """Write the phases in the Trace Event Format, as nested spans. Each span's
+  args hold the calls and times of the profiled functions called directly in
+  that phase, and a counter track follows peak memory use.
+  """
+  def micros(t):
+    return int(round((t - _start) * 1e6))
+  events = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': ' '.join(sys.argv)}}]
+  for record in _phases():
+    end = record['end'] or time.time()
+    args = _functionStats(record['functions'])
+    args.update(record['counters'])
+    events.append({'name': record['name'], 'cat': 'phase', 'ph': 'X', 'pid': 1, 'tid': 1,
+                   'ts': micros(record['start']), 'dur': micros(end) - micros(record['start']),
+                   'args': args})
+    if record['peakKb'] is not None:
+      events.append({'name': 'peak_rss_kb', 'ph': 'C', 'pid': 1, 'ts': micros(end),
+                     'args': {'peak_rss_kb': record['peakKb']}})
+  with open(path, 'w') as outfile:
+    json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, outfile)
+
+def report(out=sys.stdout):
+  """Print a summary of every phase, function and counter"""
+  data = summary()
+  out.write("Total: {:.3f} s, peak memory {} KB\n".format(data['seconds'], data['peak_rss_kb']))
+  for record in data['phases']:
+    out.write("  {:<32} {:>9.3f} s  {:>9} KB\n".format(record['name'], record['seconds'], record['peak_rss_kb']))
+  for (name, stats) in sorted(data['functions'].items(), key=lambda (name, stats): -stats['seconds']):
+    out.write("{}: {} calls, {:.3f} s\n".format(name, stats['calls'], stats['seconds']))
+  for (name, n) in sorted(data['counters'].items()):
+    out.write("{}: {}\n".format(name, n))
+
+def finish(jsonPath=None, tracePath=None):
+  """Print the report and write whichever files were asked for, if profiling"""
+  if 'profile' not in _enabled:
+    return
+  report()
+  if jsonPath:
+    writeJson(jsonPath)
+  if tracePath:
+    writeChromeTrace(tracePath)
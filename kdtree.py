@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Static 2-d tree for nearest-site queries (requires numpy)
+
+The tree is perfectly balanced and stored implicitly, like a binary heap:
+internal node k has children 2k+1 and 2k+2, and every leaf holds at most
+`leafSize` points. This lets a whole batch of queries descend the tree in
+lockstep, one array operation per level.
+"""
+
+import numpy
+
+INFINITY = float('inf')
+
+class KDTree (object):
+  def __init__(self, points, leafSize=16):
+    coords = numpy.array(points, dtype=float).reshape(-1, 2)
+    n = len(coords)
+    depth = 0
+    while n > (leafSize << depth):
+      depth += 1
+
+    order = numpy.arange(n)
+    internal = (1 << depth) - 1
+    splitDim = numpy.zeros(internal, dtype=numpy.intp)
+    splitValue = numpy.zeros(internal)
+    # Node k on level L covers order[(i*n) >> L : ((i+1)*n) >> L], where i is
+    # its position within the level.
+    for level in range(depth):
+      for i in range(1 << level):
+        node = (1 << level) - 1 + i
+        lo = (i * n) >> level
+        hi = ((i + 1) * n) >> level
+        mid = ((2 * i + 1) * n) >> (level + 1)
+        members = order[lo:hi]
+        spread = coords[members].max(0) - coords[members].min(0)
+        dim = 0 if spread[0] >= spread[1] else 1
+        partition = numpy.argpartition(coords[members, dim], mid - lo)
+        order[lo:hi] = members[partition]
+        splitDim[node] = dim
+        splitValue[node] = coords[order[mid], dim]
+
+    leaves = 1 << depth
+    starts = (numpy.arange(leaves + 1) * n) >> depth
+    leafIndex = numpy.full((leaves, max(1, leafSize)), -1, dtype=numpy.intp)
+    for leaf in range(leaves):
+      members = order[starts[leaf]:starts[leaf + 1]]
+      leafIndex[leaf, :len(members)] = members
+    if n:
+      leafX = numpy.where(leafIndex >= 0, coords[leafIndex, 0], INFINITY)
+      leafY = numpy.where(leafIndex >= 0, coords[leafIndex, 1], INFINITY)
+    else:
+      # A tree of no points is one empty leaf, where every query finds -1
+      leafX = leafY = numpy.full(leafIndex.shape, INFINITY)
+
+    self.coords = coords
+    self.depth = depth
+    self.splitDim = splitDim
+    self.splitValue = splitValue
+    self.leafIndex = leafIndex
+    self.leafX = leafX
+    self.leafY = leafY
+
+    # Plain lists, for single queries which would only be slowed down by numpy
+    self._splits = zip(splitDim.tolist(), splitValue.tolist())
+    self._leaves = [
+      [(i, x, y) for (i, x, y) in zip(*row) if i >= 0]
+      for row in zip(leafIndex.tolist(), leafX.tolist(), leafY.tolist())
+    ]
+
+  def query(self, queries, chunkSize=1 << 16):
+    """Find the nearest site to every query point
+
+    Parameters: An array-like of shape (m, 2)
+
+    Return: An integer array of m indices into the points the tree was built
+      from (and so into the cells built from them; see pipeline.cellsAt), or
+      of -1s if there were no points
+    """
+    queries = numpy.asarray(queries, dtype=float).reshape(-1, 2)
+    best = numpy.empty(len(queries), dtype=numpy.intp)
+    # Chunks keep the working arrays small enough to stay in cache
+    for start in range(0, len(queries), chunkSize):
+      chunk = queries[start:start + chunkSize]
+      best[start:start + chunkSize] = self._query(chunk[:, 0], chunk[:, 1])
+    return best
+
+  def _query(self, qx, qy):
+    m = len(qx)
+    internal = (1 << self.depth) - 1
+
+    # Descend straight to the leaf containing each query, and take the closest
+    # site there as a first guess.
+    node = numpy.zeros(m, dtype=numpy.intp)
+    path = []
+    for level in range(self.depth):
+      gap = numpy.where(self.splitDim[node] == 0, qx, qy) - self.splitValue[node]
+      node = 2 * node + 1 + (gap >= 0)
+      path.append((node, gap * gap))
+    best, bestDistance = self._scanLeaves(node - internal, qx, qy)
+
+    # Any closer site must be in a subtree branching off that path, on the far
+    # side of a split nearer than the first guess. Visit those subtrees one
+    # level at a time, pruning any farther away than the current guess.
+    pairs = numpy.zeros(0, dtype=numpy.intp)
+    node = numpy.zeros(0, dtype=numpy.intp)
+    bound = numpy.zeros(0)
+    for level in range(self.depth):
+      if len(pairs):
+        dim = self.splitDim[node]
+        value = numpy.where(dim == 0, qx[pairs], qy[pairs])
+        gap = value - self.splitValue[node]
+        near = 2 * node + 1 + (gap >= 0)
+        far = 2 * node + 1 + (gap < 0)
+        pairs = numpy.concatenate((pairs, pairs))
+        node = numpy.concatenate((near, far))
+        bound = numpy.concatenate((bound, numpy.maximum(bound, gap * gap)))
+      (home, distance) = path[level]
+      branch = numpy.flatnonzero(distance < bestDistance)
+      if len(branch):
+        sibling = home[branch]
+        sibling = numpy.where(sibling % 2 == 1, sibling + 1, sibling - 1)
+        pairs = numpy.concatenate((pairs, branch))
+        node = numpy.concatenate((node, sibling))
+        bound = numpy.concatenate((bound, distance[branch]))
+      keep = bound < bestDistance[pairs]
+      pairs, node, bound = pairs[keep], node[keep], bound[keep]
+
+    if len(pairs):
+      found, distance = self._scanLeaves(node - internal, qx[pairs], qy[pairs])
+      order = numpy.lexsort((distance, pairs))
+      pairs, found, distance = pairs[order], found[order], distance[order]
+      first = numpy.ones(len(pairs), dtype=bool)
+      first[1:] = pairs[1:] != pairs[:-1]
+      pairs, found, distance = pairs[first], found[first], distance[first]
+      better = distance < bestDistance[pairs]
+      best[pairs[better]] = found[better]
+
+    return best
+
+  def _scanLeaves(self, leaves, qx, qy):
+    dx = self.leafX[leaves] - qx[:, None]
+    dy = self.leafY[leaves] - qy[:, None]
+    distance = dx * dx + dy * dy
+    column = numpy.argmin(distance, 1)
+    rows = numpy.arange(len(leaves))
+    return self.leafIndex[leaves, column], distance[rows, column]
+
+  def queryPoint(self, (x, y)):
+    """Index of the site nearest to a single point, or -1 if there are none"""
+    best = [-1, INFINITY]
+    self._search(0, 0, x, y, best)
+    return best[0]
+
+  def _search(self, node, level, x, y, best):
+    if level == self.depth:
+      for (index, sx, sy) in self._leaves[node - ((1 << level) - 1)]:
+        distance = (sx - x) * (sx - x) + (sy - y) * (sy - y)
+        if distance < best[1]:
+          best[0] = index
+          best[1] = distance
+      return
+    (dim, split) = self._splits[node]
+    gap = (x if dim == 0 else y) - split
+    if gap >= 0:
+      self._search(2 * node + 2, level + 1, x, y, best)
+      if gap * gap < best[1]:
+        self._search(2 * node + 1, level + 1, x, y, best)
+    else:
+      self._search(2 * node + 1, level + 1, x, y, best)
+      if gap * gap < best[1]:
+        self._search(2 * node + 2, level + 1, x, y, best)
@@ -1,20 +1,36 @@
 #!/usr/bin/env python
 
 import argparse
-import itertools
-import json
-import random
 import sys
 
+import instrument
+import pipeline
+import pointfile
+from delaunay import DelaunayTriangulation
+
 PARSER = argparse.ArgumentParser(description='Delaunay Triangulation Generator')
-PARSER.add_argument('--num_points', default=20, type=int, help='Number of random points to generate')
+PARSER.add_argument('--num_points', default=20, type=int, help='Number of random points to generate (roughly, with --sampler poisson)')
+PARSER.add_argument('--sampler', choices=['uniform', 'poisson'], default='uniform', help='Scatter the points independently (uniform), or spread them evenly with Poisson-disk sampling, no two closer than --min_distance, which leaves nothing for relaxation to do (poisson)')
+PARSER.add_argument('--min_distance', type=float, help='Minimum distance between points, overriding --num_points (requires --sampler poisson)')
+PARSER.add_argument('--seed', type=int, help='Seed of the random number generator, to generate the same points again')
 PARSER.add_argument('--animate', action='store_true', help='Animate the segment consideration algorithm')
 PARSER.add_argument('--interactive', action='store_true', help='Pause after every segment consideration (requires --interactive)')
 PARSER.add_argument('--delay', default=50, type=int, help='Time to show each frame, in milliseconds (requires --animate)')
-PARSER.add_argument('--report_call_counts', action='store_true', help='Report how many times intersection() and addSegment() are called')
+PARSER.add_argument('--record', help='Write every segment consideration to an event log, to be watched later with --replay, instead of slowing the run down to animate it')
+PARSER.add_argument('--replay', help='Play back an event log written by --record, instead of generating anything (see replay.py for the keys)')
+PARSER.add_argument('--replay_speed', default=1, type=int, help='Number of events to play back per frame (requires --replay)')
+PARSER.add_argument('--profile', '--report_call_counts', action='store_true', help='Time each phase of the run and the profiled functions, count their calls (segmentsIntersect(), segmentSettled() and so on), and print a report at the end')
+PARSER.add_argument('--profile_json', help='Also save the --profile report to a JSON file, for comparing runs (implies --profile)')
+PARSER.add_argument('--profile_trace', help='Also save the --profile phases in Chrome trace format, for chrome://tracing or Perfetto (implies --profile)')
+PARSER.add_argument('--engine', choices=['greedy', 'shortest_first', 'delaunay'], default='greedy', help='Consider every pair of points (greedy), consider pairs of near neighbors shortest first (shortest_first), or build a true Delaunay triangulation incrementally (delaunay)')
+PARSER.add_argument('--neighbors', default=0, type=int, help='Only pair each point with this many of its nearest neighbors, instead of with every other point. Much faster, but some long edges are lost (about 1%% at 20) (requires --engine shortest_first)')
+PARSER.add_argument('--vectorized', action='store_true', help='Test each new segment against all the accepted ones at once with NumPy, instead of one at a time (requires numpy; greedy engine only)')
+PARSER.add_argument('--save_mesh', help='Save the triangles as a binary half-edge mesh (see halfedge.py) (requires --engine delaunay)')
+PARSER.add_argument('--validate', action='store_true', help='Afterwards, check with a sweep line that no two accepted segments cross, and show any that do')
 saveLoadPoints = PARSER.add_mutually_exclusive_group()
-saveLoadPoints.add_argument('--save_points', help='Save randomly-generated points out to a file')
-saveLoadPoints.add_argument('--load_points', help='Load previously-generated points from a file')
+saveLoadPoints.add_argument('--save_points', help='Save randomly-generated points out to a file (binary if it ends in .pts, otherwise JSON)')
+saveLoadPoints.add_argument('--load_points', help='Load previously-generated points from a file (binary if it ends in .pts, otherwise JSON)')
+PARSER.add_argument('--float32', action='store_true', help='Store coordinates in .pts files with single precision, halving their size (requires --save_points)')
 ARGS = PARSER.parse_args()
 
 SIZE = 800, 800
@@ -36,156 +52,15 @@ LINE_HIGHLIGHT = GOLD
 POINT_RADIUS = 5
 LINE_WIDTH = 1
 
-if ARGS.animate:
+if ARGS.animate or ARGS.replay:
   import pygame
 
   pygame.init()
   screen = pygame.display.set_mode(SIZE)
   surf = pygame.display.get_surface()
 
-call_counts = {
-  'intersection': 0,
-  'addSegment': 0,
-}
-
-def intersection (((a1x, a1y), (b1x, b1y)), ((a2x, a2y), (b2x, b2y))):
-  """Determine where, if ever, two segments defined by their endpoints intersect
-
-  Parameters: Two pairs of points, where each point is a pair of numbers
-
-  Return: Pair of floats containing the relative weights of each pair of numbers
-    where the intersection occurs on the segment
-
-          t2=0           .b1 t1=1
-              a2     _.-'   
-                \_.-'       
-             _.-'\           segment 1 = (a1, b1)
-          .-'     \          segment 2 = (a2, b2)
-       a1'         b2       
-      t1=0          t2=1
-  """
-  call_counts['intersection'] += 1
-
-  # Define a parametric system of equations f1(t) and f2(t) where 0<=t<=1
-  #   f(t) = a * (1 - t) + b * t = a + (b - a) * t
-  # 
-  # Set them equal to each other and solve for t.
-  #
-  #   f1(t1) = f2(t2)
-  #   a1 + (-a1 + b1) * t1 = a2 + (-a2 + b2) * t2
-  #   (a1 - a2) = (a1 - b1) * t1 + (-a2 + b2) * t2
-  # 
-  #   (a1x - a2x) = (a1x - b1x) * t1 + (-a2x + b2x) * t2
-  #   (a1y - a2y) = (a1y - b1y) * t1 + (-a2y + b2y) * t2
-  # 
-  #   [ a1x - a2x ] = [ (a1x - b1x)  (-a2x + b2x) ][ t1 ]
-  #   [ a1y - a2y ] = [ (a1y - b1y)  (-a2y + b2y) ][ t2 ]
-  #
-  # Shorten things up a little: (also cast to floats)
-  d1y = a1y - b1y
-  d1x = a1x - b1x
-  d2x = a2x - b2x
-  d2y = a2y - b2y
-  dax = a1x - a2x
-  day = a1y - a2y
-  #   [ dax ] = [ d1x  -d2x ][ t1 ]
-  #   [ day ] = [ d1y  -d2y ][ t2 ]
-  # 
-  # Inverse of 2x2 matrix:
-  #                [ a  b ]    [  d -c ]            [  d -c ]
-  #   inv(A) = inv([ c  d ]) = [ -b  a ] / det(A) = [ -b  a ] / (ad - bc)
-  # 
-  # In our case,
-  #   det(A) = d1x * -d2y - d1y * -d2x
-  #          = -d1x * d2y + d1y * d2x
-  det = float(-d1x*d2y + d1y*d2x)
-  if det == 0: return float('nan'), float('nan')
-  # 
-  # So, inv(A) =
-  #   [ -d2y/det  d2x/det ]
-  #   [ -d1y/det  d1x/det ]
-  # 
-  #   [ t1 ] = [ -d2y/det  d2x/det ][ dax ]
-  #   [ t2 ] = [ -d1y/det  d1x/det ][ day ]
-  t1 = ( -d2y*dax + d2x*day ) / det
-  t2 = ( -d1y*dax + d1x*day ) / det
-
-  return t1, t2
-
-assert(intersection( ((1,1),(2,2)), ((2,1),(1,2)) ) == (0.5,0.5))
-assert(intersection( ((3,1),(3,4)), ((1,2),(4,2)) ) == (1.0/3,2.0/3))
-
-
-def segmentsIntersect ((a1, b1), (a2, b2)):
-  if a1 == a2 or a1 == b2 or b1 == a2 or b1 == b2:
-    return False
-  t1, t2 = intersection((a1, b1), (a2, b2))
-  return 0 <= t1 and t1 <= 1 and 0 <= t2 and t2 <= 1
-
-assert(segmentsIntersect( ((1,1),(2,2)), ((2,1),(1,2)) ))
-assert(segmentsIntersect( ((3,1),(3,4)), ((1,2),(4,2)) ))
-assert(not segmentsIntersect( ((1,1),(1,2)), ((2,1),(2,2)) ))
-assert(not segmentsIntersect( ((2,2),(3,3)), ((2,1),(1,2)) ))
-assert(not segmentsIntersect( ((1,1),(1,2)), ((1,1),(2,1)) ))
-
-
-def segmentCompare(((a1x, a1y), (b1x, b1y)), ((a2x, a2y), (b2x, b2y))):
-  d1x = a1x - b1x
-  d1y = a1y - b1y
-  d2x = a2x - b2x
-  d2y = a2y - b2y
-  return cmp(d1x*d1x + d1y*d1y, d2x*d2x + d2y*d2y)
-
-assert(segmentCompare( ((1,1),(2,2)), ((2,1),(1,2)) ) == 0)
-assert(segmentCompare( ((1,1),(3,3)), ((2,1),(1,2)) ) > 0)
-assert(segmentCompare( ((1,1),(3,3)), ((1,4),(4,1)) ) < 0)
-
-def addSegment (newSegment):
-  call_counts['addSegment'] += 1
-
-  dooming = []
-  doomedBy = []
-
-  highlighted_segments[:] = [newSegment]
-
-  for existing in accepted_segments:
-    if segmentsIntersect(newSegment, existing):
-      if segmentCompare(newSegment, existing) <= 0:
-        dooming.append(existing)
-      else:
-        doomedBy.append(existing)
-
-  error_segments_tmp1[:] = dooming
-  error_segments_tmp2[:] = doomedBy
-
-  for doomed in dooming:
-    accepted_segments.remove(doomed)
-    invalidated_segments.append(doomed)
-
-  if not len(doomedBy):
-    accepted_segments.append(newSegment)
-
-  if ARGS.animate:
-    render()
-    if ARGS.interactive:
-      waitForKey()
-    else:
-      waitForDelay()
-
-# Points generation
-
-if ARGS.load_points:
-    with open(ARGS.load_points) as infile:
-        points = json.load(infile)
-else:
-    points = [
-      (random.random(), random.random())
-      for i in range(ARGS.num_points)
-    ]
-
-if ARGS.save_points:
-    with open(ARGS.save_points, 'w') as outfile:
-        json.dump(points, outfile)
+if ARGS.profile or ARGS.profile_json or ARGS.profile_trace:
+  instrument.enable()
 
 # Globals for segment consideration
 
@@ -245,13 +120,7 @@ def waitForDelay():
        (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
       sys.exit()
 
-for a, b in itertools.combinations(points, 2):
-  addSegment((a, b))
-
-  highlighted_segments = []
-  error_segments_tmp1 = []
-  error_segments_tmp2 = []
-
+def renderAndPause():
   if ARGS.animate:
     render()
     if ARGS.interactive:
@@ -259,9 +128,110 @@ for a, b in itertools.combinations(points, 2):
     else:
       waitForDelay()
 
-print "Call counts:"
-for (method, times) in call_counts.items():
-  print " - {}: {}".format(method, times)
+@instrument.profile
+def segmentSettled (newSegment, accepted, invalidated, blockedBy):
+  """Record and animate each pair the greedy and shortest-first engines settle
+  (see pipeline.buildTriangulation), keeping the lists render() draws in step
+  """
+  if ARGS.vectorized:
+    instrument.count('vectorized intersection tests', len(accepted_segments))
+
+  highlighted_segments[:] = [newSegment]
+  error_segments_tmp1[:] = invalidated
+  error_segments_tmp2[:] = blockedBy
+  if eventLog:
+    eventLog.segmentConsidered(newSegment)
+
+  for doomed in invalidated:
+    accepted_segments.remove(doomed)
+    invalidated_segments.append(doomed)
+    if eventLog:
+      eventLog.segmentInvalidated(doomed)
+
+  if accepted:
+    accepted_segments.append(newSegment)
+    if eventLog:
+      eventLog.segmentAccepted(newSegment)
+  else:
+    if ARGS.engine == 'shortest_first':
+      never_valid_segments.append(newSegment)
+    if eventLog:
+      eventLog.segmentRejected(newSegment)
+
+  renderAndPause()
+
+  if ARGS.engine == 'greedy':
+    highlighted_segments[:] = []
+    error_segments_tmp1[:] = []
+    error_segments_tmp2[:] = []
+    renderAndPause()
+
+if ARGS.replay:
+  import eventlog
+  import replay
+
+  # render() draws whatever these names refer to, so point them at the replay
+  log = eventlog.Replay(ARGS.replay)
+  points = log.points
+  accepted_segments = log.accepted
+  invalidated_segments = log.invalidated
+  never_valid_segments = log.neverValid
+  highlighted_segments = log.highlighted
+  replay.view(log, render, ARGS.delay, ARGS.replay_speed)
+
+# Points generation
+instrument.beginPhase('points')
+
+if ARGS.load_points:
+    points = pointfile.load(ARGS.load_points)
+else:
+    points = pipeline.generatePoints(ARGS.num_points, ARGS.seed, ARGS.sampler, ARGS.min_distance)
+
+if ARGS.save_points:
+    pointfile.save(ARGS.save_points, points, 'f' if ARGS.float32 else 'd')
+
+instrument.endPhase()
+
+eventLog = None
+if ARGS.record:
+  import eventlog
+  eventLog = eventlog.EventLog(ARGS.record)
+  eventLog.points(points)
+
+instrument.beginPhase('segments')
+if ARGS.engine == 'delaunay':
+  # The incremental engine doesn't consider segments one at a time, so there is
+  # nothing to animate until it finishes.
+  triangulation = DelaunayTriangulation(points)
+  accepted_segments[:] = triangulation.segments()
+  if eventLog:
+    for segment in accepted_segments:
+      eventLog.segmentAccepted(segment)
+  triangles = triangulation.triangles()
+  for (name, n) in triangulation.stats.items():
+    instrument.count(name, n)
+
+  if ARGS.save_mesh:
+    import halfedge
+    with instrument.phase('mesh'):
+      halfedge.HalfEdgeMesh.fromTriangles(points, triangles).save(ARGS.save_mesh)
+
+else:
+  pipeline.buildTriangulation(points, ARGS.engine, ARGS.neighbors, ARGS.vectorized, segmentSettled)
+
+instrument.endPhase()
+
+if eventLog:
+  eventLog.close()
+
+if ARGS.validate:
+  import sweep
+  with instrument.phase('validate'):
+    crossing = sweep.crossings(accepted_segments)
+  error_segments[:] = [accepted_segments[index] for pair in crossing for index in pair]
+  print "Crossing segments: {}".format(len(crossing))
+
+instrument.finish(ARGS.profile_json, ARGS.profile_trace)
 
 if ARGS.animate:
   render()
@@ -3,26 +3,51 @@
 import argparse
 import functools
 import itertools
-import json
-import random
 import sys
 
+import instrument
+import pipeline
+import pointfile
 from debug import *
+from fortune import voronoiNeighbors
 from geometry import *
+from grid import PointGrid
 
 PARSER = argparse.ArgumentParser(description='Voroni Diagram Generator')
-PARSER.add_argument('--num_points', default=20, type=int, help='Number of random points to generate')
+PARSER.add_argument('--num_points', default=20, type=int, help='Number of random points to generate (roughly, with --sampler poisson)')
+PARSER.add_argument('--sampler', choices=['uniform', 'poisson'], default='uniform', help='Scatter the points independently (uniform), or spread them evenly with Poisson-disk sampling, no two closer than --min_distance, which leaves nothing for relaxation to do (poisson)')
+PARSER.add_argument('--min_distance', type=float, help='Minimum distance between points, overriding --num_points (requires --sampler poisson)')
+PARSER.add_argument('--seed', type=int, help='Seed of the random number generator, to generate the same points again')
 PARSER.add_argument('--animate', action='store_true', help='Animate the segment consideration algorithm')
 PARSER.add_argument('--interactive', action='store_true', help='Pause after every segment consideration (requires --animate)')
 PARSER.add_argument('--delay', default=50, type=int, help='Time to show each frame, in milliseconds (requires --animate)')
 PARSER.add_argument('--display', action='store_true', help='Don\'t render every frame, just the last one')
-PARSER.add_argument('--profile', action='store_true', help='Count the number of times certain functions are called')
-PARSER.add_argument('--cell_optimization', type=int, help='Divide the field into n-by-n cells to decrease the number of comparisons')
+PARSER.add_argument('--record', help='Write every step of the clipping to an event log, to be watched later with --replay, instead of slowing the run down to animate it')
+PARSER.add_argument('--replay', help='Play back an event log written by --record, instead of generating anything (see replay.py for the keys)')
+PARSER.add_argument('--replay_speed', default=1, type=int, help='Number of events to play back per frame (requires --replay)')
+PARSER.add_argument('--profile', action='store_true', help='Time each phase of the run and the profiled functions, count their calls, and print a report at the end')
+PARSER.add_argument('--profile_json', help='Also save the --profile report to a JSON file, for comparing runs (implies --profile)')
+PARSER.add_argument('--profile_trace', help='Also save the --profile phases in Chrome trace format, for chrome://tracing or Perfetto (implies --profile)')
+PARSER.add_argument('--debug', action='store_true', help='Print the arguments of certain functions when they raise an exception')
+PARSER.add_argument('--cell_optimization', type=int, help='Divide the field into n-by-n cells to decrease the number of comparisons (about sqrt(num_points / 2) works well)')
+PARSER.add_argument('--engine', choices=['clip', 'fortune', 'delaunay'], default='clip', help='Clip each cell against the points chosen by --cell_optimization (clip), or only against its Voronoi neighbors as found by a sweep line (fortune), or read the cells off a Delaunay triangulation and only clip those reaching the edge of the map (delaunay; ignores --vectorized and --workers)')
+PARSER.add_argument('--vectorized', action='store_true', help='Clip every cell at once with NumPy arrays instead of one cell at a time: about 6x faster on 1000 points, or 4x with --cell_optimization (requires numpy)')
+PARSER.add_argument('--workers', default=1, type=int, help='Clip cells on this many processes at once (ignored with --vectorized, and not animated)')
 PARSER.add_argument('--relaxation_passes', default=0, type=int)
 PARSER.add_argument('--relaxation_factor', default=100.0, type=float)
+PARSER.add_argument('--relaxation_method', choices=['exact', 'barnes_hut', 'lloyd'], default='exact', help='Sum the repulsion between every pair of points (exact), approximate distant groups of points with a quadtree (barnes_hut, requires numpy), or move each point to the centroid of its cell (lloyd, which ignores --relaxation_factor)')
+PARSER.add_argument('--barnes_hut_theta', default=0.5, type=float, help='Largest size/distance ratio at which a group of points is treated as a single mass; lower is more accurate (requires --relaxation_method barnes_hut)')
+PARSER.add_argument('--save_mesh', help='Save the finished cells as a binary half-edge mesh (see halfedge.py)')
+PARSER.add_argument('--render_png', help='Draw the finished cells into a PNG file, without opening a display (requires numpy)')
+PARSER.add_argument('--png_size', default=4096, type=int, help='Width and height of the --render_png image, in pixels')
+PARSER.add_argument('--cache_dir', help='Reuse the relaxed points and cells of an earlier run with the same points and settings, kept in this directory (shared safely between processes)')
+PARSER.add_argument('--cache_size', default=1024, type=int, help='Most disk space the --cache_dir may use, in megabytes; the least recently used results are deleted first')
+PARSER.add_argument('--tiles', type=int, help='Generate a map of n-by-n unit tiles, each with --num_points points, one tile at a time (requires --tile_output)')
+PARSER.add_argument('--tile_output', help='File to stream the cells of a tiled map to, one JSON object per line')
 saveLoadPoints = PARSER.add_mutually_exclusive_group()
-saveLoadPoints.add_argument('--save_points', help='Save randomly-generated points out to a file')
-saveLoadPoints.add_argument('--load_points', help='Load previously-generated points from a file')
+saveLoadPoints.add_argument('--save_points', help='Save randomly-generated points out to a file (binary if it ends in .pts, otherwise JSON)')
+saveLoadPoints.add_argument('--load_points', help='Load previously-generated points from a file (binary if it ends in .pts, otherwise JSON)')
+PARSER.add_argument('--float32', action='store_true', help='Store coordinates in .pts files with single precision, halving their size (requires --save_points)')
 ARGS = PARSER.parse_args()
 
 SIZE = 800, 800
@@ -45,10 +70,38 @@ CELL_LINE_COLOR = GRAY
 POINT_RADIUS = 5
 LINE_WIDTH = 1
 
-if ARGS.profile:
-  enable_profiling()
+selfcheck()
 
-if ARGS.animate or ARGS.display:
+if ARGS.cache_dir and (ARGS.animate or ARGS.record):
+  PARSER.error('--cache_dir skips the steps which --animate and --record show')
+
+if ARGS.profile or ARGS.profile_json or ARGS.profile_trace:
+  enable_profiling()
+if ARGS.debug:
+  enable_debugging()
+
+if ARGS.tiles:
+  # Tiled maps are streamed straight out to a file, so nothing is displayed
+  import tiles
+
+  if not ARGS.tile_output:
+    PARSER.error('--tiles requires --tile_output')
+  if ARGS.relaxation_passes and ARGS.relaxation_method != 'lloyd':
+    PARSER.error('tiled maps can only be relaxed with --relaxation_method lloyd')
+  if ARGS.sampler != 'uniform':
+    PARSER.error('tiled maps can only use --sampler uniform')
+  if ARGS.engine != 'clip' or ARGS.vectorized or ARGS.cell_optimization:
+    PARSER.error('tiled maps are always clipped one cell at a time, on a grid of their own')
+  if ARGS.load_points:
+    PARSER.error('tiled maps generate their own points, tile by tile')
+  with open(ARGS.tile_output, 'w') as outfile, instrument.phase('tiles'):
+    count = tiles.generate(ARGS.tiles, ARGS.tiles, ARGS.num_points,
+                           tiles.JsonLinesSink(outfile), ARGS.relaxation_passes, ARGS.seed)
+  print "Wrote {} cells to {}".format(count, ARGS.tile_output)
+  instrument.finish(ARGS.profile_json, ARGS.profile_trace)
+  sys.exit()
+
+if ARGS.animate or ARGS.display or ARGS.replay:
   import pygame
 
   pygame.init()
@@ -56,6 +109,7 @@ if ARGS.animate or ARGS.display:
   SURF = pygame.display.get_surface()
 
   from graphics import *
+  setup(SURF, ARGS.delay)
 
 
 shapes = []
@@ -65,124 +119,241 @@ class Shape (object):
     self.core = core
     self.vertices = [(0,0), (1,0), (1,1), (0,1)]
 
-def drawPoly(poly, color):
-  for index in range(len(poly)):
-    drawSegment((poly[index-1], poly[index]), color)
+def drawPoly(poly, color, surface):
+  return [drawSegment((poly[index-1], poly[index]), color, surface) for index in range(len(poly))]
+
+# Renderers draw onto the surface they're given, and return the rectangles they
+# drew over. Static renderers draw the same thing every frame, unless the
+# RenderStack is invalidated; see RenderStack.
 
 class ClearScreenRenderer (object):
+  static = True
   def __init__(self, color):
     self.color = color
-  def render (self):
-    SCREEN.fill(self.color)
+  def render (self, surface):
+    return [surface.fill(self.color)]
 
 class CellGridRenderer (object):
+  static = True
   def __init__(self, x_divs, y_divs, color):
     self.x_divs = x_divs
     self.y_divs = y_divs
     self.color = color
-  def render(self):
+  def render(self, surface):
+    rects = []
     for i in range(1, self.x_divs):
       x = float(i) / self.x_divs
-      drawSegment(((x,0),(x,1)), self.color)
+      rects.append(drawSegment(((x,0),(x,1)), self.color, surface))
     for i in range(1, self.y_divs):
       y = float(i) / self.y_divs
-      drawSegment(((0,y),(1,y)), self.color)
+      rects.append(drawSegment(((0,y),(1,y)), self.color, surface))
+    return rects
 
 class PointListRenderer (object):
+  static = True
   def __init__(self, point_list, color, radius=POINT_RADIUS):
     self.point_list = point_list
     self.color = color
     self.radius = radius
-  def render(self):
-    for point in self.point_list:
-      pygame.draw.circle(SURF, self.color, screenCoord(point), self.radius)
+  def render(self, surface):
+    return [
+      pygame.draw.circle(surface, self.color, screenCoord(point), self.radius)
+      for point in self.point_list
+    ]
 
 class PointMovementRenderer (object):
+  static = True
   def __init__(self, point_list_list, color):
     self.point_list_list = point_list_list
     self.color = color
-  def render(self):
+  def render(self, surface):
+    rects = []
     for listIdx in range(len(self.point_list_list)-1):
       for pointIdx in range(len(self.point_list_list[listIdx])):
-        drawSegment(
+        rects.append(drawSegment(
           (
             self.point_list_list[listIdx][pointIdx],
             self.point_list_list[listIdx+1][pointIdx]
           ),
-          self.color
-        )
+          self.color,
+          surface
+        ))
+    return rects
 
 class PointRenderer (object):
   def __init__(self, point, color, radius=POINT_RADIUS):
     self.point = point
     self.color = color
     self.radius = radius
-  def render(self):
+  def render(self, surface):
     if self.point:
-      pygame.draw.circle(SURF, self.color, screenCoord(self.point), self.radius)
+      return [pygame.draw.circle(surface, self.color, screenCoord(self.point), self.radius)]
+    return []
 
 class ShapeListRenderer (object):
+  """Draws a list of finished shapes. Shapes are only ever appended to the list
+  once they are finished, so update() just draws the ones added since the last
+  frame.
+  """
+  static = True
   def __init__(self, shape_list, color):
     self.shape_list = shape_list
     self.color = color
-  def render(self):
-    for shape in self.shape_list:
-      drawPoly(shape.vertices, self.color)
+    self.drawn = []
+  def render(self, surface):
+    self.drawn = list(self.shape_list)
+    return [rect for shape in self.drawn for rect in drawPoly(shape.vertices, self.color, surface)]
+  def update(self, surface):
+    n = len(self.drawn)
+    if self.shape_list[:n] != self.drawn:
+      return None  # Shapes were removed or replaced; start over
+    added = self.shape_list[n:]
+    self.drawn.extend(added)
+    return [rect for shape in added for rect in drawPoly(shape.vertices, self.color, surface)]
 
 class ShapeRenderer (object):
   def __init__(self, shape, color):
     self.shape = shape
     self.color = color
-  def render(self):
+  def render(self, surface):
     if self.shape:
-      drawPoly(self.shape.vertices, self.color)
+      return drawPoly(self.shape.vertices, self.color, surface)
+    return []
 
 class RenderStack (list):
+  """Renderers, drawn bottom to top
+
+  The static renderers at the bottom of the stack are drawn once onto an
+  offscreen cache, which stands in for them until they change: when the static
+  renderers are added or removed, or invalidate() is called. A static renderer
+  with an update() method adds to the cache instead (returning None if it
+  can't). The static renderers above it go on a transparent overlay, so they
+  stay on top of whatever it adds. Each frame only redraws the rest of the
+  stack, and only sends the rectangles which changed to the display.
+  """
+
+  def __init__(self):
+    list.__init__(self)
+    self.cache = None
+    self.cachedLayers = []
+    self.dirty = []
+
+  def invalidate(self):
+    self.cache = None
+
+  def _rebuild(self, static):
+    updating = [index for (index, renderer) in enumerate(static) if hasattr(renderer, 'update')]
+    split = updating[-1] + 1 if updating else len(static)
+    self.base = pygame.Surface(SCREEN.get_size())
+    for renderer in static[:split]:
+      renderer.render(self.base)
+    self.overlay = pygame.Surface(SCREEN.get_size(), pygame.SRCALPHA)
+    self.overlay.fill((0, 0, 0, 0))
+    for renderer in static[split:]:
+      renderer.render(self.overlay)
+    self.cache = self.base.copy()
+    self.cache.blit(self.overlay, (0, 0))
+    self.cachedLayers = static
+
   def render (self):
-    for renderer in self:
-      renderer.render()
-    pygame.display.flip();
+    static = list(itertools.takewhile(lambda renderer: getattr(renderer, 'static', False), self))
+    changed = []
+    if self.cache is not None and static == self.cachedLayers:
+      for renderer in static:
+        rects = renderer.update(self.base) if hasattr(renderer, 'update') else []
+        if rects is None:
+          self.cache = None
+          break
+        changed.extend(rects)
+    if self.cache is None or static != self.cachedLayers:
+      self._rebuild(static)
+      changed = None
+    else:
+      for rect in changed:
+        self.cache.blit(self.base, rect, rect)
+        self.cache.blit(self.overlay, rect, rect)
+
+    # Cover up what was drawn over the cache last frame, then draw this frame
+    if changed is None:
+      SCREEN.blit(self.cache, (0, 0))
+    else:
+      for rect in self.dirty + changed:
+        SCREEN.blit(self.cache, rect, rect)
+    drawn = []
+    for renderer in self[len(static):]:
+      drawn.extend(renderer.render(SCREEN))
+    if changed is None:
+      pygame.display.flip()
+    else:
+      pygame.display.update(self.dirty + changed + drawn)
+    self.dirty = drawn
 
 def nonOptimizedIterator (points):
   for p in points:
     yield (p, points)
 
-def bucketPointIterator (points, divs):
-  buckets = {}
-  for point in points:
-    bucketId = (int(point[0] * divs), int(point[1] * divs))
-    if bucketId in buckets:
-      buckets[bucketId].append(point)
-    else:
-      buckets[bucketId] = [point]
-
-  for ((x, y), bucket) in buckets.items():
-    adjacent_buckets = [bucket]
-    if (x+1, y  ) in buckets: adjacent_buckets.append(buckets[(x+1, y  )])
-    if (x-1, y  ) in buckets: adjacent_buckets.append(buckets[(x-1, y  )])
-    if (x  , y+1) in buckets: adjacent_buckets.append(buckets[(x  , y+1)])
-    if (x  , y-1) in buckets: adjacent_buckets.append(buckets[(x  , y-1)])
-    if (x+1, y+1) in buckets: adjacent_buckets.append(buckets[(x+1, y+1)])
-    if (x-1, y+1) in buckets: adjacent_buckets.append(buckets[(x-1, y+1)])
-    if (x+1, y-1) in buckets: adjacent_buckets.append(buckets[(x+1, y-1)])
-    if (x-1, y-1) in buckets: adjacent_buckets.append(buckets[(x-1, y-1)])
-    for item in bucket:
-      yield (item, itertools.chain.from_iterable(adjacent_buckets))
+def gridShapeIterator (points, divs):
+  # The grid search needs to watch each shape as it is clipped, so this yields
+  # the shape itself rather than its core point.
+  grid = PointGrid(points, divs)
+  for p in points:
+    s = Shape(p)
+    yield (s, grid.neighbors(s))
+
+def withShapes (pointIterator):
+  def shapeIterator (points):
+    for (p, other_points) in pointIterator(points):
+      yield (Shape(p), other_points)
+  return shapeIterator
+
+def fortuneIterator (points):
+  neighbors = voronoiNeighbors(points)
+  for (p, indices) in zip(points, neighbors):
+    yield (p, [points[index] for index in indices])
+
+if ARGS.replay:
+  import eventlog
+  import replay
+
+  log = eventlog.Replay(ARGS.replay)
+  renderStack = RenderStack()
+  renderStack.append(ClearScreenRenderer(WHITE))
+  renderStack.append(PointListRenderer(log.points, POINT_COLOR))
+  renderStack.append(ShapeListRenderer(log.shapes, LINE_COLOR))
+  activeShapeRenderer = ShapeRenderer(None, ACTIVE_LINE_COLOR)
+  activePointRenderer = PointRenderer(None, ACTIVE_POINT_COLOR)
+  consideringPointRenderer = PointRenderer(None, OTHER_POINT_COLOR)
+  renderStack.extend([activeShapeRenderer, activePointRenderer, consideringPointRenderer])
+
+  def renderReplay():
+    if log.pointsChanged:
+      renderStack.invalidate()
+      log.pointsChanged = False
+    activeShapeRenderer.shape = log.activeShape
+    activePointRenderer.point = log.activePoint
+    consideringPointRenderer.point = log.consideringPoint
+    renderStack.render()
+
+  replay.view(log, renderReplay, ARGS.delay, ARGS.replay_speed)
 
 # Points generation
+instrument.beginPhase('points')
 
 if ARGS.load_points:
-    with open(ARGS.load_points) as infile:
-        points = json.load(infile)
+    points = pointfile.load(ARGS.load_points)
 else:
-    points = [
-      (random.random(), random.random())
-      for i in range(ARGS.num_points)
-    ]
+    points = pipeline.generatePoints(ARGS.num_points, ARGS.seed, ARGS.sampler, ARGS.min_distance)
 
 if ARGS.save_points:
-    with open(ARGS.save_points, 'w') as outfile:
-        json.dump(points, outfile)
+    pointfile.save(ARGS.save_points, points, 'f' if ARGS.float32 else 'd')
+
+instrument.endPhase()
+
+eventLog = None
+if ARGS.record:
+  import eventlog
+  eventLog = eventlog.EventLog(ARGS.record)
+  eventLog.points(points)
 
 renderStack = RenderStack()
 renderStack.append(ClearScreenRenderer(WHITE))
@@ -201,104 +372,199 @@ def renderAndPause():
 
 renderAndPause()
 
-pointIterator = (
-  functools.partial(bucketPointIterator, divs=ARGS.cell_optimization) if ARGS.cell_optimization else
-  nonOptimizedIterator
-)
+def recordShape(s):
+  """Log a shape which was clipped all at once as a single step"""
+  eventLog.cellStarted(s.core)
+  eventLog.polygonUpdated(s.vertices)
+  eventLog.cellFinished()
 
-def inverseSquareRepulsion((px, py), (qx, qy)):
-  delta_x = qx - px
-  delta_y = qy - py
-  invDistanceSquared = (delta_x*delta_x + delta_y*delta_y)**2
-  return -delta_x * invDistanceSquared, -delta_y * invDistanceSquared
+shapeIterator = (
+  withShapes(fortuneIterator) if ARGS.engine == 'fortune' else
+  functools.partial(gridShapeIterator, divs=ARGS.cell_optimization) if ARGS.cell_optimization else
+  withShapes(nonOptimizedIterator)
+)
 
-repulsion = inverseSquareRepulsion
+def clipShapes(points):
+  """Clip out the cell of every point, replacing the contents of `shapes`
+
+  Return: The batchgeometry.ShapeArray the cells were built in, if --vectorized
+  """
+  instrument.beginPhase('cells')
+  activeShapeRenderer = ShapeRenderer(None, ACTIVE_LINE_COLOR)
+  renderStack.append(activeShapeRenderer)
+  activePointRenderer = PointRenderer(None, ACTIVE_POINT_COLOR)
+  renderStack.append(activePointRenderer)
+  consideringPointRenderer = PointRenderer(None, OTHER_POINT_COLOR)
+  renderStack.append(consideringPointRenderer)
+
+  del shapes[:]
+  if eventLog:
+    eventLog.cellsCleared()
+  cells = None
+  if ARGS.engine == 'delaunay':
+    # The cells are read off all at once, so there are no single steps to animate
+    from delaunay import DelaunayTriangulation
+
+    for (p, vertices) in zip(points, DelaunayTriangulation(points).voronoiCells()):
+      s = Shape(p)
+      s.vertices = vertices
+      shapes.append(s)
+      if eventLog:
+        recordShape(s)
+
+  elif ARGS.vectorized:
+    # All cells are clipped together, so there are no single steps to animate
+    import batchgeometry
+
+    if ARGS.engine == 'fortune':
+      cells = batchgeometry.clipCells(points, [
+        [points[index] for index in indices] for indices in voronoiNeighbors(points)
+      ])
+    elif ARGS.cell_optimization:
+      cells = batchgeometry.clipCellsWithGrid(PointGrid(points, ARGS.cell_optimization))
+    else:
+      cells = batchgeometry.clipCellsAgainstAll(points)
+
+    for (index, p) in enumerate(points):
+      s = Shape(p)
+      s.vertices = cells.vertices(index)
+      shapes.append(s)
+      if eventLog:
+        recordShape(s)
+
+  elif ARGS.workers > 1:
+    import parallel
+
+    for (p, vertices) in zip(points, parallel.clipCells(
+      points, ARGS.workers,
+      divs=ARGS.cell_optimization if ARGS.engine == 'clip' else None,
+      neighbors=voronoiNeighbors(points) if ARGS.engine == 'fortune' else None,
+    )):
+      s = Shape(p)
+      s.vertices = vertices
+      shapes.append(s)
+      if eventLog:
+        recordShape(s)
+
+  else:
+    for (s, other_points) in shapeIterator(points):
+      p = s.core
+      if eventLog:
+        eventLog.cellStarted(p)
+      activePointRenderer.point = p
+      activeShapeRenderer.shape = s
+
+      def bisectorApplied(q, before):
+        consideringPointRenderer.point = q
+        if eventLog:
+          eventLog.bisectorApplied(q)
+          if s.vertices is not before:
+            eventLog.polygonUpdated(s.vertices)
+        renderAndPause()
+
+      pipeline.clipCell(s, other_points, bisectorApplied)
+      shapes.append(s)
+      if eventLog:
+        eventLog.cellFinished()
+
+  renderStack.remove(activeShapeRenderer)
+  renderStack.remove(activePointRenderer)
+  renderStack.remove(consideringPointRenderer)
+
+  instrument.endPhase()
+  return cells
+
+# Cached results. --workers builds the same cells as the serial loop, so it isn't
+# part of the key. --vectorized is: its cells are the same too, but NumPy sums
+# the centroids for Lloyd relaxation in a different order, which can change the
+# last bit of the relaxed points.
+diagramCache = None
+cached = None
+if ARGS.cache_dir:
+  import cache
+  diagramCache = cache.DiagramCache(ARGS.cache_dir, ARGS.cache_size << 20)
+  cacheKey = cache.key(points, {
+    'relaxation_passes': ARGS.relaxation_passes,
+    'relaxation_method': ARGS.relaxation_method,
+    'relaxation_factor': ARGS.relaxation_factor,
+    'barnes_hut_theta': ARGS.barnes_hut_theta,
+    'cell_optimization': ARGS.cell_optimization,
+    'engine': ARGS.engine,
+    'vectorized': ARGS.vectorized,
+  })
+  with instrument.phase('cache_load'):
+    cached = diagramCache.load(cacheKey)
 
 # Relaxation
+# Lloyd relaxation moves each point to the centroid of its cell. The cells built
+# at the end of each pass are the ones the next pass starts from, and after the
+# last pass they are already the final shapes.
+shapesAreCurrent = False
+cells = None
+if cached:
+  (points[:], cachedCells) = cached
+  for (p, vertices) in zip(points, cachedCells):
+    s = Shape(p)
+    s.vertices = vertices
+    shapes.append(s)
+  shapesAreCurrent = True
+elif ARGS.relaxation_method == 'lloyd':
+  cells = clipShapes(points)
+  shapesAreCurrent = True
+
 originalPointsRenderer = PointMovementRenderer([points], OTHER_POINT_COLOR)
 renderStack.append(originalPointsRenderer)
-for i in range(ARGS.relaxation_passes):
+instrument.beginPhase('relaxation')
+for i in range(0 if cached else ARGS.relaxation_passes):
   originalPointsRenderer.point_list_list[:0] = [points[:]]
-  points[:] = [
-    vecAdd(
-      p,
-      vecMultiply(
-        ARGS.relaxation_factor,
-        vecSum([
-          repulsion(p, q)
-          for q in other_points
-          if p != q
-        #] + [
-        #  repulsion(p, (-q[0], q[1]))
-        #  for q in other_points
-        #  if p != q
-        #] + [
-        #  repulsion(p, (q[0], -q[1]))
-        #  for q in other_points
-        #  if p != q
-        #] + [
-        #  repulsion(p, (2-q[0], q[1]))
-        #  for q in other_points
-        #  if p != q
-        #] + [
-        #  repulsion(p, (q[0], 2-q[1]))
-        #  for q in other_points
-        #  if p != q
-        #] + [
-        #  # Push points away from the container border by placing virtual,
-        #  # mirror-image points on the other side of each boundary.
-        #  repulsion(p, (-p[0], p[1])),
-        #  repulsion(p, (2-p[0], p[1])),
-        #  repulsion(p, (p[0], -p[1])),
-        #  repulsion(p, (p[0], 2-p[1])),
-        ])
-      )
-    )
-    #for (p, other_points) in pointIterator(points)
-    for (p, other_points) in nonOptimizedIterator(points)
-  ]
-
-  def rail(coord):
-    return 0.0 if coord < 0.0 else 1.0 if coord > 1.0 else coord
-
-  points[:] = [ (rail(point[0]), rail(point[1])) for point in points ]
+  if ARGS.relaxation_method == 'lloyd':
+    if cells is not None:
+      (centerX, centerY) = cells.centroids()
+      points[:] = zip(centerX.tolist(), centerY.tolist())
+    else:
+      points[:] = [polygonCentroid(s.vertices) for s in shapes]
+  else:
+    points[:] = pipeline.repel(points, ARGS.relaxation_method, ARGS.relaxation_factor, ARGS.barnes_hut_theta)
+  points[:] = pipeline.rail(points)
+  renderStack.invalidate()
+  if eventLog:
+    eventLog.points(points)
+
+  if ARGS.relaxation_method == 'lloyd':
+    cells = clipShapes(points)
 
   renderAndPause()
 
+instrument.endPhase()
 renderStack.remove(originalPointsRenderer)
 
-activeShapeRenderer = ShapeRenderer(None, ACTIVE_LINE_COLOR)
-renderStack.append(activeShapeRenderer)
-activePointRenderer = PointRenderer(None, ACTIVE_POINT_COLOR)
-renderStack.append(activePointRenderer)
-consideringPointRenderer = PointRenderer(None, OTHER_POINT_COLOR)
-renderStack.append(consideringPointRenderer)
-
-for (p, other_points) in pointIterator(points):
-  s = Shape(p)
-  activePointRenderer.point = p
-  activeShapeRenderer.shape = s
-  for q in other_points:
-    consideringPointRenderer.point = q
-    if p != q:
-      # Midpoint and slope of perpendicular bisector
-      position = tuple((p + q) / 2.0 for (p, q) in zip(p, q))
-      (dx, dy) = vecSubtract(q, p)
-      slope    = (dy, -dx) # 90-degree counterclockwise rotation
-
-      s.vertices = cutShape(s.core, s.vertices, position, slope)
-
-      renderAndPause()
-
-  shapes.append(s)
-
-renderStack.remove(activeShapeRenderer)
-renderStack.remove(activePointRenderer)
-renderStack.remove(consideringPointRenderer)
-
-if ARGS.profile:
-  for (func, count) in call_counts.items():
-    print "{}.{}: {}".format(func.__module__, func.__name__, count)
+if not shapesAreCurrent:
+  cells = clipShapes(points)
+
+if diagramCache and not cached:
+  with instrument.phase('cache_store'):
+    diagramCache.store(cacheKey, points, [s.vertices for s in shapes])
+
+if eventLog:
+  eventLog.close()
+
+if ARGS.save_mesh:
+  import halfedge
+  with instrument.phase('mesh'):
+    halfedge.HalfEdgeMesh.fromPolygons([s.vertices for s in shapes], points).save(ARGS.save_mesh)
+
+if ARGS.render_png:
+  import raster
+  instrument.beginPhase('render_png')
+  if cells is not None:
+    (x, y, count) = (cells.x, cells.y, cells.count)
+  else:
+    (x, y, count) = raster.padPolygons([s.vertices for s in shapes])
+  labels = raster.labelImage(x, y, count, ARGS.png_size, ARGS.png_size)
+  raster.writePNG(ARGS.render_png, raster.colorize(labels, raster.pastelColors(len(count)), WHITE, LINE_COLOR))
+  instrument.endPhase()
+
+instrument.finish(ARGS.profile_json, ARGS.profile_trace)
 
 if ARGS.animate or ARGS.display:
   renderStack.render()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Clip Voronoi cells on a pool of worker processes
+
+Every worker receives the points (and the neighbor lists, if any) once, when it
+starts. Tasks are then just ranges of point indices, and each result comes back
+as two flat arrays rather than a list of tuples, so very little is pickled in
+either direction. Each cell is clipped with pipeline.clipCell, as mapgen2.py's
+serial loop does it, against the same points in the same order, so the cells
+are identical.
+"""
+
+import multiprocessing
+from array import array
+
+from grid import PointGrid
+from pipeline import Cell, clipCell
+
+TASKS_PER_WORKER = 4
+
+# Set in each worker process by _initialize()
+_points = None
+_grid = None
+_neighbors = None
+
+def _initialize(points, divs, neighbors):
+  global _points, _grid, _neighbors
+  _points = points
+  _grid = PointGrid(points, divs) if divs else None
+  _neighbors = neighbors
+
+def _candidates(index, cell):
+  if _neighbors is not None:
+    return [_points[other] for other in _neighbors[index]]
+  elif _grid is not None:
+    return _grid.neighbors(cell)
+  else:
+    return _points
+
+def _clipRange((start, end)):
+  """Clip the cells of points start..end-1
+
+  Return: An array of each cell's vertex count, and an array of all their
+    vertices' coordinates, as x0, y0, x1, y1, ...
+  """
+  counts = array('i')
+  coords = array('d')
+  for index in range(start, end):
+    cell = Cell(_points[index])
+    clipCell(cell, _candidates(index, cell))
+
+    counts.append(len(cell.vertices))
+    for vertex in cell.vertices:
+      coords.extend(vertex)
+  return counts, coords
+
+def clipCells(points, workers, divs=None, neighbors=None):
+  """Voronoi cells of `points` in the unit square
+
+  Parameters:
+    points -- list of (x, y) cell centers
+    workers -- number of processes to use
+    divs -- if given, find candidates with a divs-by-divs grid.PointGrid
+    neighbors -- if given, a list parallel to `points` of the indices of the
+      points to clip each cell against (such as fortune.voronoiNeighbors makes)
+
+  Return: A list parallel to `points` of each cell's vertices
+  """
+  n = len(points)
+  size = max(1, -(-n // (workers * TASKS_PER_WORKER)))
+  tasks = [(start, min(n, start + size)) for start in range(0, n, size)]
+
+  pool = multiprocessing.Pool(workers, _initialize, (points, divs, neighbors))
+  try:
+    # map() returns results in task order, whichever worker finishes first
+    results = pool.map(_clipRange, tasks, chunksize=1)
+  finally:
+    pool.terminate()
+    pool.join()
+
+  cells = []
+  for (counts, coords) in results:
+    offset = 0
+    for count in counts:
+      cells.append(zip(coords[offset:offset + 2*count:2], coords[offset + 1:offset + 2*count:2]))
+      offset += 2 * count
+  return cells
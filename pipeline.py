@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The generators' pipeline, for calling from other programs
+
+mapgen.py and mapgen2.py are command-line front ends: they parse sys.argv,
+animate, record and report as they go, calling the functions here to do the
+work and passing callbacks in to watch it. The functions take their settings
+as parameters and keep no state between calls, so any number of maps can be
+generated in one process:
+
+  points = pipeline.generatePoints(10000, seed=1)
+  points = pipeline.relax(points, passes=2, divs=70)
+  # or, evenly spread without relaxing:
+  points = pipeline.generatePoints(10000, seed=1, sampler='poisson')
+  cells = pipeline.buildVoronoi(points, divs=70)
+  segments = pipeline.buildTriangulation(points)
+  containing = pipeline.cellsAt(points, [(0.5, 0.5), (0.25, 0.75)])
+
+Importing this module is cheap. NumPy, multiprocessing and pygame are only
+loaded by the options which use them, and geometry.py's self-checks only run
+when selfcheck() is called.
+"""
+
+import itertools
+import random
+
+import geometry
+import poisson
+from delaunay import DelaunayTriangulation
+from fortune import voronoiNeighbors
+from geometry import cutBisector, polygonCentroid, segmentCompare, segmentsIntersect, vecAdd, vecMultiply, vecSum
+from grid import PointGrid, SegmentGrid
+
+class Cell (object):
+  """The Voronoi cell of the point `core`, like mapgen2.Shape"""
+  def __init__(self, core, vertices=None):
+    self.core = core
+    self.vertices = vertices or [(0,0), (1,0), (1,1), (0,1)]
+
+def generatePoints(count, seed=None, sampler='uniform', minDistance=None):
+  """Random points in the unit square, the same every time for a given seed
+
+  Parameters:
+    sampler -- 'uniform' (`count` independent points) or 'poisson' (about
+      `count` evenly spread points, no two closer than `minDistance`; see
+      poisson.py)
+    minDistance -- Minimum distance between points ('poisson' only; `count` is
+      ignored if this is given)
+  """
+  if sampler == 'poisson':
+    return poisson.sample(minDistance or poisson.distanceFor(count), seed)
+  if sampler != 'uniform':
+    raise ValueError("Unknown sampler {}".format(repr(sampler)))
+  rng = random.Random(seed)
+  return [(rng.random(), rng.random()) for i in range(count)]
+
+def inverseSquareRepulsion((px, py), (qx, qy)):
+  """Push on p away from q, as mapgen2.py's 'exact' relaxation sums it"""
+  delta_x = qx - px
+  delta_y = qy - py
+  invDistanceSquared = (delta_x*delta_x + delta_y*delta_y)**2
+  return -delta_x * invDistanceSquared, -delta_y * invDistanceSquared
+
+def rail(points):
+  """`points`, with any outside the unit square moved onto its edge"""
+  def railCoord(coord):
+    return 0.0 if coord < 0.0 else 1.0 if coord > 1.0 else coord
+  return [(railCoord(x), railCoord(y)) for (x, y) in points]
+
+def repel(points, method='exact', factor=100.0, theta=0.5):
+  """One pass of repulsion relaxation: every point pushed away from the others
+
+  Parameters:
+    method -- 'exact' (sum the repulsion between every pair of points) or
+      'barnes_hut' (approximate it; requires numpy)
+    factor -- Scale of the repulsion
+    theta -- Barnes-Hut accuracy (see barneshut.py)
+
+  Return: A new list of points, parallel to `points` (not yet railed)
+  """
+  if method == 'barnes_hut':
+    import barneshut
+    return [
+      vecAdd(p, vecMultiply(factor, force))
+      for (p, force) in zip(points, barneshut.repulsionForces(points, theta))
+    ]
+  elif method == 'exact':
+    return [
+      vecAdd(p, vecMultiply(factor, vecSum([inverseSquareRepulsion(p, q) for q in points if p != q])))
+      for p in points
+    ]
+  raise ValueError("Unknown relaxation method {}".format(repr(method)))
+
+def relax(points, passes=1, method='lloyd', factor=100.0, theta=0.5, **voronoiOptions):
+  """Spread points out, as mapgen2.py's --relaxation_method does
+
+  Parameters:
+    method -- 'lloyd' (move each point to the centroid of its cell), or one of
+      repel()'s methods
+    factor, theta -- Passed on to repel()
+    voronoiOptions -- Passed on to buildVoronoi() ('lloyd' only)
+
+  Return: A new list of points, parallel to `points`
+  """
+  points = list(points)
+  for i in range(passes):
+    if method == 'lloyd':
+      points = [polygonCentroid(cell.vertices) for cell in buildVoronoi(points, **voronoiOptions)]
+    else:
+      points = repel(points, method, factor, theta)
+    points = rail(points)
+  return points
+
+def clipCell(cell, candidates, onBisector=None):
+  """Clip `cell` by its bisector with each of `candidates` in turn
+
+  Parameters:
+    candidates -- Points, which may be generated as the cell shrinks (as
+      grid.PointGrid.neighbors does)
+    onBisector -- Called as onBisector(q, before) after each cut, with the
+      vertices from before it; `cell.vertices is not before` if it changed
+      anything. The core itself is skipped.
+
+  Return: `cell`
+  """
+  p = cell.core
+  for q in candidates:
+    if p != q:
+      before = cell.vertices
+      cell.vertices = cutBisector(p, before, q)
+      if onBisector:
+        onBisector(q, before)
+  return cell
+
+def buildVoronoi(points, divs=None, engine='clip', vectorized=False, workers=1, triangulation=None):
+  """Voronoi cells of `points` in the unit square, as mapgen2.py builds them
+
+  Parameters:
+    divs -- Only clip each cell against the points in a divs-by-divs
+      grid.PointGrid around it (about sqrt(len(points) / 2) works well)
+    engine -- 'clip' (against every point, or those found with `divs`),
+      'fortune' (only against the cell's neighbors, found by a sweep line) or
+      'delaunay' (read off a Delaunay triangulation, in linear time once it is
+      built; ignores `divs`, `vectorized` and `workers`)
+    vectorized -- Clip every cell at once with batchgeometry (requires numpy)
+    workers -- Clip cells on this many processes (ignored if `vectorized`)
+    triangulation -- A delaunay.DelaunayTriangulation of `points` to reuse
+      ('delaunay' only)
+
+  Return: A list of Cells, parallel to `points`
+  """
+  if engine == 'delaunay':
+    triangulation = triangulation or DelaunayTriangulation(points)
+    return [Cell(p, vertices) for (p, vertices) in zip(points, triangulation.voronoiCells())]
+  if engine not in ('clip', 'fortune'):
+    raise ValueError("Unknown Voronoi engine {}".format(repr(engine)))
+  neighbors = voronoiNeighbors(points) if engine == 'fortune' else None
+
+  if vectorized:
+    import batchgeometry
+    if neighbors is not None:
+      shapes = batchgeometry.clipCells(points, [[points[index] for index in indices] for indices in neighbors])
+    elif divs:
+      shapes = batchgeometry.clipCellsWithGrid(PointGrid(points, divs))
+    else:
+      shapes = batchgeometry.clipCellsAgainstAll(points)
+    return [Cell(p, shapes.vertices(index)) for (index, p) in enumerate(points)]
+
+  if workers > 1:
+    import parallel
+    return [
+      Cell(p, vertices)
+      for (p, vertices) in zip(points, parallel.clipCells(
+        points, workers, divs=divs if neighbors is None else None, neighbors=neighbors))
+    ]
+
+  grid = PointGrid(points, divs) if divs and neighbors is None else None
+  cells = []
+  for (index, p) in enumerate(points):
+    cell = Cell(p)
+    clipCell(cell,
+      [points[other] for other in neighbors[index]] if neighbors is not None else
+      grid.neighbors(cell) if grid is not None else
+      points
+    )
+    cells.append(cell)
+  return cells
+
+def cellsAt(points, queries, siteIndex=None):
+  """Which cell contains each of `queries`
+
+  Every engine builds the cells in the same order as `points`, so the index of
+  the nearest point is also the index of the containing cell.
+
+  Parameters:
+    queries -- An array-like of shape (m, 2)
+    siteIndex -- A kdtree.KDTree of `points` to reuse, when there are several
+      batches of queries (requires numpy either way)
+
+  Return: An integer array of m indices into `points` and its cells (-1 if
+    `points` is empty)
+  """
+  if siteIndex is None:
+    import kdtree
+    siteIndex = kdtree.KDTree(points)
+  return siteIndex.query(queries)
+
+def buildTriangulation(points, engine='delaunay', neighbors=0, vectorized=False, onSegment=None):
+  """Non-crossing segments between `points`, as mapgen.py finds them
+
+  Parameters:
+    engine -- 'delaunay' (a true Delaunay triangulation), 'shortest_first'
+      (accept pairs of points shortest first unless they cross an accepted
+      segment) or 'greedy' (consider every pair in turn; each crossing is
+      settled in favor of the shorter segment)
+    neighbors -- Only pair each point with this many of its nearest neighbors
+      ('shortest_first' only; 0 pairs it with every point)
+    vectorized -- Test each pair against every accepted segment at once with
+      batchgeometry ('greedy' only; requires numpy)
+    onSegment -- Called as onSegment(segment, accepted, invalidated, blockedBy)
+      as each pair is settled ('shortest_first' and 'greedy' only): whether it
+      was accepted, the accepted segments it evicted and the shorter ones which
+      kept it out ('greedy' only; both are empty lists for 'shortest_first')
+
+  Return: A list of ((x0, y0), (x1, y1)) segments
+  """
+  if engine == 'delaunay':
+    return DelaunayTriangulation(points).segments()
+
+  elif engine == 'shortest_first':
+    divs = max(1, int((len(points) / 2) ** 0.5))
+    accepted = SegmentGrid(divs, segmentsIntersect)
+    if neighbors:
+      pointGrid = PointGrid(points, divs)
+      pairs = set(
+        (min(i, j), max(i, j))
+        for (i, p) in enumerate(points)
+        for j in pointGrid.nearest(p, neighbors + 1)
+        if i != j
+      )
+    else:
+      pairs = itertools.combinations(range(len(points)), 2)
+
+    def lengthSquared((i, j)):
+      dx = points[i][0] - points[j][0]
+      dy = points[i][1] - points[j][1]
+      return dx*dx + dy*dy
+
+    # Nothing accepted is ever evicted, since anything it crosses later is at
+    # least as long
+    segments = []
+    for (i, j) in sorted(pairs, key=lambda pair: (lengthSquared(pair), pair)):
+      segment = (points[i], points[j])
+      crosses = accepted.crosses(segment)
+      if not crosses:
+        accepted.add(segment)
+        segments.append(segment)
+      if onSegment:
+        onSegment(segment, not crosses, [], [])
+    return segments
+
+  elif engine == 'greedy':
+    segments = []
+    # NumPy copy of `segments`, kept in step with it
+    accepted = None
+    if vectorized:
+      import batchgeometry
+      accepted = batchgeometry.SegmentSet()
+
+    for newSegment in itertools.combinations(points, 2):
+      dooming = []
+      doomedBy = []
+      if accepted is not None:
+        # Same tests as below, but the intersection tests are done all at once
+        doomedSlots = []
+        for slot in accepted.crossing(newSegment):
+          existing = accepted.segments[slot]
+          if segmentCompare(newSegment, existing) <= 0:
+            dooming.append(existing)
+            doomedSlots.append(slot)
+          else:
+            doomedBy.append(existing)
+        for slot in doomedSlots:
+          accepted.remove(slot)
+      else:
+        for existing in segments:
+          if segmentsIntersect(newSegment, existing):
+            if segmentCompare(newSegment, existing) <= 0:
+              dooming.append(existing)
+            else:
+              doomedBy.append(existing)
+      for doomed in dooming:
+        segments.remove(doomed)
+      if not doomedBy:
+        segments.append(newSegment)
+        if accepted is not None:
+          accepted.add(newSegment)
+      if onSegment:
+        onSegment(newSegment, not doomedBy, dooming, doomedBy)
+    return segments
+
+  else:
+    raise ValueError("Unknown triangulation engine {}".format(repr(engine)))
+
+def draw(surface, cells=(), segments=(), points=(), color=(0,0,127), pointColor=(0,0,255), pointRadius=3):
+  """Draw a map onto a pygame surface, with the unit square filling it
+
+  (Imports pygame, which nothing else here needs.)
+  """
+  import pygame
+  import graphics
+
+  graphics.setup(surface)
+  for cell in cells:
+    vertices = cell.vertices
+    for index in range(len(vertices)):
+      graphics.drawSegment((vertices[index - 1], vertices[index]), color)
+  for segment in segments:
+    graphics.drawSegment(segment, color)
+  for point in points:
+    pygame.draw.circle(surface, pointColor, graphics.screenCoord(point), pointRadius)
+
+def selfcheck():
+  """Run geometry.py's checks, and check that small maps come out whole: the
+  cells tile the unit square, whichever way they're built or the points are
+  sampled, and no two segments of a triangulation cross
+  """
+  import sweep
+
+  geometry.selfcheck()
+  points = generatePoints(40, seed=0)
+
+  def area(vertices):
+    return 0.5 * abs(sum(
+      x0 * y1 - x1 * y0
+      for ((x0, y0), (x1, y1)) in zip(vertices, vertices[1:] + vertices[:1])
+    ))
+  for options in ({}, {'divs': 4}, {'engine': 'fortune'}, {'engine': 'delaunay'}):
+    total = sum(area(cell.vertices) for cell in buildVoronoi(points, **options))
+    assert abs(total - 1.0) < 1e-9, "Cells built with {} cover an area of {}".format(options, total)
+
+  spread = generatePoints(40, seed=0, sampler='poisson', minDistance=0.1)
+  assert spread == generatePoints(40, seed=0, sampler='poisson', minDistance=0.1)
+  assert all(
+    (px - qx) ** 2 + (py - qy) ** 2 >= 0.1 ** 2
+    for ((px, py), (qx, qy)) in itertools.combinations(spread, 2)
+  ), "Poisson-disk points are closer than the minimum distance"
+  total = sum(area(cell.vertices) for cell in buildVoronoi(spread, engine='delaunay'))
+  assert abs(total - 1.0) < 1e-9, "Cells of Poisson-disk points cover an area of {}".format(total)
+
+  for engine in ('delaunay', 'shortest_first', 'greedy'):
+    crossing = sweep.crossings(buildTriangulation(points, engine))
+    assert not crossing, "The {} engine's segments cross: {}".format(engine, crossing)
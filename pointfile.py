@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Reading and writing point files
+
+Files ending in .pts are binary: a 16-byte header followed by the points as one
+contiguous array of little-endian x, y pairs. The header is
+
+  bytes 0-3   magic number "MGPT"
+  byte  4     format version (1)
+  byte  5     'd' for float64 coordinates, or 'f' for float32
+  bytes 6-7   unused (zero)
+  bytes 8-15  number of points, as a little-endian unsigned 64-bit integer
+
+so the coordinates start 8-byte aligned, and can be memory-mapped in place.
+Anything else is read and written as a JSON list of [x, y] pairs.
+"""
+
+import json
+import os
+import struct
+from array import array
+
+MAGIC = 'MGPT'
+VERSION = 1
+HEADER = struct.Struct('<4sBc2xQ')
+BINARY_EXTENSION = '.pts'
+BIG_ENDIAN = struct.pack('=H', 1) != struct.pack('<H', 1)
+
+def isBinary(path):
+  return os.path.splitext(path)[1].lower() == BINARY_EXTENSION
+
+def _readHeader(infile, path):
+  header = infile.read(HEADER.size)
+  if len(header) < HEADER.size:
+    raise ValueError("{} is too short to be a point file".format(path))
+  (magic, version, typecode, count) = HEADER.unpack(header)
+  if magic != MAGIC:
+    raise ValueError("{} is not a point file".format(path))
+  if version != VERSION or typecode not in ('d', 'f'):
+    raise ValueError("{} has unsupported version {} or type '{}'".format(path, version, typecode))
+  return typecode, count
+
+def mapPoints(path):
+  """Memory-map a binary point file (requires numpy)
+
+  Nothing is read until it is used, so even huge files open instantly, and
+  processes mapping the same file share its pages.
+
+  Return: A read-only (n, 2) numpy array
+  """
+  import numpy
+
+  with open(path, 'rb') as infile:
+    (typecode, count) = _readHeader(infile, path)
+  dtype = numpy.dtype('<f8' if typecode == 'd' else '<f4')
+  if count == 0:
+    return numpy.zeros((0, 2), dtype=dtype)
+  return numpy.memmap(path, dtype=dtype, mode='r', offset=HEADER.size, shape=(count, 2))
+
+def load(path):
+  """Read points from a binary or JSON point file, depending on its extension
+
+  Return: A list of (x, y) tuples, which (unlike JSON's lists) can be used as
+    dictionary keys, as the event log and the Delaunay engine do
+  """
+  if not isBinary(path):
+    with open(path) as infile:
+      return [(x, y) for (x, y) in json.load(infile)]
+
+  with open(path, 'rb') as infile:
+    (typecode, count) = _readHeader(infile, path)
+    coords = array(typecode)
+    coords.fromfile(infile, 2 * count)
+  if BIG_ENDIAN:
+    coords.byteswap()
+  return zip(coords[0::2].tolist(), coords[1::2].tolist())
+
+def save(path, points, typecode='d'):
+  """Write points to a binary or JSON point file, depending on its extension
+
+  Parameters:
+    typecode -- 'd' to store binary coordinates as float64, or 'f' for float32
+  """
+  if not isBinary(path):
+    with open(path, 'w') as outfile:
+      json.dump(points, outfile)
+    return
+
+  coords = array(typecode)
+  for (x, y) in points:
+    coords.append(x)
+    coords.append(y)
+  if BIG_ENDIAN:
+    coords.byteswap()
+  with open(path, 'wb') as outfile:
+    outfile.write(HEADER.pack(MAGIC, VERSION, typecode, len(coords) // 2))
+    coords.tofile(outfile)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Poisson-disk sampling: random points no two of which are closer than a
+minimum distance
+
+This is Bridson's algorithm ("Fast Poisson Disk Sampling in Arbitrary
+Dimensions", 2007). Points are kept in a background grid of square buckets
+r/sqrt(2) wide, so each bucket holds at most one point, and whether a candidate
+is far enough from every point only takes looking at the 5-by-5 block of
+buckets around it. Starting from one random point, the sampler repeatedly picks
+an active point and tries up to `attempts` random candidates between r and 2r
+away from it; the first one far enough from everything is added and made
+active, and if none is, the point is retired. It stops when no point is active,
+having visited each point a bounded number of times, so it runs in linear time.
+
+The points come out evenly spread, much as relaxation leaves uniformly random
+points, without any of relaxation's passes. The number of points isn't chosen
+directly, but it is close to PACKING_DENSITY / r^2 per unit of area;
+distanceFor() gives the r to use for about a given number of points.
+"""
+
+import math
+import random
+
+# Points per unit of area when the sampler is run to completion with r = 1,
+# measured on the unit square with the default number of attempts
+PACKING_DENSITY = 0.62
+
+def distanceFor(count, area=1.0):
+  """Minimum distance at which the sampler puts about `count` points into a
+  region of `area`
+  """
+  return math.sqrt(PACKING_DENSITY * area / count)
+
+def sample(minDistance, seed=None, attempts=30, ((xmin, xmax), (ymin, ymax))=((0,1),(0,1))):
+  """Poisson-disk sample of the rectangle (the unit square by default)
+
+  Parameters:
+    minDistance -- No two points are closer than this
+    seed -- Seed of the random number generator, so that the same points come
+      out every time; None seeds it from the system, like random.Random
+    attempts -- Candidates tried around each point before retiring it; fewer
+      is faster but leaves bigger gaps
+
+  Return: A list of points, in the order they were found
+  """
+  if minDistance <= 0:
+    raise ValueError("The minimum distance must be positive, not {}".format(minDistance))
+  rng = random.Random(seed)
+  width = xmax - xmin
+  height = ymax - ymin
+  cellSize = minDistance / math.sqrt(2)
+  columns = int(math.ceil(width / cellSize))
+  rows = int(math.ceil(height / cellSize))
+
+  # Index of the point in each bucket, or -1. The grid is padded by two buckets
+  # on every side, so the 5-by-5 search needs no bounds checks.
+  stride = columns + 4
+  buckets = [-1] * (stride * (rows + 4))
+  # Offsets of the buckets which can hold a point closer than minDistance to a
+  # point in the middle bucket: the 5-by-5 block without its corners
+  offsets = [
+    dj * stride + di
+    for dj in range(-2, 3) for di in range(-2, 3)
+    if (abs(di), abs(dj)) != (2, 2)
+  ]
+  minDistanceSquared = minDistance * minDistance
+
+  xs = []
+  ys = []
+  def add(x, y):
+    index = len(xs)
+    xs.append(x)
+    ys.append(y)
+    buckets[(int((y - ymin) / cellSize) + 2) * stride + int((x - xmin) / cellSize) + 2] = index
+    active.append(index)
+
+  active = []
+  add(xmin + rng.random() * width, ymin + rng.random() * height)
+
+  uniform = rng.random
+  twoPi = 2 * math.pi
+  while active:
+    slot = int(uniform() * len(active))
+    index = active[slot]
+    (px, py) = (xs[index], ys[index])
+    for attempt in range(attempts):
+      # Uniform in area over the annulus between r and 2r
+      distance = minDistance * math.sqrt(1 + 3 * uniform())
+      angle = twoPi * uniform()
+      x = px + distance * math.cos(angle)
+      y = py + distance * math.sin(angle)
+      if not (xmin <= x < xmax and ymin <= y < ymax):
+        continue
+      center = (int((y - ymin) / cellSize) + 2) * stride + int((x - xmin) / cellSize) + 2
+      for offset in offsets:
+        other = buckets[center + offset]
+        if other >= 0:
+          dx = xs[other] - x
+          dy = ys[other] - y
+          if dx*dx + dy*dy < minDistanceSquared:
+            break
+      else:
+        add(x, y)
+        break
+    else:
+      # Retire the point: swap it with the last active one and drop it
+      active[slot] = active[-1]
+      active.pop()
+
+  return zip(xs, ys)
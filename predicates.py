@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Geometric predicates which never get the sign wrong
+
+Which side of a line a point is on, or whether it's inside a circle, comes down
+to the sign of a small determinant. Worked out in floating point, rounding can
+give it the wrong sign -- or zero -- when the answer is close, and the
+algorithms built on it then see impossible things (a line crossing a convex
+polygon three times, say).
+
+Each predicate here is done in two stages, after Shewchuk ("Adaptive Precision
+Floating-Point Arithmetic and Fast Robust Geometric Predicates", 1997):
+
+1. The determinant is worked out in floating point, along with a bound on how
+   far rounding could have moved it. If it is farther from zero than that, its
+   sign is right, and it is returned as is. This is nearly always the case.
+
+2. Otherwise it is worked out again exactly. Every float is a fraction with a
+   power-of-two denominator, so fractions.Fraction does this without any error.
+
+Shewchuk's exact stages work on expansions of floats, which are much faster
+than Fractions in C but not in Python; since the exact stage only runs on
+near-degenerate input, its speed hardly matters here.
+
+Every predicate returns a float with the sign of the exact determinant: the
+determinant itself from stage 1, or -1.0, 0.0 or 1.0 from stage 2.
+"""
+
+from fractions import Fraction
+
+# Half the distance from 1.0 to the next float
+EPSILON = 2.0 ** -53
+
+# Relative error bounds of the floating-point determinants (Shewchuk's
+# ccwerrboundA and iccerrboundA)
+ORIENT_ERROR = (3.0 + 16.0 * EPSILON) * EPSILON
+INCIRCLE_ERROR = (10.0 + 96.0 * EPSILON) * EPSILON
+
+# Largest relative error circumcenter() accepts in a floating-point circumcenter
+# (in its offset from the triangle's first corner)
+CIRCUMCENTER_ERROR = 2.0 ** -40
+
+def _sign(value):
+  return 1.0 if value > 0 else -1.0 if value < 0 else 0.0
+
+def orient2dExact((ax, ay), (bx, by), (cx, cy)):
+  """orient2d() as an exact Fraction"""
+  (ax, ay, bx, by, cx, cy) = map(Fraction, (ax, ay, bx, by, cx, cy))
+  return (ax - cx) * (by - cy) - (ay - cy) * (bx - cx)
+
+def orient2d(a, b, c):
+  """Twice the signed area of triangle abc: positive if a, b and c are in
+  counterclockwise order, negative if clockwise and zero if they are collinear
+  """
+  (ax, ay), (bx, by), (cx, cy) = a, b, c
+  left = (ax - cx) * (by - cy)
+  right = (ay - cy) * (bx - cx)
+  det = left - right
+  if abs(det) > ORIENT_ERROR * (abs(left) + abs(right)):
+    return det
+  return _sign(orient2dExact(a, b, c))
+
+def lineSideExact((xc, yc), (mx, my), (x, y)):
+  """lineSide() as an exact Fraction"""
+  (xc, yc, mx, my, x, y) = map(Fraction, (xc, yc, mx, my, x, y))
+  return my * (x - xc) - mx * (y - yc)
+
+def lineSide(point, direction, q):
+  """Which side of the line through `point` parallel to `direction` q is on:
+  positive if on the right (looking along `direction`), negative if on the left
+  and zero if on the line. This is the numerator of
+  geometry.segmentAndLineIntersection().
+  """
+  (xc, yc), (mx, my), (x, y) = point, direction, q
+  left = my * (x - xc)
+  right = mx * (y - yc)
+  det = left - right
+  if abs(det) > ORIENT_ERROR * (abs(left) + abs(right)):
+    return det
+  return _sign(lineSideExact(point, direction, q))
+
+def incircleExact((ax, ay), (bx, by), (cx, cy), (dx, dy)):
+  """incircle() as an exact Fraction"""
+  (ax, ay, bx, by, cx, cy, dx, dy) = map(Fraction, (ax, ay, bx, by, cx, cy, dx, dy))
+  (adx, ady, bdx, bdy, cdx, cdy) = (ax - dx, ay - dy, bx - dx, by - dy, cx - dx, cy - dy)
+  return (
+    (adx * adx + ady * ady) * (bdx * cdy - cdx * bdy) +
+    (bdx * bdx + bdy * bdy) * (cdx * ady - adx * cdy) +
+    (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady)
+  )
+
+def incircle(a, b, c, d):
+  """Positive if d lies inside the circumcircle of counterclockwise triangle
+  abc, negative if outside and zero if on it
+  """
+  (ax, ay), (bx, by), (cx, cy), (dx, dy) = a, b, c, d
+  adx = ax - dx
+  ady = ay - dy
+  bdx = bx - dx
+  bdy = by - dy
+  cdx = cx - dx
+  cdy = cy - dy
+  bdxcdy = bdx * cdy
+  cdxbdy = cdx * bdy
+  cdxady = cdx * ady
+  adxcdy = adx * cdy
+  adxbdy = adx * bdy
+  bdxady = bdx * ady
+  alift = adx * adx + ady * ady
+  blift = bdx * bdx + bdy * bdy
+  clift = cdx * cdx + cdy * cdy
+  det = alift * (bdxcdy - cdxbdy) + blift * (cdxady - adxcdy) + clift * (adxbdy - bdxady)
+  permanent = (
+    (abs(bdxcdy) + abs(cdxbdy)) * alift +
+    (abs(cdxady) + abs(adxcdy)) * blift +
+    (abs(adxbdy) + abs(bdxady)) * clift
+  )
+  if abs(det) > INCIRCLE_ERROR * permanent:
+    return det
+  return _sign(incircleExact(a, b, c, d))
+
+def circumcenterExact((ax, ay), (bx, by), (cx, cy)):
+  """circumcenter() as a pair of Fractions, or None if a, b and c are collinear"""
+  (ax, ay, bx, by, cx, cy) = map(Fraction, (ax, ay, bx, by, cx, cy))
+  (bax, bay, cax, cay) = (bx - ax, by - ay, cx - ax, cy - ay)
+  d = 2 * (bax * cay - bay * cax)
+  if d == 0:
+    return None
+  b2 = bax * bax + bay * bay
+  c2 = cax * cax + cay * cay
+  return (ax + (cay * b2 - bay * c2) / d, ay + (bax * c2 - cax * b2) / d)
+
+def circumcenter(a, b, c):
+  """Center of the circle through a, b and c, worked out in floating point
+
+  This isn't a predicate, but it has the same trouble: for a sliver triangle
+  (nearly collinear, or with two corners nearly on top of each other) the
+  result is a quotient of two small differences, and can be wildly wrong even
+  when the sign of orient2d's determinant is certain. The rounding error is
+  bounded as it's worked out, like a predicate's.
+
+  Return: (x, y), or None if rounding could have put its offset from a off by
+    more than CIRCUMCENTER_ERROR of itself (or a, b and c are collinear); use
+    circumcenterExact() then, or avoid relying on it
+  """
+  (ax, ay), (bx, by), (cx, cy) = a, b, c
+  bax = bx - ax
+  bay = by - ay
+  cax = cx - ax
+  cay = cy - ay
+  left = bax * cay
+  right = bay * cax
+  det = left - right
+  detError = ORIENT_ERROR * (abs(left) + abs(right))
+  if not abs(det) > detError:
+    return None
+  b2 = bax * bax + bay * bay
+  c2 = cax * cax + cay * cay
+  numeratorX = cay * b2 - bay * c2
+  numeratorY = bax * c2 - cax * b2
+  # Each difference, square and product above is rounded once or twice
+  numeratorError = 8.0 * EPSILON * (abs(cay) * b2 + abs(bay) * c2 + abs(bax) * c2 + abs(cax) * b2)
+  numerators = abs(numeratorX) + abs(numeratorY)
+  if not numeratorError + numerators * detError / abs(det) < CIRCUMCENTER_ERROR * numerators:
+    return None
+  d = 2.0 * det
+  return (ax + numeratorX / d, ay + numeratorY / d)
+
+def selfcheck():
+  """Check the predicates on inputs where plain floats get the sign wrong"""
+  # Points on the line y = x, and nudged off it by a tiny amount; the float
+  # determinant of the nudged ones comes out zero
+  assert orient2d((0.5, 0.5), (12.0, 12.0), (24.0, 24.0)) == 0
+  assert orient2d((0.5, 0.5 + 2 ** -53), (12.0, 12.0), (24.0, 24.0)) > 0
+  assert orient2d((0.5 + 2 ** -53, 0.5), (12.0, 12.0), (24.0, 24.0)) < 0
+  assert orient2d((0, 0), (1, 0), (0, 1)) > 0
+  assert lineSide((0.5, 0.5), (1.0, 1.0), (0.1, 0.1)) == 0
+  assert lineSide((0.5, 0.5), (1.0, 1.0), (0.1, 0.1 + 2 ** -56)) < 0
+  assert lineSide((0.5, 0.5), (1.0, 1.0), (0.1 + 2 ** -56, 0.1)) > 0
+  # Four cocircular points, and one just inside the circle
+  assert incircle((0, 0), (1, 0), (1, 1), (0, 1)) == 0
+  assert incircle((0, 0), (1, 0), (1, 1), (0, 1 - 2 ** -53)) > 0
+  assert incircle((0.1, 0.1), (0.3, 0.1), (0.3, 0.3), (0.1, 0.3)) == 0
+  # A sliver: two corners a few units in the last place apart, where the
+  # determinant's sign is certain but the rounded circumcenter is far off
+  sliver = ((0.03846153846253846, 0.42307692307702305), (0.11538461538461539, 0.4230769230769231), (0.11538461538461549, 0.4230769230769232))
+  assert circumcenter(*sliver) is None
+  assert circumcenterExact(*sliver) is not None
+  assert circumcenter((0, 0), (2, 0), (0, 2)) == (1, 1)
+  assert circumcenter((0, 0), (1, 1), (2, 2)) is None
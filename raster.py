@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Headless rendering of convex polygons to PNG files (requires numpy)
+
+Polygons are filled by scanline: every edge is intersected with the center of
+every pixel row it spans, all at once, which gives each polygon one span per
+row. Marking where each span starts and filling rightward along each row then
+labels every pixel with the polygon covering it. Outlines are drawn wherever
+two neighboring pixels have different labels. Nothing is drawn one shape, or
+one segment, at a time.
+
+This is not quite as fast as hoped: a 4096x4096 map of 100k cells takes about
+1.7 s from shapes to PNG file, not well under a second. Labeling the pixels
+takes about 0.7 s, most of it in passes over the whole image which are already
+bound by memory; colorizing takes 0.3 s; and zlib alone takes 0.4 s to compress
+the 50 MB of pixel rows, even at its fastest level.
+
+Coordinates follow graphics.screenCoord: (0, 0) is the top-left corner of the
+image and (1, 1) the bottom-right.
+"""
+
+import itertools
+import struct
+import zlib
+
+import numpy
+
+BACKGROUND = -1
+
+def padPolygons(polygons):
+  """Lists of vertices as padded arrays, the same layout as
+  batchgeometry.ShapeArray
+
+  Return: x and y arrays of shape (n, longest), and an array of vertex counts
+  """
+  count = numpy.fromiter(itertools.imap(len, polygons), dtype=int, count=len(polygons))
+  width = count.max() if len(count) else 0
+  # fromiter skips building a list of every coordinate first, which takes
+  # longer than the rest of this function put together
+  chain = itertools.chain.from_iterable
+  flat = numpy.fromiter(chain(chain(polygons)), dtype=float, count=2 * count.sum()).reshape(-1, 2)
+  rows = numpy.repeat(numpy.arange(len(polygons)), count)
+  columns = numpy.arange(len(flat)) - numpy.repeat(numpy.cumsum(count) - count, count)
+  x = numpy.zeros((len(polygons), width))
+  y = numpy.zeros((len(polygons), width))
+  x[rows, columns] = flat[:, 0]
+  y[rows, columns] = flat[:, 1]
+  return x, y, count
+
+def labelImage(x, y, count, width, height):
+  """Which convex polygon covers the center of each pixel
+
+  Parameters: Padded polygon arrays, as returned by padPolygons, and the size
+    of the image in pixels
+
+  Return: A (height, width) integer array of polygon indices, or BACKGROUND
+  """
+  n = len(count)
+  if not n:
+    return numpy.full((height, width), BACKGROUND, dtype=numpy.int32)
+
+  # Every edge, in pixel coordinates, running from vertex k to vertex k+1
+  columns = numpy.arange(x.shape[1])
+  valid = columns < count[:, None]
+  following = numpy.where(columns + 1 < count[:, None], columns + 1, 0)
+  rows = numpy.arange(n)[:, None]
+  x0 = (x * width)[valid]
+  y0 = (y * height)[valid]
+  x1 = (x[rows, following] * width)[valid]
+  y1 = (y[rows, following] * height)[valid]
+  polygon = numpy.broadcast_to(rows, valid.shape)[valid]
+
+  # Rows whose centers (r + 0.5) each edge crosses, counting its upper end but
+  # not its lower one, so a convex polygon crosses each row exactly twice.
+  # Crossings are worked out from the upper end, so the two polygons sharing an
+  # edge get exactly the same ones, and leave no gap between them.
+  downward = y1 > y0
+  (topX, topY) = (numpy.where(downward, x0, x1), numpy.where(downward, y0, y1))
+  first = numpy.clip(numpy.ceil(topY - 0.5), 0, height).astype(int)
+  last = numpy.clip(numpy.ceil(numpy.maximum(y0, y1) - 0.5), 0, height).astype(int)
+  with numpy.errstate(divide='ignore', invalid='ignore'):
+    slope = (x1 - x0) / (y1 - y0)
+    firstX = topX + (first + 0.5 - topY) * slope
+
+  # Going around a convex polygon, the edges heading down the image form one
+  # side and the edges heading up form the other, which side depending on the
+  # polygon's orientation. So each of a polygon's rows has one crossing from
+  # each side, and they can go straight into a slot for that row without sorting.
+  area = numpy.bincount(polygon, x0 * y1 - x1 * y0, minlength=n)
+  isLeft = downward == (area[polygon] < 0)
+  present = count > 0
+  groups = (numpy.cumsum(count) - count)[present]
+  firstRow = numpy.zeros(n, dtype=int)
+  rowCount = numpy.zeros(n, dtype=int)
+  firstRow[present] = numpy.minimum.reduceat(first, groups)
+  rowCount[present] = numpy.maximum.reduceat(last, groups) - firstRow[present]
+  offset = numpy.cumsum(rowCount) - rowCount
+  firstSlot = (offset - firstRow)[polygon] + first
+  leftX = numpy.full(rowCount.sum(), numpy.nan)
+  rightX = numpy.full(rowCount.sum(), numpy.nan)
+  for (side, crossings) in ((isLeft, leftX), (~isLeft, rightX)):
+    rowsCrossed = (last - first)[side]
+    step = numpy.arange(rowsCrossed.sum()) - numpy.repeat(numpy.cumsum(rowsCrossed) - rowsCrossed, rowsCrossed)
+    crossings[numpy.repeat(firstSlot[side], rowsCrossed) + step] = (
+      numpy.repeat(firstX[side], rowsCrossed) + step * numpy.repeat(slope[side], rowsCrossed))
+
+  spanPolygon = numpy.repeat(numpy.arange(n, dtype=numpy.int32), rowCount)
+  spanRow = numpy.repeat(firstRow - offset, rowCount) + numpy.arange(len(leftX))
+  with numpy.errstate(invalid='ignore'):
+    left = numpy.clip(numpy.ceil(leftX - 0.5), 0, width)
+    right = numpy.clip(numpy.ceil(rightX - 0.5), 0, width)
+    nonEmpty = right > left   # False for NaN, where a polygon wasn't convex
+  (spanPolygon, spanRow, left, right) = (spanPolygon[nonEmpty], spanRow[nonEmpty],
+                                         left[nonEmpty].astype(int), right[nonEmpty].astype(int))
+
+  # Mark where spans start (and where they stop, if nothing starts there), then
+  # carry each mark rightward to the next one
+  rowStart = spanRow * (width + 1)
+  starts = rowStart + left
+  marks = numpy.full((height, width + 1), BACKGROUND, dtype=numpy.int32)
+  marks.ravel()[starts] = spanPolygon
+  position = numpy.zeros((height, width + 1), dtype=numpy.int32)
+  position.ravel()[rowStart + right] = right
+  position.ravel()[starts] = left
+  numpy.maximum.accumulate(position, axis=1, out=position)
+  position += numpy.arange(0, height * (width + 1), width + 1, dtype=numpy.int32)[:, None]
+  return marks.ravel()[position[:, :width]]
+
+def colorize(labels, colors, background=(255, 255, 255), outline=None):
+  """RGB image of a label image
+
+  Parameters:
+    colors -- (n, 3) array of fill colors, one per polygon
+    outline -- if given, the color of the pixels along polygon boundaries
+
+  Return: A (height, width, 3) uint8 array
+  """
+  palette = [numpy.asarray(colors, dtype=numpy.uint8).reshape(-1, 3)]
+  if outline is not None:
+    edge = numpy.zeros(labels.shape, dtype=bool)
+    edge[:, 1:] = labels[:, 1:] != labels[:, :-1]
+    edge[1:, :] |= labels[1:, :] != labels[:-1, :]
+    labels = numpy.where(edge, numpy.int32(-2), labels)
+    palette.append(numpy.array([outline], dtype=numpy.uint8))
+  palette.append(numpy.array([background], dtype=numpy.uint8))
+  # BACKGROUND (-1) picks the last entry, and outlines (-2) the one before it
+  return numpy.take(numpy.vstack(palette), labels, axis=0)
+
+def pastelColors(n, seed=0):
+  """n random light colors, the same every time for a given seed"""
+  return numpy.random.RandomState(seed).randint(155, 256, size=(n, 3)).astype(numpy.uint8)
+
+def writePNG(path, image, level=1):
+  """Write a (height, width, 3) uint8 array as an RGB PNG file"""
+  (height, width) = image.shape[:2]
+  # Each row starts with a filter type byte (0: no filter)
+  raw = numpy.zeros((height, 1 + 3 * width), dtype=numpy.uint8)
+  raw[:, 1:] = image.reshape(height, 3 * width)
+
+  def chunk(kind, data):
+    return (struct.pack('>I', len(data)) + kind + data +
+            struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+  with open(path, 'wb') as outfile:
+    outfile.write('\x89PNG\r\n\x1a\n')
+    outfile.write(chunk('IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+    outfile.write(chunk('IDAT', zlib.compress(raw.tobytes(), level)))
+    outfile.write(chunk('IEND', ''))
+
+def renderPolygons(path, polygons, size, **kwargs):
+  """Fill and outline a list of convex polygons, and write them to a PNG file
+
+  Keyword arguments are passed on to colorize(); by default, each polygon gets
+  a random pastel color.
+  """
+  (x, y, count) = padPolygons(polygons)
+  labels = labelImage(x, y, count, size[0], size[1])
+  colors = kwargs.pop('colors', None)
+  if colors is None:
+    colors = pastelColors(len(count))
+  writePNG(path, colorize(labels, colors, **kwargs))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Playback of event logs (see eventlog.py) with pygame
+
+The generators each replay their own logs, with their own renderers, when run
+with --replay; this is the loop they share. While it plays:
+
+  space         pause or resume
+  right / left  step forward or back (by one frame's worth of events)
+  page up/down  seek forward or back by 100 frames' worth
+  home / end    seek to the start or end of the log
+  up / down     double or halve the number of events per frame
+  q             quit
+"""
+
+import sys
+
+import pygame
+
+def view(replay, render, delay, speed=1):
+  """Play an eventlog.Replay, calling render() after each frame's events
+
+  Parameters:
+    delay -- Time to show each frame, in milliseconds
+    speed -- Number of events per frame
+  """
+  paused = False
+  render()
+  while True:
+    target = None
+    for event in pygame.event.get():
+      if event.type == pygame.QUIT:
+        sys.exit()
+      if event.type != pygame.KEYDOWN:
+        continue
+      if event.key == pygame.K_q:
+        sys.exit()
+      elif event.key == pygame.K_SPACE:
+        paused = not paused
+      elif event.key == pygame.K_UP:
+        speed *= 2
+      elif event.key == pygame.K_DOWN:
+        speed = max(1, speed // 2)
+      elif event.key in (pygame.K_RIGHT, pygame.K_LEFT, pygame.K_PAGEUP, pygame.K_PAGEDOWN):
+        step = speed * (100 if event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN) else 1)
+        forward = event.key in (pygame.K_RIGHT, pygame.K_PAGEUP)
+        target = replay.position + (step if forward else -step)
+        paused = True
+      elif event.key == pygame.K_HOME:
+        target = 0
+      elif event.key == pygame.K_END:
+        target = sys.maxint
+
+    if target is None and not paused and not replay.finished:
+      target = replay.position + speed
+    if target is not None:
+      replay.seek(target)
+      render()
+      pygame.display.set_caption('Event {}{} ({} per frame){}'.format(
+        replay.position, ' (end)' if replay.finished else '', speed, ' - paused' if paused else ''))
+    pygame.time.wait(delay)
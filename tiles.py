@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tiled generation, for maps too big to hold in memory at once
+
+The map is a width-by-height grid of unit tiles; tile (i, j) covers
+[i, i+1] x [j, j+1]. It is built in two passes, each of which only ever holds a
+few tiles' worth of points and cells:
+
+1. Each tile's points are generated from the tile's own random seed, relaxed
+   (by Lloyd relaxation, within the tile) and spilled to a scratch file.
+
+2. Each tile's cells are clipped against the points of the tile and its eight
+   neighbors (the "halo"), and streamed out to a sink as soon as they are done.
+
+A point outside the halo is more than a tile away from any point in the middle
+tile, so its bisector can only cut a cell reaching more than half a tile from
+its site. Every cell is checked against that bound, so every cell is exact --
+the same as if the whole map had been clipped at once.
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+from array import array
+
+from geometry import polygonCentroid
+from grid import PointGrid
+from pipeline import Cell, clipCell
+
+def clipCells(points, count, ((xmin, xmax), (ymin, ymax))):
+  """Cells of the first `count` of `points`, clipped against all of `points`
+  and to the given bounds
+
+  Return: A list of pipeline.Cells
+  """
+  divs = max(1, int((len(points) / 2.0) ** 0.5))
+  grid = PointGrid(points, divs, ((xmin, xmax), (ymin, ymax)))
+  cells = []
+  for p in points[:count]:
+    cell = Cell(p, [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)])
+    clipCell(cell, grid.neighbors(cell))
+    cells.append(cell)
+  return cells
+
+def tilePoints(seed, (i, j), count):
+  """The random points of tile (i, j), the same every time for a given seed"""
+  rng = random.Random((seed, i, j))
+  return [(i + rng.random(), j + rng.random()) for n in range(count)]
+
+def relax(points, (i, j), passes):
+  """Lloyd relaxation of one tile's points, within the tile"""
+  bounds = ((i, i + 1), (j, j + 1))
+  for n in range(passes):
+    points = [polygonCentroid(cell.vertices) for cell in clipCells(points, len(points), bounds)]
+  return points
+
+class JsonLinesSink (object):
+  """Writes each cell as one line of JSON:
+
+    {"tile": [i, j], "site": [x, y], "vertices": [[x, y], ...]}
+  """
+
+  def __init__(self, outfile):
+    self.outfile = outfile
+
+  def write(self, tile, cells):
+    for cell in cells:
+      self.outfile.write(json.dumps({
+        'tile': tile,
+        'site': cell.core,
+        'vertices': cell.vertices,
+      }))
+      self.outfile.write('\n')
+    self.outfile.flush()
+
+def generate(width, height, pointsPerTile, sink, passes=0, seed=None):
+  """Generate a width-by-height tiled map, passing each tile's cells to
+  sink.write((i, j), cells) as they are finished
+
+  Return: The number of cells generated
+  """
+  if seed is None:
+    seed = random.getrandbits(32)
+  scratch = tempfile.mkdtemp(prefix='mapgen-tiles-')
+
+  def spillPath((i, j)):
+    return os.path.join(scratch, '{}_{}'.format(i, j))
+
+  def load(tile):
+    coords = array('d')
+    with open(spillPath(tile), 'rb') as infile:
+      coords.fromfile(infile, 2 * pointsPerTile)
+    return zip(coords[0::2], coords[1::2])
+
+  try:
+    # Pass 1: points
+    for j in range(height):
+      for i in range(width):
+        points = relax(tilePoints(seed, (i, j), pointsPerTile), (i, j), passes)
+        coords = array('d')
+        for p in points:
+          coords.extend(p)
+        with open(spillPath((i, j)), 'wb') as outfile:
+          coords.tofile(outfile)
+
+    # Pass 2: cells
+    total = 0
+    for j in range(height):
+      for i in range(width):
+        columns = range(max(0, i - 1), min(width, i + 2))
+        rows = range(max(0, j - 1), min(height, j + 2))
+        halo = [load((i, j))] + [
+          load((hi, hj)) for hj in rows for hi in columns if (hi, hj) != (i, j)
+        ]
+        points = [p for tile in halo for p in tile]
+        bounds = ((columns[0], columns[-1] + 1), (rows[0], rows[-1] + 1))
+        cells = clipCells(points, pointsPerTile, bounds)
+
+        # Sides of the halo which aren't the edge of the map
+        sides = [
+          (lambda (x, y): x - (i - 1)) if i > 0 else None,
+          (lambda (x, y): (i + 2) - x) if i + 1 < width else None,
+          (lambda (x, y): y - (j - 1)) if j > 0 else None,
+          (lambda (x, y): (j + 2) - y) if j + 1 < height else None,
+        ]
+        sides = [side for side in sides if side is not None]
+        for cell in cells:
+          (px, py) = cell.core
+          radiusSquared = max((vx - px) ** 2 + (vy - py) ** 2 for (vx, vy) in cell.vertices)
+          if sides and min(side(cell.core) for side in sides) ** 2 < 4 * radiusSquared:
+            raise ValueError(
+              "Cell of {} in tile {} reaches too far for its halo; use more points per tile".format(
+                cell.core, (i, j)))
+
+        sink.write((i, j), cells)
+        total += len(cells)
+    return total
+
+  finally:
+    shutil.rmtree(scratch)